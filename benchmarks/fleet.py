@@ -0,0 +1,140 @@
+# fleet.py
+import os
+import socket
+import threading
+
+BIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bin")
+
+# Виды TCP-целей: принимающий порт, закрытый порт (RST) и порт без ответа
+OPEN = "open"
+CLOSED = "closed"
+BLACKHOLE = "blackhole"
+
+class LoopbackFleet:
+    """Набор TCP-целей на петлевом интерфейсе
+
+    open - слушающий сокет, который принимает и сразу закрывает соединения;
+    closed - порт, на котором никто не слушает, соединение сбрасывается;
+    blackhole - слушающий сокет с заполненной очередью: ядро отбрасывает
+    новые SYN, и проверка ждет таймаута, как у недоступного хоста.
+
+    PingManager не запускает новую проверку хоста, пока не завершена
+    предыдущая, поэтому у каждой цели свой адрес из 127.0.0.0/8:
+    слушающие сокеты привязываются к интерфейсу lo и принимают соединения
+    на любой из этих адресов. Где привязка к интерфейсу недоступна, все
+    цели получают адрес 127.0.0.1.
+    """
+
+    def __init__(self, address="127.0.0.1"):
+        """Инициализация набора"""
+        self.address = address
+        self.any_loopback = False
+        self.ports = {}
+        self._sockets = []
+        self._threads = []
+        self._running = False
+
+    def start(self):
+        """Открытие целей всех видов"""
+        self._running = True
+        self.any_loopback = self._bind_probe()
+        listener = self._listen(socket.SOMAXCONN)
+        thread = threading.Thread(target=self._accept_loop, args=(listener,), name="fleet-open", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        self.ports[OPEN] = listener.getsockname()[1]
+
+        probe = self._socket()
+        self.ports[CLOSED] = probe.getsockname()[1]
+        probe.close()
+
+        blackhole = self._listen(0)
+        self.ports[BLACKHOLE] = blackhole.getsockname()[1]
+        # Соединения, занимающие очередь; их никто не принимает
+        for _ in range(4):
+            filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            filler.setblocking(False)
+            try:
+                filler.connect((self.address, self.ports[BLACKHOLE]))
+            except BlockingIOError:
+                pass
+            self._sockets.append(filler)
+        return self
+
+    def _bind_probe(self):
+        """Проверка, можно ли привязать сокет к интерфейсу lo"""
+        if not hasattr(socket, "SO_BINDTODEVICE"):
+            return False
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, b"lo")
+        except OSError:
+            print("Cannot bind to the loopback interface, all targets share one address")
+            return False
+        finally:
+            sock.close()
+        return True
+
+    def _socket(self):
+        """Сокет на свободном порту: всего интерфейса lo или одного адреса"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self.any_loopback:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, b"lo")
+            sock.bind(("0.0.0.0", 0))
+        else:
+            sock.bind((self.address, 0))
+        return sock
+
+    def _listen(self, backlog):
+        """Слушающий сокет на свободном порту"""
+        sock = self._socket()
+        sock.listen(backlog)
+        self._sockets.append(sock)
+        return sock
+
+    def _accept_loop(self, listener):
+        """Прием и немедленное закрытие соединений"""
+        listener.settimeout(0.2)
+        while self._running:
+            try:
+                conn, _ = listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            conn.close()
+
+    def targets(self, count, mix):
+        """Список (вид, адрес, порт) из count целей в пропорциях mix {вид: доля}"""
+        total = sum(mix.values())
+        kinds = []
+        for kind, share in mix.items():
+            kinds.extend([kind] * round(count * share / total))
+        kinds = (kinds + [OPEN] * count)[:count]
+        return [(kind, self.target_address(i), self.ports[kind]) for i, kind in enumerate(kinds)]
+
+    def target_address(self, index):
+        """Адрес цели с номером index"""
+        if not self.any_loopback:
+            return self.address
+        index += 1
+        return f"127.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+
+    def stop(self):
+        """Закрытие всех сокетов"""
+        self._running = False
+        for thread in self._threads:
+            thread.join()
+        for sock in self._sockets:
+            sock.close()
+        self._sockets = []
+        self._threads = []
+
+def fake_ping_env(latency_ms=1, jitter_ms=0, loss_percent=0, environ=None):
+    """Окружение, в котором PingWorker вызывает заменитель ping из benchmarks/bin"""
+    env = dict(os.environ if environ is None else environ)
+    env["PATH"] = BIN_DIR + os.pathsep + env.get("PATH", "")
+    env["QPING_FAKE_PING_LATENCY_MS"] = str(int(latency_ms))
+    env["QPING_FAKE_PING_JITTER_MS"] = str(int(jitter_ms))
+    env["QPING_FAKE_PING_LOSS"] = str(int(loss_percent))
+    return env
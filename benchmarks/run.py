@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# run.py
+"""Бенчмарки QPing на локальных заменителях целей
+
+    python benchmarks/run.py [--hosts 100 1000 10000] [--output bench.json] [--compare old.json]
+
+Каждый размер парка измеряется в отдельном процессе с временным HOME и
+offscreen-платформой Qt, поэтому настройки и история пользователя не
+затрагиваются, а RSS относится только к этому размеру. Результаты
+пишутся в JSON; с --compare выводится изменение относительно прошлого
+прогона.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from fleet import LoopbackFleet, OPEN, CLOSED, BLACKHOLE, fake_ping_env
+
+# Показатели, у которых больше - лучше; у остальных лучше меньшее значение
+HIGHER_IS_BETTER = ("icmp_probes_per_sec", "tcp_probes_per_sec")
+
+def parse_mix(text):
+    """Разбор пропорций TCP-целей вида open=0.8,closed=0.1,blackhole=0.1"""
+    mix = {}
+    for part in text.split(","):
+        kind, _, share = part.partition("=")
+        if kind not in (OPEN, CLOSED, BLACKHOLE):
+            raise argparse.ArgumentTypeError(f"Unknown target kind: {kind}")
+        mix[kind] = float(share)
+    return mix
+
+def percentile(values, q):
+    """Перцентиль q отсортированного списка"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+def rss_mb():
+    """Текущий размер резидентной памяти процесса в МБ"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def wait_until(app, condition, timeout):
+    """Обработка событий, пока не выполнится условие или не истечет timeout секунд"""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+    return condition()
+
+def bench_probes(app, count, config):
+    """Пропускная способность PingManager: ICMP через заменитель ping и TCP по петлевым целям"""
+    from PyQt6.QtCore import QEventLoop, QTimer
+    from ping_manager import PingManager
+    import icmp
+    import socket
+    # Без ICMP-сокетов PingWorker вызывает утилиту ping, то есть заменитель из benchmarks/bin
+    icmp._socket_types.update({socket.AF_INET: None, socket.AF_INET6: None})
+
+    results = {}
+    fleet = LoopbackFleet().start()
+    manager = PingManager(config["interval_ms"], config["timeout_ms"])
+    try:
+        for check_type in ("icmp", "tcp"):
+            done = [0, 0]
+            loop = QEventLoop()
+
+            def on_result(host, success, rtt_ms, started):
+                done[0] += 1
+                done[1] += success
+                if done[0] == count:
+                    loop.quit()
+
+            manager.ping_result.connect(on_result)
+            deadline = QTimer()
+            deadline.setSingleShot(True)
+            deadline.timeout.connect(loop.quit)
+            deadline.start(int(config["duration"] * 1000))
+            start = time.perf_counter()
+            if check_type == "icmp":
+                # Адреса 127.0.0.0/8 разрешаются без DNS, дальше запрос уходит заменителю ping
+                for i in range(1, count + 1):
+                    manager.ping_host(f"127.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}")
+            else:
+                for kind, address, port in fleet.targets(count, config["mix"]):
+                    manager.ping_host(address, "tcp", port)
+            loop.exec()
+            elapsed = time.perf_counter() - start
+            deadline.stop()
+            manager.ping_result.disconnect(on_result)
+            # Незапущенные проверки снимаются, а поздние результаты разбираются до следующего замера
+            manager.thread_pool.clear()
+            manager.thread_pool.waitForDone()
+            app.processEvents()
+            results[f"{check_type}_probes_per_sec"] = round(done[0] / elapsed, 1)
+            results[f"{check_type}_completed"] = done[0]
+            results[f"{check_type}_success"] = done[1]
+    finally:
+        manager.stop()
+        fleet.stop()
+    return results
+
+def seed_history(settings, hosts, per_host):
+    """Запись истории хостов за последний час в хранилище, выбранное настройками"""
+    from history_store import create_history_store
+    store = create_history_store(settings)
+    store.open()
+    now = datetime.now()
+    step = timedelta(seconds=3600 / max(1, per_host))
+    for i in range(per_host):
+        timestamp = now - step * (per_host - i)
+        for n, host in enumerate(hosts):
+            success = (n + i) % 10 != 0
+            store.append(host, timestamp, success, 1.0 + n % 50 if success else None)
+    store.flush()
+    store.close()
+
+def bench_gui(app, count, config):
+    """Затраты потока интерфейса: обработка результатов, фильтр, сохранение, загрузка и отрисовка"""
+    from PyQt6.QtCore import QSettings
+    import main
+    from history import HostHistory
+    from host_state import HostState
+
+    hosts = [f"host{i}.bench" for i in range(count)]
+    settings = QSettings("PingMonitor", "AppSettings")
+    settings.setValue("hosts", [[host, f"Category {i % 10}"] for i, host in enumerate(hosts)])
+    settings.setValue("check_types", "{}")
+    settings.setValue("notifications_enabled", False)
+    settings.sync()
+    seed_history(settings, hosts, config["history_per_host"])
+
+    results = {}
+
+    class BenchMonitor(main.PingMonitor):
+        def load_data(self):
+            start = time.perf_counter()
+            super().load_data()
+            results["load_data_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    start = time.perf_counter()
+    window = BenchMonitor()
+    results["startup_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    # Проверки окна не нужны: результаты подаются напрямую
+    window.ping_timer.stop()
+    window.resize(1200, 700)
+    window.show()
+    wait_until(app, lambda: not window.history_loading, 120)
+    results["history_ready_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    start = time.perf_counter()
+    window.load_history()
+    wait_until(app, lambda: not window.history_loading, 300)
+    results["full_history_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    app.processEvents()
+
+    calls = min(max(count, 2000), 20000)
+    state = HostState("bench", datetime.now())
+    now = datetime.now()
+    start = time.perf_counter()
+    for i in range(calls):
+        state.update_status(i % 10 != 0, now, 5.0)
+    results["update_status_us"] = round((time.perf_counter() - start) / calls * 1e6, 2)
+
+    timings = []
+    for i in range(calls):
+        host = hosts[i % count]
+        success = i % 10 != 0
+        t = time.perf_counter_ns()
+        window.handle_ping_result(host, success, 5.0 if success else -1.0)
+        timings.append(time.perf_counter_ns() - t)
+    timings.sort()
+    results["handle_result_us"] = round(sum(timings) / len(timings) / 1000, 2)
+    results["handle_result_p50_us"] = round(percentile(timings, 50) / 1000, 2)
+    results["handle_result_p99_us"] = round(percentile(timings, 99) / 1000, 2)
+    # С учетом перерисовки: результаты по всем хостам, затем обработка событий
+    start = time.perf_counter()
+    for host in hosts:
+        window.handle_ping_result(host, True, 5.0)
+    app.processEvents()
+    results["result_with_repaint_us"] = round((time.perf_counter() - start) / count * 1e6, 2)
+
+    start = time.perf_counter()
+    window.apply_filter()
+    results["apply_filter_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    start = time.perf_counter()
+    window.save_data()
+    window.settings.sync()
+    results["save_data_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    # Кадр панели графиков после новых результатов у видимых хостов
+    frames = []
+    viewport = window.graph_panel.viewport()
+    for _ in range(10):
+        for host in hosts[:50]:
+            window.handle_ping_result(host, True, 5.0)
+        start = time.perf_counter()
+        viewport.grab()
+        frames.append(time.perf_counter() - start)
+    results["frame_ms"] = round(sum(frames) / len(frames) * 1000, 2)
+
+    # Один график с 48 часами истории: полная, дорисовка хвоста и из кеша
+    history = HostHistory()
+    end = time.time()
+    for i in range(34560):
+        history.append(end - (34560 - i) * 5, i % 20 != 0, 1.0 + i % 300)
+    graph = main.PingGraphWidget(window.time_scale, "bench")
+    graph.resize(1200, 60)
+    graph.update_history(history, 0, 0, window.app_start_time)
+    paint = {"full": [], "incremental": [], "cached": []}
+    for i in range(20):
+        graph.invalidate_cache()
+        start = time.perf_counter()
+        graph.grab()
+        paint["full"].append(time.perf_counter() - start)
+        history.append(time.time(), True, 5.0)
+        start = time.perf_counter()
+        graph.grab()
+        paint["incremental"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        graph.grab()
+        paint["cached"].append(time.perf_counter() - start)
+    for kind, values in paint.items():
+        results[f"paint_{kind}_ms"] = round(sum(values) / len(values) * 1000, 3)
+
+    results["rss_mb"] = round(rss_mb(), 1)
+    window.quit_application()
+    return results
+
+def run_child(count, config):
+    """Замер одного размера парка; результат - JSON в последней строке вывода"""
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication(sys.argv[:1])
+    results = {"hosts": count}
+    if "probes" in config["only"]:
+        results.update(bench_probes(app, count, config))
+    if "gui" in config["only"]:
+        results.update(bench_gui(app, count, config))
+    results["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    sys.stdout.flush()
+    print(json.dumps(results))
+    sys.stdout.flush()
+    # Без разрушения объектов Qt при выходе: фоновые задачи могут еще отправлять сигналы
+    os._exit(0)
+
+def run_size(count, config):
+    """Запуск замера в отдельном процессе с временным HOME"""
+    home = tempfile.mkdtemp(prefix="qping-bench-")
+    env = fake_ping_env(config["latency_ms"], config["jitter_ms"], config["loss"])
+    env.update(HOME=home, XDG_CONFIG_HOME=os.path.join(home, ".config"), QT_QPA_PLATFORM="offscreen")
+    try:
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", str(count), "--config", json.dumps(config)],
+            env=env, stdout=subprocess.PIPE, text=True)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        print(f"Benchmark for {count} hosts failed with code {result.returncode}")
+        return None
+    return json.loads(lines[-1])
+
+def git_revision():
+    """Текущий коммит репозитория или None"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baseline_path):
+    """Вывод изменения показателей относительно прошлого прогона"""
+    try:
+        with open(baseline_path) as f:
+            baseline = {r["hosts"]: r for r in json.load(f)["results"]}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Cannot read baseline {baseline_path}: {e}")
+        return
+    for result in results:
+        old = baseline.get(result["hosts"])
+        if old is None:
+            continue
+        print(f"\n{result['hosts']} hosts vs {baseline_path}:")
+        for name, value in result.items():
+            if name == "hosts" or not old.get(name) or not isinstance(value, (int, float)):
+                continue
+            change = (value - old[name]) / old[name] * 100
+            worse = change < 0 if name in HIGHER_IS_BETTER else change > 0
+            mark = " !" if worse and abs(change) > 10 else ""
+            print(f"  {name:24} {old[name]:>12} -> {value:<12} {change:+7.1f}%{mark}")
+
+def main():
+    parser = argparse.ArgumentParser(description="QPing benchmarks on local stand-in targets")
+    parser.add_argument("--hosts", type=int, nargs="+", default=[100, 1000, 10000], help="fleet sizes")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file for the results")
+    parser.add_argument("--compare", help="previous results file to compare with")
+    parser.add_argument("--only", nargs="+", choices=("probes", "gui"), default=["probes", "gui"])
+    parser.add_argument("--duration", type=float, default=30, help="probe round time limit, seconds")
+    parser.add_argument("--interval-ms", type=int, default=500)
+    parser.add_argument("--timeout-ms", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=int, default=1, help="fake ping reply time")
+    parser.add_argument("--jitter-ms", type=int, default=0, help="fake ping random extra reply time")
+    parser.add_argument("--loss", type=int, default=0, help="fake ping loss, percent")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("open=0.8,closed=0.1,blackhole=0.1"),
+                        help="TCP target kinds and shares")
+    parser.add_argument("--history-per-host", type=int, default=60, help="seeded records per host")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, json.loads(args.config))
+        return
+
+    config = {name: getattr(args, name) for name in (
+        "only", "duration", "interval_ms", "timeout_ms", "latency_ms", "jitter_ms", "loss", "mix",
+        "history_per_host")}
+    results = []
+    for count in args.hosts:
+        print(f"Benchmarking {count} hosts...")
+        result = run_size(count, config)
+        if result:
+            results.append(result)
+            for name, value in result.items():
+                print(f"  {name:24} {value}")
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": config,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
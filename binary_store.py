@@ -0,0 +1,446 @@
+# binary_store.py
+import os
+import sys
+import mmap
+import time
+import struct
+import threading
+from array import array
+from datetime import datetime
+from urllib.parse import quote, unquote
+from history import ROLLUP_TIERS, RollupSeries, expand_records
+from history_store import HistoryStore, HISTORY_DIR
+
+NAN = float("nan")
+
+# Заголовок файла: сигнатура, версия формата, число float64 в записи
+HEADER = struct.Struct("<8sII")
+MAGIC = b"QPINGHS\0"
+VERSION = 1
+SAMPLE_FIELDS = 2
+# Запись агрегата: длина интервала и поля RollupSeries.bucket()
+ROLLUP_FIELDS = 8
+SAMPLE_SUFFIX = ".qph"
+ROLLUP_SUFFIX = ".qpr"
+
+# Значение второго поля записи: время ответа в мс, FAILURE для провала, NaN - успех без времени ответа
+FAILURE = -1.0
+
+def encode_result(success, latency):
+    """Второе поле записи результата"""
+    if not success:
+        return FAILURE
+    return NAN if latency is None else latency
+
+def decode_result(value):
+    """(success, latency) из второго поля записи"""
+    if value == FAILURE:
+        return False, None
+    return True, (None if value != value else value)
+
+class Segment:
+    """Файл хоста, отображенный в память и доступный как массив float64
+
+    data - представление memoryview поверх отображения, без копирования и
+    разбора данных. Хвост файла, не кратный длине записи (оборванная
+    запись), игнорируется.
+    """
+
+    def __init__(self, path, fields):
+        """Отображение файла; пустой или чужой файл дает пустой сегмент"""
+        self.fields = fields
+        self._mmap = None
+        self.data = memoryview(b"").cast("d")
+        with open(path, "rb") as f:
+            count = (os.fstat(f.fileno()).st_size - HEADER.size) // (8 * fields)
+            if count <= 0:
+                return
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if HEADER.unpack_from(mm) != (MAGIC, VERSION, fields):
+            mm.close()
+            print(f"Unknown history file format: {path}")
+            return
+        self._mmap = mm
+        self.data = memoryview(mm)[HEADER.size:HEADER.size + count * 8 * fields].cast("d")
+
+    def __len__(self):
+        return len(self.data) // self.fields
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def column(self, field, start=0, end=None):
+        """Значения поля field у записей [start, end) списком"""
+        end = len(self) if end is None else end
+        view = self.data[start * self.fields + field:end * self.fields:self.fields]
+        try:
+            return view.tolist()
+        finally:
+            view.release()
+
+    def bisect(self, timestamp):
+        """Индекс первой записи со временем (первым полем) больше timestamp"""
+        times = self.data[::self.fields]
+        try:
+            lo, hi = 0, len(times)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if times[mid] <= timestamp:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+        finally:
+            times.release()
+
+    def records(self, start=0, end=None):
+        """Записи результатов [start, end): [(timestamp, success, latency)]"""
+        return [(t, *decode_result(value))
+                for t, value in zip(self.column(0, start, end), self.column(1, start, end))]
+
+    def tobytes(self, start=0):
+        """Копия записей начиная с start"""
+        view = self.data[start * self.fields:]
+        try:
+            return view.tobytes()
+        finally:
+            view.release()
+
+    def close(self):
+        """Освобождение представления и отображения"""
+        self.data.release()
+        if self._mmap:
+            self._mmap.close()
+            self._mmap = None
+
+class SegmentRecords:
+    """Записи хоста со временем в (after, until]: файл читается только при обходе
+
+    Диапазон задан временем, а не номерами записей: к моменту обхода
+    файл может быть переписан сверткой (в том числе другим процессом), и
+    номера записей сдвинутся, а время - нет. Записи читаются
+    BinaryHistoryStore.query(), то есть декодируются только записи
+    диапазона. count - число записей на момент загрузки.
+    """
+
+    def __init__(self, store, host, after, until, count):
+        self.store = store
+        self.host = host
+        self.after = after
+        self.until = until
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """Записи (timestamp, success, latency)"""
+        return iter(self.store.query(self.host, self.after, self.until))
+
+class BinaryHistoryStore(HistoryStore):
+    """Хранилище истории в двоичных файлах фиксированного формата
+
+    Каждому хосту соответствует файл <host>.qph: заголовок и записи из
+    двух float64 (время, результат), дописываемые в конец. При чтении
+    файл отображается в память и читается как массив без разбора строк и
+    преобразования дат, а начало срока хранения находится двоичным
+    поиском. Агрегаты старых записей лежат рядом в <host>.qpr записями из
+    восьми float64 (длина интервала и поля агрегата). Записи старше срока
+    хранения сворачиваются в агрегаты фоновым потоком записи, когда их
+    накапливается заметная доля.
+
+    При первом открытии сюда переносится история из журнала, а через него -
+    из старого файла ~/.ping_monitor_history.json.
+    """
+
+    SEGMENT_DIR = "segments"
+    COMPACT_INTERVAL = 600
+
+    def __init__(self, *args, **kwargs):
+        """Инициализация хранилища"""
+        super().__init__(*args, **kwargs)
+        self.segment_dir = os.path.join(self.directory, self.SEGMENT_DIR)
+        # Файл хоста переписывается, когда устаревшие записи занимают больше этой доли срока хранения
+        self.compact_slack = self.retention.total_seconds() / 4
+
+    def path(self, host, suffix=SAMPLE_SUFFIX):
+        """Путь к файлу хоста"""
+        return os.path.join(self.segment_dir, quote(host, safe="") + suffix)
+
+    def hosts(self):
+        """Хосты, для которых есть файлы истории"""
+        try:
+            names = os.listdir(self.segment_dir)
+        except FileNotFoundError:
+            return []
+        return [unquote(name[:-len(SAMPLE_SUFFIX)]) for name in names if name.endswith(SAMPLE_SUFFIX)]
+
+    def open(self):
+        """Захват хранилища, перенос истории журнала и запуск потока записи"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._acquire_lock()
+        if not os.path.isdir(self.segment_dir):
+            self._migrate()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _migrate(self):
+        """Перенос истории из журнала и снимка в файлы хостов"""
+        history, rollups = HistoryStore.load(self)
+        os.makedirs(self.segment_dir, exist_ok=True)
+        for host, records in history.items():
+            self._write_samples(host, [v for t, s, latency in expand_records(records)
+                                       for v in (t, encode_result(s, latency))])
+        for host, tiers in rollups.items():
+            self._write_file(self.path(host, ROLLUP_SUFFIX), ROLLUP_FIELDS,
+                             [v for resolution, buckets in tiers.items() for bucket in buckets
+                              for v in (resolution, *bucket)], "wb")
+        if history or rollups:
+            print(f"Migrated history of {len(history)} hosts to {self.segment_dir}")
+
+    @staticmethod
+    def _write_file(path, fields, values, mode):
+        """Запись значений float64 в файл с заголовком"""
+        with open(path, mode) as f:
+            if f.tell() == 0:
+                f.write(HEADER.pack(MAGIC, VERSION, fields))
+            f.write(array("d", values).tobytes())
+
+    def _write_samples(self, host, values):
+        """Дозапись результатов хоста"""
+        self._write_file(self.path(host), SAMPLE_FIELDS, values, "ab")
+
+    def append(self, host, timestamp, success, latency=None):
+        """Добавление результата проверки в буфер"""
+        self._buffer(("record", host, timestamp.timestamp(), encode_result(success, latency)))
+
+    def drop_host(self, host):
+        """Удаление истории хоста"""
+        self._buffer(("drop", host))
+
+    def rename_host(self, old_host, new_host):
+        """Перенос истории хоста под новое имя"""
+        self._buffer(("rename", old_host, new_host))
+
+    def _write_loop(self):
+        """Фоновая запись пачек результатов по файлам хостов"""
+        self._compact()
+        last_compact = time.monotonic()
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            try:
+                self._write_batch(batch)
+            except OSError as e:
+                print(f"Error writing history to {self.segment_dir}: {e}")
+                continue
+            if time.monotonic() - last_compact > self.COMPACT_INTERVAL:
+                self._compact()
+                last_compact = time.monotonic()
+
+    def _write_batch(self, batch):
+        """Запись пачки: результаты группируются по хостам, по одной дозаписи на файл"""
+        pending = {}
+        for item in batch:
+            if item[0] == "record":
+                pending.setdefault(item[1], []).extend(item[2:])
+                continue
+            for host, values in pending.items():
+                self._write_samples(host, values)
+            pending = {}
+            for suffix in (SAMPLE_SUFFIX, ROLLUP_SUFFIX):
+                if item[0] == "drop":
+                    self._remove(self.path(item[1], suffix))
+                elif os.path.exists(self.path(item[1], suffix)):
+                    os.replace(self.path(item[1], suffix), self.path(item[2], suffix))
+                else:
+                    self._remove(self.path(item[2], suffix))
+        for host, values in pending.items():
+            self._write_samples(host, values)
+
+    @staticmethod
+    def _remove(path):
+        """Удаление файла, если он есть"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _compact(self):
+        """Свертка устаревших записей в агрегаты у хостов, где их накопилось много"""
+        cutoff = (datetime.now() - self.retention).timestamp()
+        for host in self.hosts():
+            try:
+                with Segment(self.path(host), SAMPLE_FIELDS) as segment:
+                    if not len(segment) or segment.data[0] > cutoff - self.compact_slack:
+                        continue
+                    split = segment.bisect(cutoff)
+                    expired = segment.records(0, split)
+                    kept = segment.tobytes(split)
+                rollups = self._load_rollups(host)
+                for record in expired:
+                    for rollup in rollups:
+                        rollup.add(*record)
+                with self._files_locked(exclusive=True):
+                    self._replace(self.path(host, ROLLUP_SUFFIX), ROLLUP_FIELDS,
+                                  [v for rollup in rollups for bucket in rollup for v in (rollup.resolution, *bucket)])
+                    self._replace(self.path(host), SAMPLE_FIELDS, kept)
+            except OSError as e:
+                print(f"Error compacting history of {host} in {self.segment_dir}: {e}")
+
+    @staticmethod
+    def _replace(path, fields, values):
+        """Атомарная замена файла"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, fields))
+            f.write(values if isinstance(values, bytes) else array("d", values).tobytes())
+        os.replace(tmp_path, path)
+
+    def _load_rollups(self, host):
+        """Агрегаты хоста из файла .qpr в виде [RollupSeries]"""
+        rollups = [RollupSeries(resolution, retention) for resolution, retention in ROLLUP_TIERS]
+        path = self.path(host, ROLLUP_SUFFIX)
+        if not os.path.exists(path):
+            return rollups
+        with Segment(path, ROLLUP_FIELDS) as segment:
+            values = segment.data.tolist()
+        by_resolution = {rollup.resolution: rollup for rollup in rollups}
+        for i in range(0, len(values), ROLLUP_FIELDS):
+            resolution, start, count, failures, latency_count, latency_sum, latency_min, latency_max = \
+                values[i:i + ROLLUP_FIELDS]
+            rollup = by_resolution.get(int(resolution))
+            if rollup is not None:
+                rollup.add_bucket(start, int(count), int(failures), int(latency_count), latency_sum,
+                                  latency_min, latency_max)
+        return rollups
+
+    def load(self, since=None):
+        """Загрузка истории за срок хранения и агрегатов (как HistoryStore.load)
+
+        Записи хостов возвращаются объектами SegmentRecords, которые читают
+        файл при обходе. Агрегаты и еще не свернутые записи читаются под
+        блокировкой, общей с процессом-писателем, чтобы свертка не учла
+        одни и те же записи дважды или не потеряла их.
+        """
+        if not os.path.isdir(self.segment_dir):
+            # Файлов еще нет - история будет перенесена из журнала в open()
+            return HistoryStore.load(self, since)
+        with self._files_locked(exclusive=False):
+            return self._load(since)
+
+    def _load(self, since):
+        """Чтение файлов всех хостов"""
+        cutoff = (datetime.now() - self.retention).timestamp()
+        after = cutoff if since is None else max(cutoff, since)
+        history = {}
+        rollups = {}
+        for host in self.hosts():
+            series = [] if since is not None else self._load_rollups(host)
+            try:
+                with Segment(self.path(host), SAMPLE_FIELDS) as segment:
+                    split = segment.bisect(after)
+                    # Еще не свернутые устаревшие записи
+                    expired = segment.records(0, split) if series else []
+                    count = len(segment) - split
+                    until = segment.data[-SAMPLE_FIELDS] if count else None
+                for record in expired:
+                    for rollup in series:
+                        rollup.add(*record)
+            except OSError as e:
+                print(f"Error reading history of {host} from {self.segment_dir}: {e}")
+                continue
+            if count:
+                history[host] = SegmentRecords(self, host, after, until, count)
+            if any(len(rollup) for rollup in series):
+                rollups[host] = {rollup.resolution: list(rollup) for rollup in series}
+        return history, rollups
+
+    def query(self, host, start_ts, end_ts):
+        """Результаты хоста за (start_ts, end_ts]: [(epoch, success, latency)] по времени"""
+        try:
+            segment = Segment(self.path(host), SAMPLE_FIELDS)
+        except FileNotFoundError:
+            return []
+        with segment:
+            return segment.records(segment.bisect(start_ts), segment.bisect(end_ts))
+
+    def follow(self):
+        """Чтение результатов, которые дописывает в файлы другой процесс"""
+        return SegmentFollower(self.segment_dir)
+
+class SegmentFollower:
+    """Слежение за файлами хостов, в которые пишет другой процесс
+
+    Для каждого файла запоминаются inode, прочитанная длина и время
+    последней записи (уже лежавшей в файле при создании слежения или
+    прочитанной); дописанные записи читаются с этого места. Если файл
+    переписан при свертке, из него берутся записи новее последней.
+    """
+
+    def __init__(self, directory):
+        """Запоминание текущего конца всех файлов"""
+        self.directory = directory
+        self._files = {}
+        self._scan(initial=True)
+
+    def _scan(self, initial=False):
+        """Проход по файлам каталога; возвращает новые записи"""
+        records = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return records
+        for entry in entries:
+            if not entry.name.endswith(SAMPLE_SUFFIX):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            inode, offset, last_ts = self._files.get(entry.name, (None, HEADER.size, None))
+            if inode == st.st_ino and st.st_size <= offset:
+                continue
+            host = unquote(entry.name[:-len(SAMPLE_SUFFIX)])
+            try:
+                with Segment(entry.path, SAMPLE_FIELDS) as segment:
+                    if initial:
+                        last = segment.data[-SAMPLE_FIELDS] if len(segment) else None
+                        self._files[entry.name] = (st.st_ino, HEADER.size + len(segment) * 8 * SAMPLE_FIELDS, last)
+                        continue
+                    if inode == st.st_ino:
+                        start = (offset - HEADER.size) // (8 * SAMPLE_FIELDS)
+                    else:
+                        start = segment.bisect(last_ts) if last_ts is not None else 0
+                    new = segment.records(start)
+                    end = HEADER.size + len(segment) * 8 * SAMPLE_FIELDS
+            except OSError:
+                continue
+            records.extend((host, *record) for record in new)
+            self._files[entry.name] = (st.st_ino, end, new[-1][0] if new else last_ts)
+        return records
+
+    def poll(self):
+        """Новые результаты [(host, epoch, success, latency)] с прошлого вызова"""
+        return self._scan()
+
+    def close(self):
+        """Слежение не держит открытых файлов"""
+        self._files = {}
+
+def convert_legacy(directory=HISTORY_DIR):
+    """Однократный перенос истории ~/.ping_monitor_history.json (и журнала) в двоичные файлы"""
+    store = BinaryHistoryStore(directory)
+    if os.path.isdir(store.segment_dir):
+        print(f"{store.segment_dir} already exists, nothing to convert")
+        return False
+    store.open()
+    store.close()
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if convert_legacy(*sys.argv[1:]) else 1)
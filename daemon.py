@@ -0,0 +1,172 @@
+# daemon.py
+import json
+import signal
+from datetime import datetime
+from PyQt6.QtCore import QCoreApplication, QObject, QSettings, QTimer, Qt
+from ping_manager import PingManager, NO_RTT, MIN_PROBE_THREADS, MAX_PROBE_THREADS
+from history_store import create_history_store
+from persistence import PersistenceScheduler
+from scheduler import ProbeScheduler, read_host_interval
+from metrics import start_exporter
+
+def read_inventory(settings):
+    """Чтение списка хостов из настроек приложения
+
+    Возвращает (host -> категория, типы проверок, интервалы хостов,
+    интервалы категорий) в том же формате, что сохраняет PingMonitor.
+    """
+    hosts = {}
+    for host_data in settings.value("hosts", [], type=list):
+        if isinstance(host_data, (list, tuple)) and len(host_data) == 2:
+            host, category = host_data
+        else:
+            host, category = str(host_data), "Default"
+        if isinstance(host, str) and host:
+            hosts[host] = category
+    result = [hosts]
+    for name in ("check_types", "host_intervals", "category_intervals"):
+        try:
+            result.append(json.loads(settings.value(name, "{}") or "{}"))
+        except (TypeError, json.JSONDecodeError) as e:
+            print(f"Invalid {name} in settings: {e}")
+            result.append({})
+    return tuple(result)
+
+class MonitorDaemon(QObject):
+    """Фоновый мониторинг без графического интерфейса
+
+    Проверяет хосты из тех же настроек, что и приложение, по тому же
+    расписанию и пишет результаты в общее хранилище истории. Приложение,
+    запущенное рядом, подключается к хранилищу только для просмотра.
+    Список хостов периодически перечитывается, поэтому изменения,
+    сделанные в приложении, подхватываются без перезапуска.
+    """
+
+    RELOAD_INTERVAL_MS = 10000
+
+    def __init__(self, settings=None, history_store=None, parent=None):
+        """Инициализация монитора"""
+        super().__init__(parent)
+        self.settings = settings or QSettings("PingMonitor", "AppSettings")
+        self.history_store = history_store or create_history_store(self.settings)
+        self.scheduler = ProbeScheduler()
+        self.hosts = {}
+        self.check_types = {}
+        self.host_intervals = {}
+        self.category_intervals = {}
+        self.interval_ms = read_host_interval(self.settings)
+        self.sweep_mode = self.settings.value("sweep_mode", False, type=bool)
+
+        self.ping_manager = PingManager(
+            self.interval_ms, self.settings.value("timeout_ms", 1000, type=int),
+            self.settings.value("probe_threads_min", MIN_PROBE_THREADS, type=int),
+            self.settings.value("probe_threads_max", MAX_PROBE_THREADS, type=int))
+        self.ping_manager.ping_result.connect(self.handle_ping_result)
+        self.ping_manager.saturation_changed.connect(self.report_saturation)
+        self.metrics = None
+        self.persistence = PersistenceScheduler(
+            lambda: None, lambda: None, self.history_store,
+            self.settings.value("flush_interval_ms", 5000, type=int), parent=self)
+
+        self.ping_timer = QTimer(self)
+        self.ping_timer.setSingleShot(True)
+        self.ping_timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.ping_timer.timeout.connect(self.ping_next_host)
+
+        self.reload_timer = QTimer(self)
+        self.reload_timer.timeout.connect(self.reload_inventory)
+
+    def start(self):
+        """Захват хранилища истории и запуск проверок"""
+        self.history_store.open()
+        self.metrics = start_exporter(self.settings, self.ping_manager)
+        self.reload_inventory()
+        self.reload_timer.start(self.RELOAD_INTERVAL_MS)
+        print(f"Monitoring {len(self.hosts)} hosts, history in {self.history_store.directory}")
+
+    def stop(self):
+        """Остановка проверок и сохранение истории"""
+        self.reload_timer.stop()
+        self.ping_timer.stop()
+        self.ping_manager.stop()
+        if self.metrics:
+            self.metrics.stop()
+        self.persistence.flush()
+        self.history_store.close()
+
+    def reload_inventory(self):
+        """Перечитывание списка хостов и интервалов из настроек"""
+        self.settings.sync()
+        self.hosts, self.check_types, self.host_intervals, self.category_intervals = read_inventory(self.settings)
+        self.interval_ms = read_host_interval(self.settings)
+        self.sweep_mode = self.settings.value("sweep_mode", False, type=bool)
+        self.scheduler.sync({host: self.host_interval(host) / 1000 for host in self.hosts})
+        self.ping_manager.sync(self.hosts)
+        if self.metrics:
+            self.metrics.sync(self.hosts)
+        self.schedule_next_check()
+
+    def host_interval(self, host):
+        """Интервал проверки хоста в мс: собственный, категории или общий"""
+        interval = self.host_intervals.get(host) or self.category_intervals.get(self.hosts.get(host))
+        return interval or self.interval_ms
+
+    def schedule_next_check(self):
+        """Взвод таймера на ближайший срок проверки"""
+        delay = self.scheduler.next_due()
+        if delay is None:
+            self.ping_timer.stop()
+        else:
+            self.ping_timer.start(int(delay * 1000))
+
+    def ping_next_host(self):
+        """Проверка всех хостов, срок проверки которых наступил"""
+        sweep_hosts = []
+        for host in self.scheduler.pop_due():
+            check_info = self.check_types.get(host, {'type': 'icmp', 'port': None})
+            if self.sweep_mode and check_info['type'] == 'icmp':
+                sweep_hosts.append(host)
+            else:
+                self.ping_manager.ping_host(host, check_type=check_info['type'], port=check_info['port'])
+        if sweep_hosts:
+            self.ping_manager.sweep_hosts(sweep_hosts)
+        self.schedule_next_check()
+
+    def handle_ping_result(self, host, success, rtt_ms=NO_RTT, started=None):
+        """Запись результата проверки в историю с временем начала проверки"""
+        if host not in self.hosts:
+            return
+        latency = rtt_ms if success and rtt_ms >= 0 else None
+        timestamp = datetime.fromtimestamp(started) if started else datetime.now()
+        self.history_store.append(host, timestamp, success, latency)
+        if self.metrics:
+            self.metrics.record(host, self.hosts[host], success, rtt_ms)
+        self.persistence.mark_dirty(PersistenceScheduler.HISTORY)
+
+    def report_saturation(self, saturated):
+        """Сообщение о насыщении движка проверок"""
+        stats = self.ping_manager.stats()
+        if saturated:
+            print(f"Probe engine saturated: {stats['probe_queue_depth']} ICMP checks queued, "
+                  f"{stats['probe_threads_max']} threads, {stats['tcp_probes_in_flight']} TCP checks in flight")
+        else:
+            print("Probe engine is keeping up again")
+
+def run(argv):
+    """Запуск фонового монитора до SIGINT/SIGTERM; возвращает код завершения"""
+    app = QCoreApplication(argv)
+    daemon = MonitorDaemon()
+    try:
+        daemon.start()
+    except BlockingIOError as e:
+        print(f"Cannot start headless monitor: {e}")
+        return 1
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: app.quit())
+    # Периодически возвращаем управление интерпретатору, чтобы он обработал сигналы
+    signal_timer = QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(500)
+    code = app.exec()
+    daemon.stop()
+    return code
@@ -0,0 +1,594 @@
+# history.py
+import math
+import itertools
+from array import array
+
+NAN = float('nan')
+
+# Номера объектов истории: в отличие от id() не повторяются после удаления объекта
+_serials = itertools.count(1)
+
+# Уровни агрегации: (длина интервала, срок хранения) в секундах
+ROLLUP_TIERS = ((60, 7 * 24 * 3600), (3600, 365 * 24 * 3600))
+
+def _fmin(a, b):
+    """Минимум с пропуском NaN"""
+    return b if a != a or b < a else a
+
+def _fmax(a, b):
+    """Максимум с пропуском NaN"""
+    return b if a != a or b > a else a
+
+def is_run_gap(start, end, count, timestamp):
+    """Разрыв в проверках после серии (start, end, count): например, приложение было закрыто
+
+    После разрыва начинается новая серия, даже если статус не изменился.
+    """
+    if count < 2:
+        return False
+    spacing = (end - start) / (count - 1)
+    return timestamp - end > 3 * spacing + 1
+
+def expand_records(records):
+    """Записи (timestamp, success, latency) из записей хранилища любого вида
+
+    Серия (начало, конец, success, число) разворачивается в равномерно
+    распределенные проверки, отдельные времена ответа (timestamp, latency)
+    пропускаются. Нужна для переноса истории в хранилища, которые держат
+    каждую проверку отдельно.
+    """
+    for record in records:
+        if len(record) == 3:
+            yield record
+        elif len(record) == 4:
+            start, end, success, count = record
+            step = (end - start) / (count - 1) if count > 1 else 0.0
+            for k in range(count):
+                yield start + k * step, success, None
+
+class HostHistory:
+    """Кольцевой буфер истории проверок хоста
+
+    Данные хранятся колонками в массивах: время проверки (epoch, float64),
+    статус (uint8) и время ответа в мс (float32, NaN для неудачных
+    проверок), то есть 13 байт на запись вместо кортежа объектов.
+
+    Дополнительно хранятся накопленные суммы числа провалов (uint32, по
+    модулю 2**32) и времени ответа (float64): по ним агрегаты любого
+    диапазона записей считаются за O(1), что позволяет рисовать график
+    за O(ширины), а не O(числа записей). Записи старше срока хранения
+    вытесняются с головы буфера, поэтому добавление стоит O(1). Емкость
+    удваивается по мере надобности до max_capacity, после чего
+    перезаписываются самые старые записи.
+
+    Каждая запись также попадает в уровни агрегации rollups (по минутам
+    и по часам), которые хранятся дольше сырых записей; tier() выбирает
+    уровень под масштаб графика.
+
+    Статус хоста хранится индексом серий одинакового статуса (начало,
+    конец, статус, число проверок): статус почти не меняется, поэтому
+    серий на порядки меньше, чем проверок. По нему текущее состояние хоста
+    узнается за O(1), а график рисуется по числу переходов. Серии
+    вытесняются по сроку хранения независимо от записей буфера.
+
+    История из хранилища загружается сериями (append_run()) и, если
+    хранилище ведет их, отдельными временами ответа (add_latency()),
+    которые попадают только в буфер записей; каждая проверка по отдельности
+    добавляется лишь в текущем сеансе.
+    """
+
+    resolution = 0
+
+    def __init__(self, retention_seconds=48 * 3600, capacity=1024, max_capacity=1 << 20,
+                 rollup_tiers=ROLLUP_TIERS):
+        """Инициализация буфера"""
+        self.retention_seconds = retention_seconds
+        self.rollups = [RollupSeries(resolution, retention) for resolution, retention in rollup_tiers]
+        self.serial = next(_serials)
+        self.revision = 0
+        self.max_capacity = max_capacity
+        self._capacity = capacity
+        self._times = array('d', bytes(8 * capacity))
+        self._status = array('B', bytes(capacity))
+        self._latency = array('f', bytes(4 * capacity))
+        self._cum_failures = array('I', bytes(4 * capacity))
+        self._cum_latency = array('d', bytes(8 * capacity))
+        self._start = 0
+        self._len = 0
+        self._run_start = array('d')
+        self._run_end = array('d')
+        self._run_status = array('B')
+        self._run_count = array('I')
+        self._run_head = 0
+
+    def __len__(self):
+        """Количество записей в буфере"""
+        return self._len
+
+    def __bool__(self):
+        """Есть ли в истории записи или серии"""
+        return bool(self._len or self.run_count())
+
+    def __iter__(self):
+        """Итерация по записям (timestamp, success, latency) от старых к новым"""
+        for i in range(self._len):
+            j = (self._start + i) % self._capacity
+            yield self._times[j], bool(self._status[j]), self._latency[j]
+
+    def __getitem__(self, index):
+        """Запись (timestamp, success, latency) по логическому индексу"""
+        j = self._physical(index)
+        return self._times[j], bool(self._status[j]), self._latency[j]
+
+    def _physical(self, index):
+        """Преобразование логического индекса в индекс массива"""
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("history index out of range")
+        return (self._start + index) % self._capacity
+
+    def timestamp(self, index):
+        """Время записи по логическому индексу"""
+        return self._times[self._physical(index)]
+
+    def success(self, index):
+        """Статус записи по логическому индексу"""
+        return bool(self._status[self._physical(index)])
+
+    def latency(self, index):
+        """Время ответа в мс по логическому индексу (NaN для неудачной проверки)"""
+        return self._latency[self._physical(index)]
+
+    def first_timestamp(self):
+        """Время самой старой записи или начала серии (None для пустой истории)"""
+        times = [self._times[self._start]] if self._len else []
+        if self.run_count():
+            times.append(self._run_start[self._run_head])
+        return min(times) if times else None
+
+    def last_timestamp(self):
+        """Время последней записи или конца серии (None для пустой истории)"""
+        times = [self._times[(self._start + self._len - 1) % self._capacity]] if self._len else []
+        if self.run_count():
+            times.append(self._run_end[-1])
+        return max(times) if times else None
+
+    def last_failed(self):
+        """Провалена ли последняя проверка"""
+        return self.run_count() > 0 and not self._run_status[-1]
+
+    def current_run(self):
+        """Текущая серия (начало, конец, success, число записей) или None"""
+        if not self.run_count():
+            return None
+        return self._run_start[-1], self._run_end[-1], bool(self._run_status[-1]), self._run_count[-1]
+
+    def failure_streak(self):
+        """Число проваленных проверок подряд в конце истории"""
+        streak = 0
+        # Серии одного статуса соседствуют только после разрыва в проверках
+        for j in range(len(self._run_status) - 1, self._run_head - 1, -1):
+            if self._run_status[j]:
+                break
+            streak += self._run_count[j]
+        return streak
+
+    def run_count(self):
+        """Количество серий одинакового статуса"""
+        return len(self._run_status) - self._run_head
+
+    def runs(self, start_ts, end_ts):
+        """Серии (начало, конец, success, число записей), пересекающие [start_ts, end_ts]"""
+        lo, hi = self._run_head, len(self._run_end)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._run_end[mid] < start_ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        for j in range(lo, len(self._run_end)):
+            if self._run_start[j] > end_ts:
+                break
+            yield self._run_start[j], self._run_end[j], bool(self._run_status[j]), self._run_count[j]
+
+    def append(self, timestamp, success, latency=None):
+        """Добавление записи с вытеснением устаревших"""
+        self._push(timestamp, success, latency)
+        status = 1 if success else 0
+        if (self.run_count() and self._run_status[-1] == status
+                and not is_run_gap(self._run_start[-1], self._run_end[-1], self._run_count[-1], timestamp)):
+            self._run_end[-1] = timestamp
+            self._run_count[-1] += 1
+        else:
+            self._add_run(timestamp, timestamp, status, 1)
+        for rollup in self.rollups:
+            rollup.add(timestamp, success, latency)
+
+    def _push(self, timestamp, success, latency):
+        """Запись в конец буфера с вытеснением устаревших"""
+        self.evict_before(timestamp - self.retention_seconds)
+        if self._len == self._capacity:
+            if self._capacity < self.max_capacity:
+                self._grow()
+            else:
+                self._drop_first()
+        if self._len:
+            prev = (self._start + self._len - 1) % self._capacity
+            cum_failures, cum_latency = self._cum_failures[prev], self._cum_latency[prev]
+        else:
+            cum_failures, cum_latency = 0, 0.0
+        j = (self._start + self._len) % self._capacity
+        self._times[j] = timestamp
+        self._status[j] = 1 if success else 0
+        self._latency[j] = NAN if latency is None else latency
+        self._cum_failures[j] = (cum_failures + (0 if success else 1)) & 0xFFFFFFFF
+        self._cum_latency[j] = cum_latency + (self._latency[j] if success and latency is not None else 0.0)
+        self._len += 1
+        self.revision += 1
+
+    def _add_run(self, start, end, status, count):
+        """Новая серия в конце индекса"""
+        self._run_start.append(start)
+        self._run_end.append(end)
+        self._run_status.append(status)
+        self._run_count.append(count)
+
+    def append_run(self, start, end, success, count):
+        """Добавление серии из count проверок одного статуса с start по end
+
+        Серия с тем же началом и статусом, что и последняя, - ее продолжение
+        (так хранилище сохраняет еще не закончившуюся серию): учитываются
+        только новые проверки.
+        """
+        status = 1 if success else 0
+        self.evict_before(end - self.retention_seconds)
+        if self.run_count() and self._run_start[-1] == start and self._run_status[-1] == status:
+            added = count - self._run_count[-1]
+            if added <= 0:
+                return
+            # Новые проверки равномерно распределены после прежнего конца серии
+            added_from = self._run_end[-1] + (end - self._run_end[-1]) / added
+            self._run_end[-1] = max(end, self._run_end[-1])
+            self._run_count[-1] = count
+        else:
+            self._add_run(start, end, status, count)
+            added, added_from = count, start
+        for rollup in self.rollups:
+            rollup.add_run(added_from, end, success, added)
+        self.revision += 1
+
+    def merge_newer(self, live):
+        """Перенос из истории live проверок новее конца этой истории
+
+        Из серии live, начатой раньше конца этой истории, берутся только
+        более поздние проверки (считая их равномерно распределенными), и
+        они продолжают последнюю серию, если у нее тот же статус и нет
+        разрыва: иначе одни и те же проверки попали бы в агрегаты дважды,
+        а серия разделилась бы на границе загрузки. Время ответа
+        переносится записями буфера.
+        """
+        last = self.last_timestamp()
+        if last is None:
+            last = -math.inf
+        for start, end, success, count in live.runs(last, math.inf):
+            if end <= last:
+                continue
+            if start <= last:
+                step = (end - start) / (count - 1)
+                skipped = int((last - start) / step) + 1
+                start += skipped * step
+                count -= skipped
+                if count <= 0:
+                    continue
+            run = self.current_run()
+            if run and run[2] == success and not is_run_gap(run[0], run[1], run[3], start):
+                self.append_run(run[0], end, success, run[3] + count)
+            else:
+                self.append_run(start, end, success, count)
+        for i in range(live.bisect(last), len(live)):
+            timestamp, success, latency = live[i]
+            if timestamp > last and success and latency == latency:
+                self.add_latency(timestamp, latency)
+
+    def add_latency(self, timestamp, latency):
+        """Добавление времени ответа успешной проверки, статус которой уже учтен серией"""
+        self._push(timestamp, True, latency)
+        for rollup in self.rollups:
+            rollup.add_latency(timestamp, latency)
+
+    def tier(self, start_ts, seconds_per_pixel):
+        """Уровень детализации для графика с началом start_ts и масштабом seconds_per_pixel
+
+        Берется самый грубый уровень, интервал которого не длиннее пикселя,
+        а если более подробный уровень уже не хранит данные за start_ts -
+        следующий за ним.
+        """
+        chosen = self
+        for rollup in self.rollups:
+            if not len(rollup):
+                break
+            if rollup.resolution <= seconds_per_pixel or not chosen.covers(start_ts):
+                chosen = rollup
+        return chosen
+
+    def covers(self, timestamp):
+        """Может ли буфер содержать записи за timestamp с учетом срока хранения"""
+        last = self.last_timestamp()
+        return last is None or last - self.retention_seconds <= timestamp
+
+    def load_rollups(self, rollups):
+        """Загрузка агрегатов {длина интервала: [(начало, число, провалы, n, сумма, min, max)]}"""
+        for rollup in self.rollups:
+            for bucket in rollups.get(rollup.resolution, ()):
+                rollup.add_bucket(*bucket)
+
+    def extend(self, records):
+        """Добавление записей хранилища по порядку
+
+        Запись (timestamp, success, latency) - отдельная проверка,
+        (начало, конец, success, число) - серия, (timestamp, latency) -
+        время ответа проверки, уже учтенной серией.
+        """
+        for record in records:
+            if len(record) == 3:
+                self.append(*record)
+            elif len(record) == 4:
+                self.append_run(*record)
+            else:
+                self.add_latency(*record)
+
+    def evict_before(self, cutoff):
+        """Вытеснение записей и серий не новее cutoff"""
+        while self._len and self._times[self._start] <= cutoff:
+            self._drop_first()
+        head = self._run_head
+        while head < len(self._run_end) - 1 and self._run_end[head] <= cutoff:
+            head += 1
+        if head != self._run_head:
+            self._run_head = head
+            if head > 1024 and head * 2 > len(self._run_status):
+                for column in (self._run_start, self._run_end, self._run_status, self._run_count):
+                    del column[:head]
+                self._run_head = 0
+
+    def _drop_first(self):
+        """Удаление самой старой записи"""
+        self._start = (self._start + 1) % self._capacity
+        self._len -= 1
+
+    def _grow(self):
+        """Удвоение емкости заполненного буфера с выравниванием данных к началу"""
+        capacity = min(self._capacity * 2, self.max_capacity)
+        extra = capacity - self._capacity
+        self._times = self._times[self._start:] + self._times[:self._start] + array('d', bytes(8 * extra))
+        self._status = self._status[self._start:] + self._status[:self._start] + array('B', bytes(extra))
+        self._latency = self._latency[self._start:] + self._latency[:self._start] + array('f', bytes(4 * extra))
+        self._cum_failures = (self._cum_failures[self._start:] + self._cum_failures[:self._start]
+                              + array('I', bytes(4 * extra)))
+        self._cum_latency = (self._cum_latency[self._start:] + self._cum_latency[:self._start]
+                             + array('d', bytes(8 * extra)))
+        self._capacity = capacity
+        self._start = 0
+
+    def range_stats(self, start, end):
+        """Агрегаты записей [start, end): (число, число провалов, средняя задержка)"""
+        if end <= start:
+            return 0, 0, NAN
+        last = (self._start + end - 1) % self._capacity
+        first = (self._start + start) % self._capacity
+        failures = (self._cum_failures[last] - self._cum_failures[first]
+                    + (0 if self._status[first] else 1)) & 0xFFFFFFFF
+        latency_sum = self._cum_latency[last] - self._cum_latency[first]
+        if self._status[first] and self._latency[first] == self._latency[first]:
+            latency_sum += self._latency[first]
+        count = end - start
+        successes = count - failures
+        return count, failures, latency_sum / successes if successes else NAN
+
+    def bisect(self, timestamp, lo=0):
+        """Логический индекс первой записи со временем не раньше timestamp"""
+        hi = self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._times[(self._start + mid) % self._capacity] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+class RollupSeries:
+    """Агрегаты проверок по интервалам фиксированной длины
+
+    Для каждого интервала хранятся начало, минимальное и максимальное
+    время ответа, а число проверок, провалов, ответов и сумма времени
+    ответа - накопленными суммами, как в HostHistory, поэтому интерфейс
+    range_stats()/bisect() у них общий и график рисуется одним кодом.
+    Интервалы старше срока хранения отбрасываются с головы.
+    """
+
+    def __init__(self, resolution, retention_seconds):
+        """Инициализация ряда"""
+        self.resolution = resolution
+        self.retention_seconds = retention_seconds
+        self.serial = next(_serials)
+        self.revision = 0
+        self._times = array('d')
+        self._min = array('f')
+        self._max = array('f')
+        # Накопленные суммы на один элемент длиннее: [0] - сумма до первого интервала
+        self._cum_count = array('Q', [0])
+        self._cum_failures = array('Q', [0])
+        self._cum_latency_count = array('Q', [0])
+        self._cum_latency = array('d', [0.0])
+        self._start = 0
+
+    def __len__(self):
+        """Количество интервалов"""
+        return len(self._times) - self._start
+
+    def _physical(self, index):
+        """Преобразование логического индекса в индекс массива"""
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("rollup index out of range")
+        return self._start + index
+
+    def timestamp(self, index):
+        """Начало интервала по логическому индексу"""
+        return self._times[self._physical(index)]
+
+    def bucket(self, index):
+        """Интервал (начало, число, провалы, число ответов, сумма времени ответа, min, max)"""
+        j = self._physical(index)
+        return (self._times[j],
+                self._cum_count[j + 1] - self._cum_count[j],
+                self._cum_failures[j + 1] - self._cum_failures[j],
+                self._cum_latency_count[j + 1] - self._cum_latency_count[j],
+                self._cum_latency[j + 1] - self._cum_latency[j],
+                self._min[j], self._max[j])
+
+    def __iter__(self):
+        """Итерация по интервалам от старых к новым"""
+        for i in range(len(self)):
+            yield self.bucket(i)
+
+    def first_timestamp(self):
+        """Начало первого интервала (None для пустого ряда)"""
+        return self.timestamp(0) if len(self) else None
+
+    def covers(self, timestamp):
+        """Может ли ряд содержать данные за timestamp с учетом срока хранения"""
+        return not len(self) or self.timestamp(-1) - self.retention_seconds <= timestamp
+
+    def add(self, timestamp, success, latency=None):
+        """Учет одной проверки"""
+        has_latency = success and latency is not None and latency == latency
+        self.add_bucket(timestamp, 1, 0 if success else 1,
+                        1 if has_latency else 0, latency if has_latency else 0.0,
+                        latency if has_latency else NAN, latency if has_latency else NAN)
+
+    def add_run(self, start, end, success, count):
+        """Учет count проверок одного статуса, равномерно распределенных с start по end"""
+        if count <= 0:
+            return
+        if count == 1 or end <= start:
+            self.add_bucket(end, count, 0 if success else count, 0, 0.0)
+            return
+        step = (end - start) / (count - 1)
+        bucket = start - start % self.resolution
+        done = 0
+        while done < count:
+            bucket += self.resolution
+            # Проверки start + k * step, попавшие в интервал до bucket
+            inside = min(count, math.ceil((bucket - start) / step)) - done
+            if inside > 0:
+                self.add_bucket(bucket - self.resolution, inside, 0 if success else inside, 0, 0.0)
+                done += inside
+
+    def add_latency(self, timestamp, latency):
+        """Учет времени ответа проверки, уже учтенной в add_run()"""
+        self.add_bucket(timestamp, 0, 0, 1, latency, latency, latency)
+
+    def add_bucket(self, timestamp, count, failures, latency_count, latency_sum,
+                   latency_min=NAN, latency_max=NAN):
+        """Добавление агрегата в интервал, содержащий timestamp"""
+        start = timestamp - timestamp % self.resolution
+        self.evict_before(start - self.retention_seconds)
+        if len(self) and start < self._times[-1] - self.retention_seconds:
+            return
+        position = len(self._times)
+        if len(self) and start <= self._times[-1]:
+            # Запись не в последний интервал (например, агрегаты из снимка) - редкий путь за O(n)
+            position = self._start + self.bisect(start)
+        if position < len(self._times) and self._times[position] == start:
+            self._min[position] = _fmin(self._min[position], latency_min)
+            self._max[position] = _fmax(self._max[position], latency_max)
+        else:
+            self._times.insert(position, start)
+            self._min.insert(position, latency_min)
+            self._max.insert(position, latency_max)
+            for cum in (self._cum_count, self._cum_failures, self._cum_latency_count, self._cum_latency):
+                cum.insert(position + 1, cum[position])
+        for cum, value in ((self._cum_count, count), (self._cum_failures, failures),
+                           (self._cum_latency_count, latency_count), (self._cum_latency, latency_sum)):
+            for j in range(position + 1, len(cum)):
+                cum[j] += value
+        self.revision += 1
+
+    def evict_before(self, cutoff):
+        """Отбрасывание интервалов, закончившихся не позже cutoff"""
+        times = self._times
+        while self._start < len(times) and times[self._start] + self.resolution <= cutoff:
+            self._start += 1
+        if self._start > 1024 and self._start * 2 > len(times):
+            for column in (times, self._min, self._max, self._cum_count, self._cum_failures,
+                           self._cum_latency_count, self._cum_latency):
+                del column[:self._start]
+            self._start = 0
+
+    def range_stats(self, start, end):
+        """Агрегаты интервалов [start, end): (число проверок, число провалов, средняя задержка)"""
+        if end <= start:
+            return 0, 0, NAN
+        first, last = self._start + start, self._start + end
+        count = self._cum_count[last] - self._cum_count[first]
+        failures = self._cum_failures[last] - self._cum_failures[first]
+        latency_count = self._cum_latency_count[last] - self._cum_latency_count[first]
+        latency_sum = self._cum_latency[last] - self._cum_latency[first]
+        return count, failures, latency_sum / latency_count if latency_count else NAN
+
+    def bisect(self, timestamp, lo=0):
+        """Логический индекс первого интервала с началом не раньше timestamp"""
+        hi = len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._times[self._start + mid] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+class LatencyHistogram:
+    """Гистограмма времени ответа с логарифмическими корзинами
+
+    Значение добавляется за O(1), а процентиль считается по фиксированному
+    числу корзин, без обхода истории. Относительная погрешность процентиля
+    не превышает шага корзины (по умолчанию 5%).
+    """
+
+    def __init__(self, min_ms=0.01, max_ms=60000.0, ratio=1.05):
+        """Инициализация гистограммы"""
+        self.min_ms = min_ms
+        self.ratio = ratio
+        self._log_ratio = math.log(ratio)
+        self._counts = array('I', bytes(4 * (self._bucket(max_ms) + 1)))
+        self.count = 0
+
+    def _bucket(self, value):
+        """Индекс корзины для значения"""
+        if value <= self.min_ms:
+            return 0
+        return int(math.log(value / self.min_ms) / self._log_ratio) + 1
+
+    def add(self, value):
+        """Добавление значения в мс"""
+        self._counts[min(self._bucket(value), len(self._counts) - 1)] += 1
+        self.count += 1
+
+    def percentile(self, q):
+        """Процентиль q (0-100) в мс или None, если значений нет"""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * q / 100))
+        seen = 0
+        for index, bucket_count in enumerate(self._counts):
+            seen += bucket_count
+            if seen >= rank:
+                break
+        if index == 0:
+            return self.min_ms
+        # Середина корзины в логарифмической шкале
+        return self.min_ms * self.ratio ** (index - 0.5)
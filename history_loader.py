@@ -0,0 +1,43 @@
+# history_loader.py
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal, pyqtSlot
+from history import HostHistory
+
+class HistoryLoaderSignals(QObject):
+    # (host -> HostHistory, since)
+    loaded = pyqtSignal(object, object)
+
+class HistoryLoader(QRunnable):
+    """Чтение истории из хранилища и построение HostHistory в фоновом потоке
+
+    Поток интерфейса получает готовые буферы сигналом loaded и только
+    подменяет ими текущие. С since загружаются лишь записи новее since
+    (например, видимое по умолчанию окно), без агрегатов.
+    """
+
+    def __init__(self, history_store, hosts, since=None):
+        super().__init__()
+        self.history_store = history_store
+        self.hosts = list(hosts)
+        self.since = since
+        self.signals = HistoryLoaderSignals()
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            history, rollups = self.history_store.load(self.since)
+        except Exception as e:
+            print(f"Unexpected error loading history from {self.history_store.directory}: {e}")
+            history, rollups = {}, {}
+        histories = {}
+        for host in self.hosts:
+            records = history.get(host)
+            host_rollups = rollups.get(host)
+            if not records and not host_rollups:
+                continue
+            ping_history = HostHistory()
+            if host_rollups:
+                ping_history.load_rollups(host_rollups)
+            if records:
+                ping_history.extend(records)
+            histories[host] = ping_history
+        self.signals.loaded.emit(histories, self.since)
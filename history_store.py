@@ -0,0 +1,556 @@
+# history_store.py
+import os
+import json
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from history import ROLLUP_TIERS, RollupSeries, is_run_gap
+
+HISTORY_DIR = os.path.expanduser("~/.ping_monitor_history")
+LEGACY_HISTORY_FILE = os.path.expanduser("~/.ping_monitor_history.json")
+
+def read_legacy_history(path=LEGACY_HISTORY_FILE):
+    """Чтение истории в старом формате JSON (~/.ping_monitor_history.json)"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def create_history_store(settings):
+    """Хранилище истории, выбранное ключом history_backend ("journal", "sqlite" или "binary")"""
+    backend = settings.value("history_backend", "journal")
+    if backend == "sqlite":
+        from sqlite_store import SqliteHistoryStore
+        return SqliteHistoryStore()
+    if backend == "binary":
+        from binary_store import BinaryHistoryStore
+        return BinaryHistoryStore()
+    return HistoryStore(record_latency=settings.value("history_latency", False, type=bool))
+
+def format_record(host, timestamp, success, latency=None):
+    """Строка журнала для одного результата проверки"""
+    latency = "" if latency is None or latency != latency else f"{latency:.3f}"
+    return f"{host}\t{timestamp:.3f}\t{int(bool(success))}\t{latency}\n"
+
+def parse_record(parts):
+    """Разбор полей строки результата: (host, epoch, success, latency) или None"""
+    if len(parts) not in (3, 4):
+        return None
+    try:
+        t = float(parts[1])
+        latency = float(parts[3]) if len(parts) == 4 and parts[3] else None
+    except ValueError:
+        return None
+    return parts[0], t, parts[2] == "1", latency
+
+def format_run(host, start, end, success, count):
+    """Строка журнала для серии проверок одного статуса"""
+    return f"#run\t{host}\t{start:.3f}\t{end:.3f}\t{int(bool(success))}\t{count}\n"
+
+def format_latency(host, timestamp, latency):
+    """Строка журнала для времени ответа успешной проверки"""
+    return f"#latency\t{host}\t{timestamp:.3f}\t{latency:.3f}\n"
+
+def format_entry(host, record):
+    """Строка журнала для записи истории любого вида (см. HostHistory.extend)"""
+    if len(record) == 4:
+        return format_run(host, *record)
+    if len(record) == 2:
+        return format_latency(host, *record)
+    return format_record(host, *record)
+
+def parse_run(parts):
+    """Разбор полей строки серии: (host, (начало, конец, success, число)) или None"""
+    try:
+        return parts[1], (float(parts[2]), float(parts[3]), parts[4] == "1", int(parts[5]))
+    except ValueError:
+        return None
+
+def parse_latency(parts):
+    """Разбор полей строки времени ответа: (host, (epoch, latency)) или None"""
+    try:
+        return parts[1], (float(parts[2]), float(parts[3]))
+    except ValueError:
+        return None
+
+def format_rollup(host, resolution, bucket):
+    """Строка снимка для одного интервала агрегации"""
+    start, count, failures, latency_count, latency_sum, latency_min, latency_max = bucket
+    latency_min = "" if latency_min != latency_min else f"{latency_min:.3f}"
+    latency_max = "" if latency_max != latency_max else f"{latency_max:.3f}"
+    return (f"@{resolution}\t{host}\t{start:.0f}\t{count}\t{failures}\t{latency_count}\t"
+            f"{latency_sum:.3f}\t{latency_min}\t{latency_max}\n")
+
+class HistoryStore:
+    """Хранилище истории проверок: журнал с дозаписью и фоновым уплотнением
+
+    Статус хоста почти не меняется, поэтому в журнал пишутся не проверки,
+    а серии проверок одного статуса: строка
+    "#run<TAB>host<TAB>начало<TAB>конец<TAB>status<TAB>число" пишется при
+    начале и конце серии и не чаще раза в RUN_CHECKPOINT секунд, пока
+    серия продолжается; при чтении более поздняя строка серии (то же
+    начало и статус) заменяет прежние. Объем журнала и время загрузки
+    растут с числом смен статуса, а не с числом проверок. Время ответа
+    пишется только с record_latency (ключ history_latency) отдельными
+    строками "#latency<TAB>host<TAB>timestamp<TAB>мс". Строки проверок
+    старого формата "host<TAB>timestamp<TAB>status<TAB>latency" по-прежнему
+    читаются.
+
+    append() только копит строки в памяти, а flush() передает их фоновому
+    потоку записи, так что поток интерфейса никогда не ждет диска. Когда
+    журнал вырастает, он замораживается, а фоновый поток сливает его со
+    снимком, отбрасывая записи старше срока хранения.
+
+    Удаление и переименование хостов записываются служебными строками
+    "#drop<TAB>host" и "#rename<TAB>old<TAB>new" и применяются при чтении.
+
+    Записи старше срока хранения не теряются, а сворачиваются в агрегаты
+    по уровням ROLLUP_TIERS, которые уплотнение пишет в снимок строками
+    "@<интервал><TAB>host<TAB>начало<TAB>число<TAB>провалы<TAB>ответы<TAB>сумма<TAB>min<TAB>max".
+
+    Читатели, в том числе окно в режиме просмотра в другом процессе, держат
+    разделяемую блокировку файла replay.lock, пока читают снимок и журналы,
+    а уплотнение подменяет файлы под исключительной блокировкой, поэтому
+    чтение не видит наполовину выполненной подмены.
+    """
+
+    SNAPSHOT_FILE = "snapshot.log"
+    JOURNAL_FILE = "journal.log"
+    FROZEN_FILE = "journal.old"
+    LOCK_FILE = "writer.lock"
+    REPLAY_LOCK_FILE = "replay.lock"
+    # Как часто в секундах сохраняется продолжающаяся серия
+    RUN_CHECKPOINT = 60
+
+    def __init__(self, directory=HISTORY_DIR, retention=timedelta(hours=48),
+                 compact_threshold=8 * 1024 * 1024, record_latency=False):
+        """Инициализация хранилища"""
+        self.directory = directory
+        self.retention = retention
+        self.compact_threshold = compact_threshold
+        self.record_latency = record_latency
+        # Хост -> текущая серия [начало, конец, статус, число, число на момент записи, время записи]
+        self._runs = {}
+        self.snapshot_path = os.path.join(directory, self.SNAPSHOT_FILE)
+        self.journal_path = os.path.join(directory, self.JOURNAL_FILE)
+        self.frozen_path = os.path.join(directory, self.FROZEN_FILE)
+        self.lock_path = os.path.join(directory, self.LOCK_FILE)
+        self.replay_lock_path = os.path.join(directory, self.REPLAY_LOCK_FILE)
+        self._lock_file = None
+        self._lock = threading.Lock()
+        self._pending = []
+        self._queue = queue.Queue()
+        self._writer = None
+        self._journal = None
+        self._journal_size = 0
+        self._compactor = None
+        # Удерживается при чтении файлов хранилища и при их подмене уплотнением (см. _files_locked)
+        self._replay_lock = threading.Lock()
+
+    def open(self):
+        """Открытие журнала на дозапись и запуск фонового потока записи
+
+        Писать в хранилище может только один процесс (приложение или фоновый
+        монитор); если оно уже занято, выбрасывается BlockingIOError.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._acquire_lock()
+        if self._is_empty():
+            self._import_legacy((datetime.now() - self.retention).timestamp())
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal_size = self._journal.tell()
+        if os.path.exists(self.frozen_path):
+            # Предыдущее уплотнение не завершилось - доводим его до конца
+            self._start_compaction()
+        elif self._journal_size > self.compact_threshold:
+            self.compact()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def close(self):
+        """Запись накопленных строк и закрытие журнала"""
+        if self._writer:
+            for host, run in self._runs.items():
+                if run[4] != run[3]:
+                    self._write_run(host, run)
+            self.flush()
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        compactor = self._compactor
+        if compactor:
+            compactor.join()
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _acquire_lock(self):
+        """Захват блокировки писателя с записью PID владельца"""
+        try:
+            import fcntl
+        except ImportError:
+            # Без fcntl (Windows) блокировка не поддерживается
+            return
+        lock_file = open(self.lock_path, 'a+', encoding='utf-8')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise BlockingIOError(f"history store {self.directory} is used by another process")
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._lock_file = lock_file
+
+    @contextmanager
+    def _files_locked(self, exclusive):
+        """Блокировка файлов хранилища: разделяемая для чтения, исключительная для подмены
+
+        Кроме блокировки внутри процесса берется flock на replay.lock, который
+        действует и между процессами. Без fcntl (Windows) или без каталога
+        хранилища остается только блокировка внутри процесса.
+        """
+        with self._replay_lock:
+            try:
+                import fcntl
+                lock_file = open(self.replay_lock_path, 'a', encoding='utf-8')
+            except (ImportError, OSError):
+                yield
+                return
+            with lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                yield
+
+    def follow(self):
+        """Чтение результатов, которые дописывает в журнал другой процесс"""
+        return JournalFollower(self.journal_path)
+
+    def append(self, host, timestamp, success, latency=None):
+        """Учет результата проверки в серии хоста; в буфер журнала попадают только строки серий"""
+        t = timestamp.timestamp()
+        status = 1 if success else 0
+        run = self._runs.get(host)
+        if run is not None and run[2] == status and not is_run_gap(run[0], run[1], run[3], t):
+            run[1] = t
+            run[3] += 1
+            if t - run[5] >= self.RUN_CHECKPOINT:
+                self._write_run(host, run)
+        else:
+            if run is not None and run[4] != run[3]:
+                self._write_run(host, run)
+            run = self._runs[host] = [t, t, status, 1, 0, t]
+            self._write_run(host, run)
+        if self.record_latency and success and latency is not None and latency == latency:
+            self._buffer(format_latency(host, t, latency))
+
+    def _write_run(self, host, run):
+        """Строка текущего состояния серии в буфер журнала"""
+        run[4], run[5] = run[3], run[1]
+        self._buffer(format_run(host, run[0], run[1], run[2], run[3]))
+
+    def drop_host(self, host):
+        """Удаление истории хоста"""
+        self._runs.pop(host, None)
+        self._buffer(f"#drop\t{host}\n")
+
+    def rename_host(self, old_host, new_host):
+        """Перенос истории хоста под новое имя"""
+        run = self._runs.pop(old_host, None)
+        if run is not None:
+            self._runs[new_host] = run
+        self._buffer(f"#rename\t{old_host}\t{new_host}\n")
+
+    def _buffer(self, line):
+        """Накопление строки в памяти до следующего flush()"""
+        with self._lock:
+            self._pending.append(line)
+
+    def flush(self):
+        """Передача накопленных строк фоновому потоку записи"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._queue.put(batch)
+
+    def _write_loop(self):
+        """Фоновая запись пачек строк в журнал"""
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            try:
+                self._journal.writelines(batch)
+                self._journal.flush()
+                self._journal_size += sum(len(line) for line in batch)
+            except Exception as e:
+                print(f"Error writing history to {self.journal_path}: {e}")
+                continue
+            if self._journal_size > self.compact_threshold:
+                self.compact()
+
+    def compact(self):
+        """Заморозка текущего журнала и запуск его фонового слияния со снимком"""
+        if self._compactor and self._compactor.is_alive():
+            return
+        if not self._journal or os.path.exists(self.frozen_path):
+            return
+        self._journal.close()
+        with self._files_locked(exclusive=True):
+            os.replace(self.journal_path, self.frozen_path)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal_size = 0
+        self._start_compaction()
+
+    def _start_compaction(self):
+        """Запуск фонового потока уплотнения"""
+        self._compactor = threading.Thread(target=self._compact_frozen, daemon=True)
+        self._compactor.start()
+
+    def _compact_frozen(self):
+        """Слияние снимка и замороженного журнала в новый снимок"""
+        try:
+            cutoff = (datetime.now() - self.retention).timestamp()
+            history = {}
+            rollups = {}
+            for path in (self.snapshot_path, self.frozen_path):
+                self._replay(path, history, cutoff, rollups)
+            self._expire_runs(history, cutoff, rollups)
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for host, series in rollups.items():
+                    for rollup in series:
+                        f.writelines(format_rollup(host, rollup.resolution, bucket) for bucket in rollup)
+                for host, records in history.items():
+                    f.writelines(format_entry(host, record) for record in records)
+                f.flush()
+                os.fsync(f.fileno())
+            with self._files_locked(exclusive=True):
+                os.replace(tmp_path, self.snapshot_path)
+                os.remove(self.frozen_path)
+        except Exception as e:
+            print(f"Error compacting history in {self.directory}: {e}")
+
+    def _replay(self, path, history, cutoff, rollups):
+        """Чтение файла журнала в словари host -> [записи] и host -> [RollupSeries]
+
+        Записи - проверки, серии и времена ответа (см. HostHistory.extend).
+        Проверки и времена ответа не новее cutoff сворачиваются в агрегаты,
+        а если rollups равен None - пропускаются; серии отбираются после
+        чтения всех файлов в _expire_runs(), так как продолжение серии может
+        лежать в следующем файле.
+        """
+        try:
+            f = open(path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                if not line.endswith('\n'):
+                    # Строка, которую писатель еще не дописал
+                    break
+                parts = line.rstrip('\n').split('\t')
+                if parts[0] == "#drop" and len(parts) == 2:
+                    history.pop(parts[1], None)
+                    if rollups is not None:
+                        rollups.pop(parts[1], None)
+                elif parts[0] == "#rename" and len(parts) == 3:
+                    for data in (history, rollups):
+                        records = None if data is None else data.pop(parts[1], None)
+                        if records is not None:
+                            data[parts[2]] = records
+                elif parts[0] == "#run" and len(parts) == 6:
+                    run = parse_run(parts)
+                    if run is not None:
+                        self._merge_run(history.setdefault(run[0], []), run[1])
+                elif parts[0] == "#latency" and len(parts) == 4:
+                    sample = parse_latency(parts)
+                    if sample is None:
+                        continue
+                    host, (t, latency) = sample
+                    if t > cutoff:
+                        history.setdefault(host, []).append((t, latency))
+                    elif rollups is not None:
+                        for rollup in self._rollups(rollups, host):
+                            rollup.add_latency(t, latency)
+                elif parts[0].startswith("@") and len(parts) == 9:
+                    if rollups is None:
+                        continue
+                    try:
+                        resolution = int(parts[0][1:])
+                        bucket = (float(parts[2]), int(parts[3]), int(parts[4]), int(parts[5]), float(parts[6]),
+                                  float(parts[7] or "nan"), float(parts[8] or "nan"))
+                    except ValueError:
+                        continue
+                    for rollup in self._rollups(rollups, parts[1]):
+                        if rollup.resolution == resolution:
+                            rollup.add_bucket(*bucket)
+                else:
+                    record = parse_record(parts)
+                    if record is None:
+                        continue
+                    host, t, success, latency = record
+                    if t > cutoff:
+                        history.setdefault(host, []).append((t, success, latency))
+                    elif rollups is not None:
+                        for rollup in self._rollups(rollups, host):
+                            rollup.add(t, success, latency)
+
+    @staticmethod
+    def _merge_run(records, run):
+        """Добавление серии; строка той же серии (то же начало и статус) заменяет прежнюю"""
+        for i in range(len(records) - 1, -1, -1):
+            if len(records[i]) == 4:
+                if records[i][0] == run[0] and records[i][2] == run[2]:
+                    records[i] = run
+                    return
+                break
+        records.append(run)
+
+    def _expire_runs(self, history, cutoff, rollups):
+        """Свертка в агрегаты (или отбрасывание, если rollups равен None) серий, закончившихся не позже cutoff"""
+        for host in list(history):
+            records = []
+            for record in history[host]:
+                if len(record) != 4 or record[1] > cutoff:
+                    records.append(record)
+                elif rollups is not None:
+                    for rollup in self._rollups(rollups, host):
+                        rollup.add_run(*record)
+            if records:
+                history[host] = records
+            else:
+                del history[host]
+
+    @staticmethod
+    def _rollups(rollups, host):
+        """Уровни агрегации хоста, создаваемые при первом обращении"""
+        series = rollups.get(host)
+        if series is None:
+            series = rollups[host] = [RollupSeries(resolution, retention)
+                                      for resolution, retention in ROLLUP_TIERS]
+        return series
+
+    def load(self, since=None):
+        """Загрузка истории: (host -> [записи] в порядке записи (см. HostHistory.extend),
+        host -> {интервал: [агрегаты]} для записей старше срока хранения)
+
+        С since загружаются только записи новее since, без агрегатов.
+        Можно вызывать из фонового потока, пока открытое хранилище пишет,
+        и из другого процесса, пока пишет он.
+        """
+        cutoff = (datetime.now() - self.retention).timestamp()
+        if self._is_empty():
+            self._import_legacy(cutoff)
+        history = {}
+        rollups = None if since is not None else {}
+        with self._files_locked(exclusive=False):
+            for path in (self.snapshot_path, self.frozen_path, self.journal_path):
+                self._replay(path, history, cutoff if since is None else max(cutoff, since), rollups)
+        self._expire_runs(history, cutoff if since is None else max(cutoff, since), rollups)
+        return history, {host: {rollup.resolution: list(rollup) for rollup in series}
+                         for host, series in (rollups or {}).items()}
+
+    def _is_empty(self):
+        """Проверка, что хранилище еще не содержит ни одной записи"""
+        if os.path.exists(self.snapshot_path) or os.path.exists(self.frozen_path):
+            return False
+        return not os.path.exists(self.journal_path) or os.path.getsize(self.journal_path) == 0
+
+    def _import_legacy(self, cutoff):
+        """Однократный перенос истории из старого JSON-файла в снимок"""
+        legacy = read_legacy_history()
+        if not legacy:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.snapshot_path, 'w', encoding='utf-8') as f:
+                for host, data in legacy.items():
+                    try:
+                        records = [(datetime.fromisoformat(t).timestamp(), s)
+                                   for t, s in data['records']]
+                    except Exception as e:
+                        print(f"Error importing legacy history for {host}: {e}")
+                        continue
+                    f.writelines(format_record(host, t, s) for t, s in records if t > cutoff)
+        except Exception as e:
+            print(f"Error writing history snapshot to {self.snapshot_path}: {e}")
+
+class JournalFollower:
+    """Слежение за журналом, который пишет другой процесс
+
+    Читает только дописанные с прошлого вызова целые строки. Когда писатель
+    замораживает журнал при уплотнении, старый файл после смены inode
+    дочитывается еще раз - в него могли дописать строки между чтением и
+    переименованием, - а новый читается с начала.
+    """
+
+    def __init__(self, path):
+        """Открытие журнала с текущего конца"""
+        self.path = path
+        self._file = None
+        self._inode = None
+        self._partial = ""
+        self._open(at_end=True)
+
+    def _open(self, at_end):
+        """Открытие текущего файла журнала"""
+        try:
+            f = open(self.path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return
+        if at_end:
+            f.seek(0, os.SEEK_END)
+        self._file = f
+        self._inode = os.fstat(f.fileno()).st_ino
+
+    def _read(self):
+        """Разбор дописанных целых строк открытого файла"""
+        data = self._partial + self._file.read()
+        lines = data.split('\n')
+        self._partial = lines.pop()
+        records = []
+        for line in lines:
+            parts = line.split('\t')
+            if parts[0] == "#run" and len(parts) == 6:
+                entry = parse_run(parts)
+            elif parts[0] == "#latency" and len(parts) == 4:
+                entry = parse_latency(parts)
+            else:
+                record = parse_record(parts)
+                entry = None if record is None else (record[0], record[1:])
+            if entry is not None:
+                records.append((entry[0], *entry[1]))
+        return records
+
+    def poll(self):
+        """Новые записи [(host, *запись)] с прошлого вызова (виды записей - см. HostHistory.extend)"""
+        if self._file is None:
+            self._open(at_end=False)
+            if self._file is None:
+                return []
+        records = self._read()
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode != self._inode:
+            # Писатель закрывает журнал до переименования, так что хвост старого файла уже полон
+            records.extend(self._read())
+            self.close()
+            self._open(at_end=False)
+            if self._file is not None:
+                records.extend(self._read())
+        return records
+
+    def close(self):
+        """Закрытие журнала"""
+        if self._file:
+            self._file.close()
+            self._file = None
+        self._partial = ""
@@ -0,0 +1,306 @@
+# host_model.py
+import itertools
+from PyQt6.QtCore import Qt, QAbstractItemModel, QModelIndex, QMimeData, pyqtSignal
+from PyQt6.QtGui import QColor
+
+HOSTS_MIME_TYPE = "application/x-qping-hosts"
+
+class HostTreeModel(QAbstractItemModel):
+    """Модель дерева хостов: категории верхнего уровня и хосты внутри них
+
+    Порядок хостов хранится списками по категориям, а положение каждого
+    хоста - словарем host -> строка, поэтому индекс хоста, подсветка и
+    обновление его строки обходятся без обхода дерева; изменения
+    сообщаются точечными dataChanged. Категории сортируются по имени.
+    Во внутреннем идентификаторе индекса хоста хранится постоянный номер
+    его категории, а у индекса категории он равен 0.
+    """
+
+    HIGHLIGHT_COLOR = QColor("#ADD8E6")
+    CATEGORY_COLOR = QColor("#E0E0E0")
+
+    # Хосты перемещены перетаскиванием: (список хостов, категория)
+    hosts_moved = pyqtSignal(list, str)
+
+    def __init__(self, host_states, parent=None):
+        """Инициализация модели"""
+        super().__init__(parent)
+        self.host_states = host_states
+        self.categories = []
+        self.category_hosts = {}
+        self.visible_counts = {}
+        self.highlighted = None
+        self._host_rows = {}
+        self._host_categories = {}
+        self._category_rows = {}
+        self._category_ids = {}
+        self._id_categories = {}
+        self._ids = itertools.count(1)
+
+    # --- Интерфейс QAbstractItemModel ---
+
+    def index(self, row, column, parent=QModelIndex()):
+        """Индекс элемента по строке и родителю"""
+        if column != 0:
+            return QModelIndex()
+        if not parent.isValid():
+            if 0 <= row < len(self.categories):
+                return self.createIndex(row, 0, 0)
+            return QModelIndex()
+        if parent.internalId():
+            return QModelIndex()
+        category = self.categories[parent.row()]
+        if 0 <= row < len(self.category_hosts[category]):
+            return self.createIndex(row, 0, self._category_ids[category])
+        return QModelIndex()
+
+    def parent(self, index=QModelIndex()):
+        """Родитель элемента: категория для хоста, корень для категории"""
+        if not index.isValid() or not index.internalId():
+            return QModelIndex()
+        category = self._id_categories[index.internalId()]
+        return self.createIndex(self._category_rows[category], 0, 0)
+
+    def rowCount(self, parent=QModelIndex()):
+        """Число дочерних элементов"""
+        if not parent.isValid():
+            return len(self.categories)
+        if parent.internalId():
+            return 0
+        return len(self.category_hosts[self.categories[parent.row()]])
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        """Данные элемента для отображения"""
+        if not index.isValid():
+            return None
+        if not index.internalId():
+            category = self.categories[index.row()]
+            if role == Qt.ItemDataRole.DisplayRole:
+                return f"[{category}] ({self.visible_counts.get(category, 0)})"
+            if role == Qt.ItemDataRole.UserRole:
+                return category
+            if role == Qt.ItemDataRole.BackgroundRole:
+                return self.CATEGORY_COLOR
+            return None
+        host = self.host_at(index)
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.UserRole):
+            return host
+        if role == Qt.ItemDataRole.BackgroundRole and host == self.highlighted:
+            return self.HIGHLIGHT_COLOR
+        return None
+
+    def flags(self, index):
+        """Флаги элемента: хосты выбираются и перетаскиваются, категории принимают хосты"""
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        if not index.internalId():
+            return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsDropEnabled
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsDragEnabled
+
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+
+    def mimeTypes(self):
+        return [HOSTS_MIME_TYPE]
+
+    def mimeData(self, indexes):
+        """Упаковка перетаскиваемых хостов"""
+        hosts = [self.host_at(index) for index in indexes if index.isValid() and index.internalId()]
+        mime = QMimeData()
+        mime.setData(HOSTS_MIME_TYPE, "\n".join(hosts).encode("utf-8"))
+        return mime
+
+    def dropMimeData(self, data, action, row, column, parent):
+        """Перемещение хостов в категорию parent перед строкой row
+
+        Хосты переносятся здесь же; removeRows() не реализован, поэтому
+        представление не удаляет исходные строки повторно.
+        """
+        if not data.hasFormat(HOSTS_MIME_TYPE):
+            return False
+        if parent.isValid() and parent.internalId():
+            # Бросок на сам хост - вставка перед ним
+            row, parent = parent.row(), parent.parent()
+        if not parent.isValid():
+            return False
+        category = self.categories[parent.row()]
+        hosts = [h for h in bytes(data.data(HOSTS_MIME_TYPE)).decode("utf-8").split("\n") if h in self._host_rows]
+        if not hosts:
+            return False
+        self.move_hosts(hosts, category, row)
+        self.hosts_moved.emit(hosts, category)
+        return True
+
+    # --- Доступ к хостам ---
+
+    def host_at(self, index):
+        """Хост по индексу модели"""
+        return self.category_hosts[self._id_categories[index.internalId()]][index.row()]
+
+    def host_index(self, host):
+        """Индекс хоста или недействительный индекс, если хоста нет"""
+        row = self._host_rows.get(host)
+        if row is None:
+            return QModelIndex()
+        return self.createIndex(row, 0, self._category_ids[self._host_categories[host]])
+
+    def category_index(self, category):
+        """Индекс категории"""
+        row = self._category_rows.get(category)
+        return QModelIndex() if row is None else self.createIndex(row, 0, 0)
+
+    def hosts(self):
+        """Хосты в порядке отображения"""
+        for category in self.categories:
+            yield from self.category_hosts[category]
+
+    # --- Изменение структуры ---
+
+    def reset(self, hosts):
+        """Заполнение модели хостами из host_states в порядке hosts"""
+        self.beginResetModel()
+        self.categories = []
+        self.category_hosts = {}
+        self._host_rows = {}
+        self._host_categories = {}
+        self._category_rows = {}
+        for host in hosts:
+            self.category_hosts.setdefault(self.host_states[host].category, []).append(host)
+            self._host_categories[host] = self.host_states[host].category
+        self.categories = sorted(self.category_hosts)
+        for category in self.categories:
+            self._register_category(category)
+        self._renumber_categories()
+        for category in self.categories:
+            self._renumber_hosts(category)
+        self.endResetModel()
+
+    def add_host(self, host, row=None):
+        """Добавление хоста из host_states в его категорию (в конец или перед row)"""
+        category = self.host_states[host].category
+        if category not in self.category_hosts:
+            self._insert_category(category)
+        hosts = self.category_hosts[category]
+        row = len(hosts) if row is None else max(0, min(row, len(hosts)))
+        self.beginInsertRows(self.category_index(category), row, row)
+        hosts.insert(row, host)
+        self._host_categories[host] = category
+        self._renumber_hosts(category, row)
+        self.endInsertRows()
+
+    def remove_host(self, host):
+        """Удаление хоста"""
+        if host not in self._host_rows:
+            return
+        category = self._host_categories[host]
+        row = self._host_rows[host]
+        self.beginRemoveRows(self.category_index(category), row, row)
+        del self.category_hosts[category][row]
+        del self._host_categories[host]
+        del self._host_rows[host]
+        self._renumber_hosts(category, row)
+        self.endRemoveRows()
+        if not self.category_hosts[category]:
+            self._remove_category(category)
+
+    def rename_host(self, old_host, new_host):
+        """Переименование хоста на месте (host_states уже содержит new_host)"""
+        row = self._host_rows.pop(old_host)
+        category = self._host_categories.pop(old_host)
+        self.category_hosts[category][row] = new_host
+        self._host_rows[new_host] = row
+        self._host_categories[new_host] = category
+        if self.highlighted == old_host:
+            self.highlighted = new_host
+        self.host_changed(new_host)
+
+    def set_category(self, host, category):
+        """Перенос хоста в другую категорию"""
+        state = self.host_states[host]
+        if state.category == category:
+            return
+        self.remove_host(host)
+        state.category = category
+        self.add_host(host)
+
+    def move_hosts(self, hosts, category, row):
+        """Перенос хостов в категорию category перед строкой row (-1 - в конец)"""
+        target = self.category_hosts[category]
+        anchor = target[row] if 0 <= row < len(target) else None
+        while anchor in hosts:
+            # Якорь сам перемещается - вставляем перед следующим неперемещаемым хостом
+            next_row = self._host_rows[anchor] + 1
+            anchor = target[next_row] if next_row < len(target) else None
+        for host in hosts:
+            self.remove_host(host)
+        for host in hosts:
+            self.host_states[host].category = category
+            self.add_host(host, self._host_rows[anchor] if anchor is not None else None)
+
+    # --- Точечные обновления ---
+
+    def host_changed(self, host):
+        """Сообщение представлению об изменении строки хоста"""
+        index = self.host_index(host)
+        if index.isValid():
+            self.dataChanged.emit(index, index)
+
+    def set_highlighted(self, host):
+        """Подсветка хоста, отправленного на проверку последним"""
+        previous, self.highlighted = self.highlighted, host
+        if previous != host:
+            if previous is not None:
+                self.host_changed(previous)
+            self.host_changed(host)
+
+    def set_visible_count(self, category, count):
+        """Число видимых хостов категории для заголовка"""
+        if self.visible_counts.get(category) != count:
+            self.visible_counts[category] = count
+            index = self.category_index(category)
+            if index.isValid():
+                self.dataChanged.emit(index, index)
+
+    # --- Служебные методы ---
+
+    def _register_category(self, category):
+        """Выдача категории постоянного номера для индексов ее хостов"""
+        if category not in self._category_ids:
+            category_id = next(self._ids)
+            self._category_ids[category] = category_id
+            self._id_categories[category_id] = category
+
+    def _insert_category(self, category):
+        """Добавление пустой категории с сохранением сортировки"""
+        self._register_category(category)
+        row = sum(1 for c in self.categories if c < category)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.categories.insert(row, category)
+        self.category_hosts[category] = []
+        self._renumber_categories(row)
+        self.endInsertRows()
+
+    def _remove_category(self, category):
+        """Удаление опустевшей категории"""
+        row = self._category_rows[category]
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.categories[row]
+        del self.category_hosts[category]
+        del self._category_rows[category]
+        self.visible_counts.pop(category, None)
+        self._renumber_categories(row)
+        self.endRemoveRows()
+
+    def _renumber_categories(self, start=0):
+        """Обновление строк категорий начиная с start"""
+        for row in range(start, len(self.categories)):
+            self._category_rows[self.categories[row]] = row
+
+    def _renumber_hosts(self, category, start=0):
+        """Обновление строк хостов категории начиная с start"""
+        hosts = self.category_hosts[category]
+        for row in range(start, len(hosts)):
+            self._host_rows[hosts[row]] = row
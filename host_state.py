@@ -0,0 +1,114 @@
+# host_state.py
+from history import HostHistory, LatencyHistogram
+from ping_manager import NO_RTT
+
+class HostState:
+    """Состояние наблюдаемого хоста, не зависящее от виджетов
+
+    Хранит категорию, историю проверок и счетчики сессии. Виджеты панели
+    графиков только отображают его и могут создаваться и переиспользоваться
+    независимо от числа хостов.
+    """
+
+    def __init__(self, host, app_start_time, category="Default"):
+        """Инициализация состояния хоста"""
+        self.host = host
+        self.category = category
+        self.app_start_time = app_start_time
+        self.ping_history = HostHistory()
+        self.latency_stats = LatencyHistogram()
+        self.consecutive_failures = 0
+        self.session_success_count = 0
+        self.session_failure_count = 0
+
+    def update_status(self, success, current_time, rtt_ms=NO_RTT):
+        """Учет результата проверки; возвращает число провалов подряд"""
+        latency = rtt_ms if success and rtt_ms >= 0 else None
+        if not success:
+            self.consecutive_failures += 1
+            self.session_failure_count += 1
+        else:
+            self.consecutive_failures = 0
+            self.session_success_count += 1
+            if latency is not None:
+                self.latency_stats.add(latency)
+        self.ping_history.append(current_time.timestamp(), success, latency)
+        return self.consecutive_failures
+
+    def update_run(self, start, end, success, count):
+        """Учет серии проверок, записанной другим процессом; возвращает число провалов подряд
+
+        Продолжение уже известной серии учитывается приростом числа проверок.
+        """
+        run = self.ping_history.current_run()
+        known = run[3] if run and run[0] == start and run[2] == bool(success) else 0
+        added = max(0, count - known)
+        if success:
+            self.consecutive_failures = 0
+            self.session_success_count += added
+        else:
+            self.consecutive_failures += added
+            self.session_failure_count += added
+        self.ping_history.append_run(start, end, success, count)
+        return self.consecutive_failures
+
+    def add_latency(self, timestamp, latency):
+        """Учет времени ответа проверки, уже учтенной серией"""
+        self.latency_stats.add(latency)
+        self.ping_history.add_latency(timestamp, latency)
+
+class HealthAggregator:
+    """Сводное состояние всех хостов для значка окна и трея
+
+    Для каждого хоста хранится уровень: 1 - последняя проверка провалена,
+    2 - провалены две и более подряд; здоровые хосты не хранятся. Счетчики
+    уровней меняются только при переходе хоста между уровнями, поэтому
+    сводное состояние узнается за O(1), без обхода хостов.
+    """
+
+    GREEN = "green"
+    YELLOW = "yellow"
+    RED = "red"
+
+    def __init__(self):
+        """Инициализация агрегатора"""
+        self._levels = {}
+        self.warning_count = 0
+        self.critical_count = 0
+
+    def update(self, host, failure_streak):
+        """Учет числа провалов подряд у хоста"""
+        level = min(failure_streak, 2)
+        previous = self._levels.get(host, 0)
+        if level == previous:
+            return
+        self._count(previous, -1)
+        self._count(level, 1)
+        if level:
+            self._levels[host] = level
+        else:
+            del self._levels[host]
+
+    def remove(self, host):
+        """Исключение хоста из сводки"""
+        self.update(host, 0)
+
+    def rename(self, old_host, new_host):
+        """Перенос уровня хоста под новое имя"""
+        if old_host in self._levels:
+            self._levels[new_host] = self._levels.pop(old_host)
+
+    def _count(self, level, delta):
+        """Изменение счетчика уровня"""
+        if level == 1:
+            self.warning_count += delta
+        elif level == 2:
+            self.critical_count += delta
+
+    def state(self):
+        """Сводное состояние: RED, YELLOW или GREEN"""
+        if self.critical_count:
+            return self.RED
+        if self.warning_count:
+            return self.YELLOW
+        return self.GREEN
@@ -0,0 +1,301 @@
+# icmp.py
+import os
+import time
+import select
+import socket
+import struct
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+ICMP6_ECHO_REQUEST = 128
+ICMP6_ECHO_REPLY = 129
+
+PAYLOAD = b"QPing-echo-probe" * 2
+
+_sequences = itertools.count(1)
+_identifiers = itertools.count(os.getpid())
+# Удачный тип сокета для каждого семейства адресов: SOCK_DGRAM, SOCK_RAW или None
+_socket_types = {}
+
+# Сколько секунд хранится разрешенный адрес хоста и число потоков разрешения имен
+RESOLVE_TTL = 300
+RESOLVE_THREADS = 8
+# Кэш адресов {хост: (семейство, адрес, срок monotonic)} и незавершенные разрешения {хост: Future}
+_resolved = {}
+_lookups = {}
+_resolve_lock = threading.Lock()
+_resolver = None
+
+def checksum(data):
+    """Контрольная сумма Интернета (RFC 1071)"""
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+def resolve(host):
+    """Разрешение имени хоста в (семейство, адрес)"""
+    family, _, _, _, sockaddr = socket.getaddrinfo(host, None, 0, socket.SOCK_DGRAM)[0]
+    return family, sockaddr[0]
+
+def literal(host):
+    """(семейство, адрес) для IP-адреса, записанного строкой, иначе None"""
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+        except (OSError, ValueError):
+            continue
+        return family, host
+    return None
+
+def resolve_all(hosts, timeout):
+    """Разрешение имен хостов перед проходом
+
+    Адреса берутся из кэша (RESOLVE_TTL секунд), остальные имена
+    разрешаются параллельно в фоновых потоках. Возвращает
+    ({хост: (семейство, адрес)}, [хосты без адреса]). Имя, не разрешенное
+    за timeout секунд, попадает в список без адреса, а его разрешение
+    продолжается в фоне и пригодится следующему проходу.
+    """
+    global _resolver
+    resolved = {}
+    futures = {}
+    now = time.monotonic()
+    with _resolve_lock:
+        for host in hosts:
+            address = literal(host)
+            if address is not None:
+                resolved[host] = address
+                continue
+            entry = _resolved.get(host)
+            if entry is not None and entry[2] > now:
+                resolved[host] = entry[:2]
+                continue
+            future = _lookups.get(host)
+            if future is None:
+                if _resolver is None:
+                    _resolver = ThreadPoolExecutor(RESOLVE_THREADS, thread_name_prefix="icmp-resolve")
+                future = _lookups[host] = _resolver.submit(_lookup, host)
+            futures.setdefault(future, []).append(host)
+    failed = []
+    if futures:
+        done, not_done = wait(futures, timeout)
+        for future in not_done:
+            failed.extend(futures[future])
+        for future in done:
+            try:
+                address = future.result()
+            except OSError:
+                failed.extend(futures[future])
+                continue
+            for host in futures[future]:
+                resolved[host] = address
+    return resolved, failed
+
+def _lookup(host):
+    """Разрешение имени в фоновом потоке с записью в кэш"""
+    try:
+        family, address = resolve(host)
+    finally:
+        with _resolve_lock:
+            _lookups.pop(host, None)
+    with _resolve_lock:
+        _resolved[host] = (family, address, time.monotonic() + RESOLVE_TTL)
+    return family, address
+
+def next_sequence():
+    """Следующий номер последовательности эхо-запроса"""
+    return next(_sequences) & 0xFFFF
+
+class IcmpSocket:
+    """Сокет для отправки эхо-запросов ICMP/ICMPv6 без внешней утилиты ping
+
+    Сначала пробуется непривилегированный датаграммный ICMP-сокет (Linux
+    с net.ipv4.ping_group_range, macOS), затем сырой сокет, если процессу
+    это разрешено. Если недоступно ни то, ни другое, конструктор выбрасывает
+    PermissionError.
+    """
+
+    def __init__(self, family=socket.AF_INET):
+        """Открытие сокета"""
+        self.family = family
+        self.proto = socket.IPPROTO_ICMPV6 if family == socket.AF_INET6 else socket.IPPROTO_ICMP
+        self.sock = self._open()
+        self.raw = self.sock.type == socket.SOCK_RAW
+        self.sock.setblocking(False)
+        # Для датаграммных сокетов идентификатор подставляет ядро, и оно же
+        # фильтрует чужие ответы; для сырых - различаем ответы сами
+        self.ident = next(_identifiers) & 0xFFFF if self.raw else None
+
+    def _open(self):
+        """Создание сокета первого разрешенного типа"""
+        known = _socket_types.get(self.family, ())
+        if known is None:
+            raise PermissionError("ICMP sockets are not permitted")
+        candidates = (known,) if known else (socket.SOCK_DGRAM, socket.SOCK_RAW)
+        for sock_type in candidates:
+            try:
+                sock = socket.socket(self.family, sock_type, self.proto)
+            except (PermissionError, OSError):
+                continue
+            _socket_types[self.family] = sock_type
+            return sock
+        _socket_types[self.family] = None
+        raise PermissionError("ICMP sockets are not permitted")
+
+    def fileno(self):
+        """Дескриптор сокета для select()"""
+        return self.sock.fileno()
+
+    def close(self):
+        """Закрытие сокета"""
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def send(self, address, sequence):
+        """Отправка эхо-запроса"""
+        if self.family == socket.AF_INET6:
+            # Контрольную сумму ICMPv6 всегда считает ядро
+            header = struct.pack("!BBHHH", ICMP6_ECHO_REQUEST, 0, 0, self.ident or 0, sequence)
+        else:
+            header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, self.ident or 0, sequence)
+            header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0,
+                                 checksum(header + PAYLOAD), self.ident or 0, sequence)
+        self.sock.sendto(header + PAYLOAD, (address, 0))
+
+    def receive(self):
+        """Чтение одного эхо-ответа: (адрес, номер последовательности) или None"""
+        try:
+            data, peer = self.sock.recvfrom(2048)
+        except (BlockingIOError, InterruptedError):
+            return None
+        if self.family == socket.AF_INET and data and data[0] >> 4 == 4:
+            # Сырые сокеты IPv4 (и датаграммные в macOS) отдают пакет с IP-заголовком
+            data = data[(data[0] & 0x0F) * 4:]
+        if len(data) < 8:
+            return None
+        icmp_type, _, _, ident, sequence = struct.unpack("!BBHHH", data[:8])
+        reply_type = ICMP6_ECHO_REPLY if self.family == socket.AF_INET6 else ICMP_ECHO_REPLY
+        if icmp_type != reply_type:
+            return None
+        if self.ident is not None and ident != self.ident:
+            return None
+        return peer[0], sequence
+
+    def wait(self, timeout):
+        """Ожидание готовности сокета к чтению"""
+        readable, _, _ = select.select([self.sock], [], [], max(0.0, timeout))
+        return bool(readable)
+
+def echo(host, timeout):
+    """Одиночный эхо-запрос; возвращает время ответа в секундах или None"""
+    family, address = resolve(host)
+    with IcmpSocket(family) as sock:
+        sequence = next_sequence()
+        sent = time.perf_counter()
+        sock.send(address, sequence)
+        deadline = sent + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not sock.wait(remaining):
+                return None
+            reply = sock.receive()
+            while reply is not None:
+                if reply[1] == sequence:
+                    return time.perf_counter() - sent
+                reply = sock.receive()
+
+def sweep(hosts, timeout, callback):
+    """Проверка множества хостов через один сокет на семейство адресов
+
+    Сначала разрешаются имена всех хостов (resolve_all), затем эхо-запросы
+    отправляются подряд только хостам с адресом, а ответы сопоставляются
+    по номеру последовательности и адресу. callback(host, rtt) вызывается
+    по мере прихода ответов, а для хостов без адреса или без ответа за
+    timeout секунд с момента отправки - с rtt=None. Номер
+    последовательности 16-битный, поэтому за один проход проверяется не
+    более 65535 хостов.
+
+    Возвращает список хостов, которые не удалось проверить из-за отсутствия
+    прав на ICMP-сокеты нужного семейства.
+    """
+    resolved, failed = resolve_all(hosts, timeout)
+    for host in failed:
+        callback(host, None)
+    sockets = {}
+    # Запросы в порядке отправки: первый всегда истекает раньше остальных
+    pending = {}
+    unsupported = []
+    # Семейства, для которых нет прав на ICMP-сокет: повторно сокет не создается
+    denied = set()
+    try:
+        for host in hosts:
+            if host not in resolved:
+                continue
+            family, address = resolved[host]
+            if family in denied:
+                unsupported.append(host)
+                continue
+            sock = sockets.get(family)
+            if sock is None:
+                try:
+                    sock = sockets[family] = IcmpSocket(family)
+                except PermissionError:
+                    denied.add(family)
+                    unsupported.append(host)
+                    continue
+                sock.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            sequence = next_sequence()
+            while True:
+                try:
+                    sock.send(address, sequence)
+                    break
+                except (BlockingIOError, InterruptedError):
+                    select.select([], [sock.sock], [], timeout)
+                except OSError:
+                    callback(host, None)
+                    sequence = None
+                    break
+            if sequence is not None:
+                pending[(family, sequence)] = (host, address, time.perf_counter())
+            _collect(sockets, pending, callback)
+
+        while pending:
+            key, (host, _, sent) = next(iter(pending.items()))
+            remaining = sent + timeout - time.perf_counter()
+            if remaining <= 0:
+                del pending[key]
+                callback(host, None)
+                continue
+            readable, _, _ = select.select(list(sockets.values()), [], [], remaining)
+            if readable:
+                _collect(sockets, pending, callback)
+    finally:
+        for sock in sockets.values():
+            sock.close()
+    return unsupported
+
+def _collect(sockets, pending, callback):
+    """Разбор всех уже пришедших ответов"""
+    for family, sock in sockets.items():
+        while True:
+            reply = sock.receive()
+            if reply is None:
+                if not sock.wait(0):
+                    break
+                continue
+            address, sequence = reply
+            entry = pending.get((family, sequence))
+            if entry is not None and entry[1] == address:
+                del pending[(family, sequence)]
+                callback(entry[0], time.perf_counter() - entry[2])
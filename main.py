@@ -1,17 +1,30 @@
 # main.py
 import sys
 import json
+import math
 import os
 import gettext
+import bisect
 from datetime import datetime, timedelta
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                             QHBoxLayout, QTreeWidget, QTreeWidgetItem, QLineEdit,
+                             QHBoxLayout, QTreeView, QLineEdit,
                              QLabel, QMessageBox, QInputDialog, QSlider, QScrollArea, 
-                             QFrame, QToolButton, QMenu, QPushButton, QSystemTrayIcon, 
-                             QFileDialog, QDialog, QComboBox, QDialogButtonBox, QTextEdit)
-from PyQt6.QtCore import Qt, QRect, QSettings, QPoint, QTimer, QThreadPool, QPropertyAnimation, QEasingCurve
+                             QAbstractScrollArea, QFrame, QToolButton, QMenu, QPushButton, QSystemTrayIcon, 
+                             QFileDialog, QDialog, QComboBox, QDialogButtonBox, QTextEdit,
+                             QCheckBox, QTableWidget, QTableWidgetItem, QHeaderView)
+from PyQt6.QtCore import (Qt, QModelIndex, QRect, QSettings, QPoint, QTimer, QThreadPool, QPropertyAnimation, QEasingCurve,
+                          pyqtSignal)
 from PyQt6.QtGui import QPainter, QColor, QFont, QIcon, QPixmap, QAction
-from ping_manager import PingManager, PingWorker
+from ping_manager import PingManager, NO_RTT, MIN_PROBE_THREADS, MAX_PROBE_THREADS
+from history_store import create_history_store, read_legacy_history
+from history import HostHistory
+from persistence import PersistenceScheduler
+from scheduler import ProbeScheduler, read_host_interval, MIN_HOST_INTERVAL_MS, MAX_HOST_INTERVAL_MS
+from host_state import HostState, HealthAggregator
+from host_model import HostTreeModel
+from metrics import start_exporter
+from history_loader import HistoryLoader
+import perf
 from PyQt6.QtWidgets import QGraphicsOpacityEffect
 
 def setup_localization(lang):
@@ -24,6 +37,9 @@ def setup_localization(lang):
 class TimeScaleWidget(QWidget):
     """Виджет временной шкалы для графиков"""
     
+    # Видимый период шкалы изменился
+    zoom_changed = pyqtSignal()
+    
     def __init__(self, parent=None):
         """Инициализация временной шкалы"""
         super().__init__(parent)
@@ -52,9 +68,7 @@ class TimeScaleWidget(QWidget):
         self.indicator_pos = None
         self.zoom_factor = 1.0
         self.update()
-        parent = self.parent()
-        if parent and hasattr(parent, 'update_all_graphs') and hasattr(parent, 'host_widgets'):
-            parent.update_all_graphs()
+        self.zoom_changed.emit()
         
     def add_zoom_period(self, start, end):
         """Добавление периода масштабирования"""
@@ -69,9 +83,7 @@ class TimeScaleWidget(QWidget):
             self.zoom_end = end
             self.indicator_pos = None
             self.update()
-            parent = self.parent()
-            if parent and hasattr(parent, 'update_all_graphs') and hasattr(parent, 'host_widgets'):
-                parent.update_all_graphs()
+            self.zoom_changed.emit()
     
     def wheelEvent(self, event):
         """Обработка масштабирования колесом мыши"""
@@ -104,9 +116,7 @@ class TimeScaleWidget(QWidget):
         self.zoom_start, self.zoom_end = new_start, new_end
         self.update()
         
-        parent = self.parent()
-        if parent and hasattr(parent, 'update_all_graphs') and hasattr(parent, 'host_widgets'):
-            parent.update_all_graphs()
+        self.zoom_changed.emit()
         
     def mousePressEvent(self, event):
         """Обработка нажатий мыши для установки масштаба"""
@@ -175,30 +185,41 @@ class TimeScaleWidget(QWidget):
                 step = 600
                 format_str = "%H:%M"
                 label_step = 600
-            else:
+            elif visible_seconds <= 43200:
                 step = 3600
                 format_str = "%H:%M"
                 label_step = 3600
+            elif visible_seconds <= 172800:
+                step = 3600
+                format_str = "%H:%M"
+                label_step = 21600
+            else:
+                # Отдаленный масштаб для истории по агрегатам: деления по дням
+                step = 86400
+                format_str = "%d.%m"
+                label_step = 86400 * max(1, int(visible_seconds / 86400 / 10))
                 
             current = self.zoom_start.replace(microsecond=0)
             if step < 60:
                 current = current.replace(second=(current.second // step) * step)
             elif step < 3600:
                 current = current.replace(minute=(current.minute // (step//60)) * (step//60), second=0)
+            elif step >= 86400:
+                current = current.replace(hour=0, minute=0, second=0)
             else:
                 current = current.replace(hour=(current.hour // (step//3600)) * (step//3600), minute=0, second=0)
                 
             while current <= self.zoom_end:
                 pos = int((current - self.zoom_start).total_seconds() * pixels_per_second)
                 if 0 <= pos <= width:
-                    line_height = 15 if (step < 60 and current.second % label_step == 0) or \
-                                     (step >= 60 and step < 3600 and (current.minute * 60 + current.second) % label_step == 0) or \
-                                     (step >= 3600 and (current.hour * 3600 + current.minute * 60 + current.second) % label_step == 0) else 5
+                    is_label = (step < 60 and current.second % label_step == 0) or \
+                               (step >= 60 and step < 3600 and (current.minute * 60 + current.second) % label_step == 0) or \
+                               (step >= 3600 and step < 86400 and (current.hour * 3600 + current.minute * 60 + current.second) % label_step == 0) or \
+                               (step >= 86400 and current.toordinal() % (label_step // 86400) == 0)
+                    line_height = 15 if is_label else 5
                     painter.drawLine(pos, 0, pos, line_height)
                     
-                    if (step < 60 and current.second % label_step == 0) or \
-                       (step >= 60 and step < 3600 and (current.minute * 60 + current.second) % label_step == 0) or \
-                       (step >= 3600 and (current.hour * 3600 + current.minute * 60 + current.second) % label_step == 0):
+                    if is_label:
                         text_rect = QRect(pos - 50, 20, 100, 20)
                         painter.drawText(text_rect, Qt.AlignmentFlag.AlignCenter, current.strftime(format_str))
                 current += timedelta(seconds=step)
@@ -226,6 +247,12 @@ class PingGraphWidget(QWidget):
     """Виджет для отображения графика ping"""
     
     BAR_WIDTH = 4
+    # Время ответа, до которого столбик зеленый, и после которого - оранжевый
+    LATENCY_GOOD_MS = 20
+    LATENCY_BAD_MS = 400
+    LATENCY_LEVELS = 16
+    FAILURE_COLOR = QColor("#F44336")
+    latency_palette = []
     
     def __init__(self, time_scale, host, parent=None):
         """Инициализация графика"""
@@ -233,17 +260,25 @@ class PingGraphWidget(QWidget):
         self.time_scale = time_scale
         self.host = host
         self.setMinimumHeight(60)
-        self.history = []
+        self.history = HostHistory()
         self.session_success_count = 0
         self.session_failure_count = 0
         self.app_start_time = None
-        
-    def update_history(self, history, session_success_count, session_failure_count, app_start_time):
+        self.latency_stats = None
+        self._cache = None
+        self._cache_key = None
+        self._cached_column = None
+        self._cached_first_ts = None
+        self._cached_revision = None
+        
+    def update_history(self, history, session_success_count, session_failure_count, app_start_time,
+                       latency_stats=None):
         """Обновление данных истории и статистики"""
         self.history = history
         self.session_success_count = session_success_count
         self.session_failure_count = session_failure_count
         self.app_start_time = app_start_time
+        self.latency_stats = latency_stats
         
         total_checks = self.session_success_count + self.session_failure_count
         failure_rate = (self.session_failure_count / total_checks * 100) if total_checks > 0 else 0
@@ -253,102 +288,446 @@ class PingGraphWidget(QWidget):
             f"Проваленные проверки: {self.session_failure_count}\n"
             f"Процент провалов: {failure_rate:.1f}%"
         )
+        if latency_stats and latency_stats.count:
+            p50, p95, p99 = (latency_stats.percentile(q) for q in (50, 95, 99))
+            tooltip += f"\nЗадержка p50/p95/p99: {p50:.1f} / {p95:.1f} / {p99:.1f} мс"
         self.setToolTip(tooltip)
         self.update()
         
+    @classmethod
+    def latency_color(cls, latency):
+        """Цвет успешной проверки: от зеленого к оранжевому по мере роста задержки"""
+        if not cls.latency_palette:
+            good, bad = QColor("#4CAF50"), QColor("#FF9800")
+            for level in range(cls.LATENCY_LEVELS):
+                k = level / (cls.LATENCY_LEVELS - 1)
+                cls.latency_palette.append(QColor(
+                    round(good.red() + (bad.red() - good.red()) * k),
+                    round(good.green() + (bad.green() - good.green()) * k),
+                    round(good.blue() + (bad.blue() - good.blue()) * k)))
+        if not latency > cls.LATENCY_GOOD_MS:
+            # Сюда же попадает NaN - записи без измеренной задержки
+            return cls.latency_palette[0]
+        if latency >= cls.LATENCY_BAD_MS:
+            return cls.latency_palette[-1]
+        k = math.log(latency / cls.LATENCY_GOOD_MS) / math.log(cls.LATENCY_BAD_MS / cls.LATENCY_GOOD_MS)
+        return cls.latency_palette[int(k * (cls.LATENCY_LEVELS - 1))]
+        
     def mouseDoubleClickEvent(self, event):
         """Обработка двойного клика на графике"""
-        if event.button() == Qt.MouseButton.LeftButton:
-            parent = self.parent()
-            while parent and not isinstance(parent, HostWidget):
-                parent = parent.parent()
-            if parent:
-                main_window = parent.parent()
-                while main_window and not isinstance(main_window, PingMonitor):
-                    main_window = main_window.parent()
-                if main_window:
-                    main_window.move_host_to_queue_start(self.host)
-        
-    def paintEvent(self, event):
-        """Отрисовка графика"""
-        if not self.history or not self.time_scale.start_time:
-            return
-            
-        painter = QPainter(self)
+        if event.button() == Qt.MouseButton.LeftButton and self.host:
+            main_window = self.window()
+            if isinstance(main_window, PingMonitor):
+                main_window.move_host_to_queue_start(self.host)
+        
+    def invalidate_cache(self):
+        """Сброс закешированного изображения графика"""
+        self._cache_key = None
+        self.update()
+
+    def view_geometry(self):
+        """Видимый диапазон: (start_ts, end_ts, pixels_per_second, bar_width) или None"""
+        if not self.time_scale.start_time:
+            return None
         width = self.width()
-        height = self.height()
-        
         if self.time_scale.zoom_periods:
             visible_start, visible_end = self.time_scale.zoom_periods[-1]
             visible_seconds = (visible_end - visible_start).total_seconds()
             if visible_seconds <= 0:
-                return
+                return None
             pixels_per_second = width / visible_seconds
-            
-            for timestamp, success in self.history:
-                if timestamp < visible_start or timestamp > visible_end:
-                    continue
-                    
-                pos = int((timestamp - visible_start).total_seconds() * pixels_per_second)
-                color = QColor("#4CAF50" if success else "#F44336")
-                bar_width = max(1, min(self.BAR_WIDTH, int(pixels_per_second * 1)))
-                painter.fillRect(QRect(pos - bar_width//2, 0, bar_width, height), color)
+            bar_width = max(1, min(self.BAR_WIDTH, int(pixels_per_second * 1)))
         else:
-            total_seconds = (self.time_scale.end_time - self.time_scale.start_time).total_seconds()
-            pixels_per_second = width / total_seconds
-            
-            for timestamp, success in self.history:
-                pos = int((timestamp - self.time_scale.start_time).total_seconds() * pixels_per_second)
-                color = QColor("#4CAF50" if success else "#F44336")
-                painter.fillRect(QRect(pos - self.BAR_WIDTH//2, 0, self.BAR_WIDTH, height), color)
+            visible_start, visible_end = self.time_scale.start_time, self.time_scale.end_time
+            pixels_per_second = width / (visible_end - visible_start).total_seconds()
+            bar_width = self.BAR_WIDTH
+        return visible_start.timestamp(), visible_end.timestamp(), pixels_per_second, bar_width
+
+    @perf.timed("paint")
+    def paintEvent(self, event):
+        """Отрисовка графика из закешированного изображения
+
+        Полная перерисовка выполняется только при изменении размера или
+        масштаба временной шкалы. Новые записи дорисовываются поверх кеша:
+        очищается лишь хвост от последнего нарисованного столбца.
+        """
+        if not self.history:
+            return
+        view = self.view_geometry()
+        if view is None:
+            return
+        start_ts, end_ts, pixels_per_second, bar_width = view
+        # При сильном отдалении рисуются агрегаты по минутам или часам
+        history = self.history.tier(start_ts, 1 / pixels_per_second)
+        if not history:
+            return
+        if history.resolution:
+            bar_width = max(bar_width, math.ceil(history.resolution * pixels_per_second))
+        ratio = self.devicePixelRatioF()
+        key = (self.width(), self.height(), ratio, start_ts, end_ts, history.serial)
+        first_ts = history.first_timestamp()
+        evicted = first_ts != self._cached_first_ts and first_ts > start_ts
+        
+        if self._cache is None or self._cache_key != key or evicted:
+            self._cache = QPixmap(round(self.width() * ratio), round(self.height() * ratio))
+            self._cache.setDevicePixelRatio(ratio)
+            self._cache.fill(Qt.GlobalColor.transparent)
+            cache_painter = QPainter(self._cache)
+            self._cached_column = self.render_bars(
+                cache_painter, history, start_ts, start_ts, end_ts, pixels_per_second, bar_width)
+            cache_painter.end()
+            self._cache_key = key
+        elif history.revision != self._cached_revision:
+            # Хвост перерисовывается с запасом в ширину столбика, чтобы совпасть с полной отрисовкой
+            clip_x = 0 if self._cached_column is None else max(0, self._cached_column - bar_width)
+            cache_painter = QPainter(self._cache)
+            cache_painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
+            cache_painter.fillRect(QRect(clip_x, 0, self.width() - clip_x, self.height()), Qt.GlobalColor.transparent)
+            cache_painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+            cache_painter.setClipRect(QRect(clip_x, 0, self.width() - clip_x, self.height()))
+            from_ts = max(start_ts, start_ts + (clip_x - bar_width) / pixels_per_second)
+            column = self.render_bars(cache_painter, history, start_ts, from_ts, end_ts, pixels_per_second, bar_width)
+            cache_painter.end()
+            if column is not None:
+                self._cached_column = column
+        self._cached_first_ts = first_ts
+        self._cached_revision = history.revision
+        
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self._cache)
+
+    def render_bars(self, painter, history, start_ts, from_ts, end_ts, pixels_per_second, bar_width):
+        """Отрисовка записей с from_ts по end_ts; возвращает последний нарисованный столбец"""
+        height = self.height()
+        
+        # Записи агрегируются по столбцам пикселей: худший статус и средняя
+        # задержка столбца берутся из накопленных сумм, а пустые столбцы
+        # пропускаются поиском следующей записи, поэтому стоимость
+        # отрисовки ограничена шириной виджета, а не глубиной истории.
+        success_runs = []
+        failure_columns = []
+        run_start = run_color = None
+        column = None
+        # Интервал агрегации, начавшийся до from_ts, тоже попадает в видимую область
+        i = history.bisect(from_ts - history.resolution)
+        last = history.bisect(end_ts, i)
+        if i < last:
+            # Начинаем с границы столбца, чтобы агрегаты совпадали с полной отрисовкой
+            column = int((history.timestamp(i) - start_ts) * pixels_per_second)
+            i = history.bisect(start_ts + column / pixels_per_second)
+        while i < last:
+            column = int((history.timestamp(i) - start_ts) * pixels_per_second)
+            j = history.bisect(start_ts + (column + 1) / pixels_per_second, i + 1)
+            j = min(j, last)
+            _, failures, latency = history.range_stats(i, j)
+            if failures:
+                if history.resolution:
+                    failure_columns.append(column)
+            else:
+                color = self.latency_color(latency)
+                if run_color is not None and (color is not run_color or column - run_end > bar_width):
+                    success_runs.append((run_start, run_end, run_color))
+                    run_start = None
+                if run_start is None:
+                    run_start, run_color = column, color
+                run_end = column
+            i = j
+        if run_start is not None:
+            success_runs.append((run_start, run_end, run_color))
+        
+        # Столбик записи центрируется по ее времени, а столбик агрегата начинается с начала интервала
+        half = 0 if history.resolution else bar_width // 2
+        if not history.resolution:
+            # Статус сырых записей рисуется сериями: по прямоугольнику на серию, а не на проверку;
+            # записи буфера с временем ответа закрашивают свои столбики поверх
+            for run_start, run_end, success, _ in history.runs(from_ts, end_ts):
+                if success:
+                    first = int((run_start - start_ts) * pixels_per_second)
+                    last_column = int((run_end - start_ts) * pixels_per_second)
+                    painter.fillRect(QRect(first - half, 0, last_column - first + bar_width, height),
+                                     self.latency_color(math.nan))
+                    column = last_column if column is None else max(column, last_column)
+        for first, last_column, color in success_runs:
+            painter.fillRect(QRect(first - half, 0, last_column - first + bar_width, height), color)
+        # Провалы рисуются поверх, чтобы соседние успешные столбики их не перекрывали
+        for failure_column in failure_columns:
+            painter.fillRect(QRect(failure_column - half, 0, bar_width, height), self.FAILURE_COLOR)
+        if not history.resolution:
+            for run_start, run_end, success, _ in history.runs(from_ts, end_ts):
+                if success:
+                    continue
+                first = int((run_start - start_ts) * pixels_per_second)
+                last_column = int((run_end - start_ts) * pixels_per_second)
+                painter.fillRect(QRect(first - half, 0, last_column - first + bar_width, height), self.FAILURE_COLOR)
+                column = last_column if column is None else max(column, last_column)
+        return column
 
 class HostWidget(QWidget):
-    """Виджет для отображения информации о хосте"""
+    """Строка панели графиков: имя хоста и его график
+
+    Строки не принадлежат хостам: панель привязывает их к видимым хостам
+    через bind() и переиспользует при прокрутке.
+    """
     
-    def __init__(self, host, time_scale, app_start_time, category="Default"):
-        """Инициализация виджета хоста"""
-        super().__init__()
-        self.host = host
-        self.time_scale = time_scale
-        self.category = category
-        self.ping_history = []
-        self.consecutive_failures = 0
-        self.check_type = 'icmp'
-        self.port = None
-        self.session_success_count = 0
-        self.session_failure_count = 0
-        self.app_start_time = app_start_time
+    def __init__(self, time_scale, parent=None):
+        """Инициализация строки"""
+        super().__init__(parent)
+        self.state = None
         
         layout = QVBoxLayout()
         self.setLayout(layout)
         
-        self.host_label = QLabel(host)
+        self.host_label = QLabel()
         self.host_label.setFont(QFont("Arial", 10, QFont.Weight.Bold))
-        self.graph_widget = PingGraphWidget(time_scale, host, self)
-        self.graph_widget.update_history(
-            self.ping_history, self.session_success_count, self.session_failure_count, self.app_start_time
-        )
+        self.graph_widget = PingGraphWidget(time_scale, None, self)
         
         layout.addWidget(self.host_label)
         layout.addWidget(self.graph_widget)
 
-    def update_status(self, success, current_time):
-        """Обновление статуса хоста"""
-        if not success:
-            self.consecutive_failures += 1
-            self.session_failure_count += 1
-        else:
-            self.consecutive_failures = 0
-            self.session_success_count += 1
-            
-        self.ping_history.append((current_time, success))
-        cutoff_time = current_time - timedelta(hours=48)
-        self.ping_history = [h for h in self.ping_history if h[0] > cutoff_time]
+    def bind(self, state):
+        """Привязка строки к состоянию хоста"""
+        self.state = state
+        self.host_label.setText(state.host)
+        self.graph_widget.host = state.host
+        self.refresh()
+
+    def refresh(self):
+        """Обновление графика и подсказки по состоянию хоста"""
+        state = self.state
         self.graph_widget.update_history(
-            self.ping_history, self.session_success_count, self.session_failure_count, self.app_start_time
+            state.ping_history, state.session_success_count, state.session_failure_count,
+            state.app_start_time, state.latency_stats
         )
+
+class CategorySeparator(QWidget):
+    """Строка панели графиков с названием категории"""
+    
+    def __init__(self, parent=None):
+        """Инициализация разделителя"""
+        super().__init__(parent)
+        separator = QFrame()
+        separator.setFrameShape(QFrame.Shape.HLine)
+        separator.setFrameShadow(QFrame.Shadow.Sunken)
+        
+        self.label = QLabel()
+        self.label.setFont(QFont("Arial", 10, QFont.Weight.Bold))
+        self.label.setStyleSheet("padding: 5px;")
         
-        return self.consecutive_failures
+        layout = QHBoxLayout()
+        layout.addWidget(self.label)
+        layout.addWidget(separator)
+        self.setLayout(layout)
+
+    def bind(self, category):
+        """Привязка разделителя к категории"""
+        self.label.setText(f"[{category}]")
+
+class GraphPanel(QAbstractScrollArea):
+    """Виртуализированная панель графиков
+
+    Панель хранит только список строк (разделители категорий и хосты) и
+    их вертикальные смещения. Виджеты создаются лишь для строк, попадающих
+    в видимую область, и при прокрутке переиспользуются для других хостов,
+    поэтому число живых виджетов зависит от высоты окна, а не от числа хостов.
+    """
+    
+    ROW_HEIGHT = 100
+    SEPARATOR_HEIGHT = 40
+    
+    def __init__(self, time_scale, host_states, parent=None):
+        """Инициализация панели"""
+        super().__init__(parent)
+        self.time_scale = time_scale
+        self.host_states = host_states
+        self.rows = []
+        self._offsets = [0]
+        self._host_rows = {}
+        self._bound = {}
+        self._separators = {}
+        self._free_rows = []
+        self._free_separators = []
+        self.verticalScrollBar().valueChanged.connect(self.layout_rows)
+        time_scale.zoom_changed.connect(self.update_graphs)
+
+    def set_rows(self, rows):
+        """Замена списка строк: (категория, None) для разделителя или (категория, хост)"""
+        if rows == self.rows:
+            return
+        self.rows = rows
+        self._offsets = [0]
+        self._host_rows = {}
+        for index, (_, host) in enumerate(rows):
+            if host is not None:
+                self._host_rows[host] = index
+            self._offsets.append(self._offsets[-1] + (self.ROW_HEIGHT if host is not None else self.SEPARATOR_HEIGHT))
+        # Привязанные строки могли смениться хостами с тем же именем, но другим состоянием
+        for host, widget in self._bound.items():
+            if self.host_states.get(host) is not widget.state and host in self.host_states:
+                widget.bind(self.host_states[host])
+        self.update_scroll_range()
+        self.layout_rows()
+
+    def update_scroll_range(self):
+        """Настройка полосы прокрутки под общую высоту строк"""
+        scroll_bar = self.verticalScrollBar()
+        page = self.viewport().height()
+        scroll_bar.setRange(0, max(0, self._offsets[-1] - page))
+        scroll_bar.setPageStep(page)
+        scroll_bar.setSingleStep(self.ROW_HEIGHT // 4)
+
+    def resizeEvent(self, event):
+        """Пересчет видимых строк при изменении размера"""
+        super().resizeEvent(event)
+        self.update_scroll_range()
+        self.layout_rows()
+
+    def layout_rows(self):
+        """Привязка и размещение виджетов для строк в видимой области"""
+        top = self.verticalScrollBar().value()
+        height = self.viewport().height()
+        width = self.viewport().width()
+        first = max(0, bisect.bisect_right(self._offsets, top) - 1)
+        last = bisect.bisect_left(self._offsets, top + height)
+        visible = range(first, min(last, len(self.rows)))
+        
+        hosts = {self.rows[i][1] for i in visible if self.rows[i][1] is not None}
+        categories = {self.rows[i][0] for i in visible if self.rows[i][1] is None}
+        for host in [h for h in self._bound if h not in hosts]:
+            widget = self._bound.pop(host)
+            widget.hide()
+            self._free_rows.append(widget)
+        for category in [c for c in self._separators if c not in categories]:
+            separator = self._separators.pop(category)
+            separator.hide()
+            self._free_separators.append(separator)
+        
+        for i in visible:
+            category, host = self.rows[i]
+            if host is None:
+                widget = self._separators.get(category)
+                if widget is None:
+                    widget = self._free_separators.pop() if self._free_separators else CategorySeparator(self.viewport())
+                    widget.bind(category)
+                    self._separators[category] = widget
+            else:
+                widget = self._bound.get(host)
+                if widget is None:
+                    widget = self._free_rows.pop() if self._free_rows else HostWidget(self.time_scale, self.viewport())
+                    widget.bind(self.host_states[host])
+                    self._bound[host] = widget
+            widget.setGeometry(0, self._offsets[i] - top, width, self._offsets[i + 1] - self._offsets[i])
+            widget.show()
+
+    def refresh_host(self, host):
+        """Обновление строки хоста, если она сейчас видна"""
+        widget = self._bound.get(host)
+        if widget:
+            widget.refresh()
+
+    def update_graphs(self):
+        """Перерисовка видимых графиков"""
+        for widget in self._bound.values():
+            widget.graph_widget.update()
+
+    def scroll_to_host(self, host):
+        """Прокрутка к строке хоста; возвращает ее виджет или None"""
+        index = self._host_rows.get(host)
+        if index is None:
+            return None
+        scroll_bar = self.verticalScrollBar()
+        top, bottom = self._offsets[index], self._offsets[index + 1]
+        if top < scroll_bar.value():
+            scroll_bar.setValue(top)
+        elif bottom > scroll_bar.value() + self.viewport().height():
+            scroll_bar.setValue(bottom - self.viewport().height())
+        self.layout_rows()
+        return self._bound.get(host)
+
+class PerformanceDialog(QDialog):
+    """Окно замеров этапов обработки проверок (модуль perf)"""
+
+    COLUMNS = ("count", "mean", "p50", "p95", "p99", "max")
+
+    def __init__(self, translate, parent=None):
+        """Инициализация окна"""
+        super().__init__(parent)
+        self._ = translate
+        self.setWindowTitle(self._("Performance"))
+        self.resize(720, 340)
+        layout = QVBoxLayout(self)
+
+        self.enabled_box = QCheckBox(self._("Enable measurements"))
+        self.enabled_box.setChecked(perf.enabled)
+        self.enabled_box.toggled.connect(self.toggle_enabled)
+        layout.addWidget(self.enabled_box)
+
+        self.table = QTableWidget(len(perf.STAGES), len(self.COLUMNS) + 1)
+        self.table.setHorizontalHeaderLabels(
+            [self._("Stage"), self._("Count"), self._("Mean, ms"), "p50, ms", "p95, ms", "p99, ms", self._("Max, ms")])
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for row, (_, description) in enumerate(perf.STAGES):
+            self.table.setItem(row, 0, QTableWidgetItem(self._(description)))
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        reset_button = QPushButton(self._("Reset"))
+        reset_button.clicked.connect(self.reset)
+        save_button = QPushButton(self._("Save to File"))
+        save_button.clicked.connect(self.save)
+        close_button = QPushButton(self._("Close"))
+        close_button.clicked.connect(self.close)
+        buttons.addWidget(reset_button)
+        buttons.addWidget(save_button)
+        buttons.addStretch()
+        buttons.addWidget(close_button)
+        layout.addLayout(buttons)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.refresh()
+
+    def toggle_enabled(self, enabled):
+        """Включение или выключение замеров"""
+        perf.set_enabled(enabled)
+        self.parent().persistence.mark_dirty(PersistenceScheduler.SETTINGS)
+
+    def refresh(self):
+        """Обновление таблицы сводками этапов"""
+        snapshot = perf.snapshot()
+        for row, (stage, _) in enumerate(perf.STAGES):
+            summary = snapshot[stage]
+            for column, name in enumerate(self.COLUMNS, 1):
+                value = summary[name]
+                if value is None:
+                    text = "-"
+                elif name == "count":
+                    text = str(value)
+                else:
+                    text = f"{value:.3f}"
+                item = QTableWidgetItem(text)
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.table.setItem(row, column, item)
+
+    def reset(self):
+        """Сброс накопленных замеров"""
+        perf.reset()
+        self.refresh()
+
+    def save(self):
+        """Запись замеров в файл JSON"""
+        path, _ = QFileDialog.getSaveFileName(
+            self, self._("Save Performance Data"), "qping-perf.json", "JSON (*.json)")
+        if not path:
+            return
+        try:
+            perf.dump(path)
+        except OSError as e:
+            QMessageBox.critical(
+                self, self._("Save error"),
+                self._("Failed to write file: {}").format(str(e)))
 
 class PingMonitor(QMainWindow):
     """Главное окно приложения Ping Monitor"""
@@ -366,6 +745,9 @@ class PingMonitor(QMainWindow):
         self.notifications_enabled = self.settings.value("notifications_enabled", True, type=bool)
         self.is_quitting = False
         self.filter_failed = self.settings.value("filter_failed", False, type=bool)
+        self.sweep_mode = self.settings.value("sweep_mode", False, type=bool)
+        perf.set_enabled(self.settings.value("perf_enabled", False, type=bool))
+        self.performance_dialog = None
         
         self.green_icon = self.create_icon("#4CAF50")
         self.yellow_icon = self.create_icon("#FFEB3B")
@@ -391,46 +773,80 @@ class PingMonitor(QMainWindow):
         self.setWindowFlags(Qt.WindowType.Window | Qt.WindowType.WindowMinimizeButtonHint | Qt.WindowType.WindowCloseButtonHint)
         
         self.time_scale = TimeScaleWidget(self)
-        self.host_list = QTreeWidget()
+        self.host_states = {}
+        self.failed_hosts = set()
+        self.health = HealthAggregator()
+        self.health_state = HealthAggregator.GREEN
+        self.hidden_hosts = set()
+        self.host_model = HostTreeModel(self.host_states, self)
+        self.host_model.hosts_moved.connect(self.handle_host_moved)
+        self.host_model.rowsInserted.connect(self.handle_host_rows_inserted)
+        self.host_model.modelReset.connect(self.handle_host_model_reset)
+        self.host_list = QTreeView()
+        self.host_list.setModel(self.host_model)
         self.host_list.setHeaderHidden(True)
-        self.host_list.setDragDropMode(QTreeWidget.DragDropMode.InternalMove)
-        self.host_list.setSelectionMode(QTreeWidget.SelectionMode.MultiSelection)
+        self.host_list.setDragDropMode(QTreeView.DragDropMode.InternalMove)
+        self.host_list.setSelectionMode(QTreeView.SelectionMode.MultiSelection)
         self.host_list.setDragEnabled(True)
         self.host_list.setAcceptDrops(True)
         self.host_list.setDropIndicatorShown(True)
-        self.host_list.itemDoubleClicked.connect(self.scroll_to_host_widget)
+        self.host_list.doubleClicked.connect(self.scroll_to_host_widget)
         self.host_list.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.host_list.customContextMenuRequested.connect(self.show_host_context_menu)
-        self.host_list.model().rowsMoved.connect(self.handle_host_moved)
         
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
+        self.graph_panel = GraphPanel(self.time_scale, self.host_states)
+        self.time_scale.zoom_changed.connect(self.ensure_history_loaded)
         
-        self.host_widgets = {}
         self.current_pinging_host = None
         self.host_queue = []
-        self.current_host_index = 0
         self.host_check_types = {}
+        self.host_intervals = {}
+        self.category_intervals = {}
+        self.scheduler = ProbeScheduler()
         self.highlight_animation = None
-        
-        saved_interval = self.settings.value("interval", 500, type=int)
-        
-        self.thread_pool = QThreadPool()
-        self.thread_pool.setMaxThreadCount(10)
-        
-        self.ping_manager = PingManager(saved_interval)
+        # Слежение за журналом, когда хосты проверяет фоновый монитор (qping.py --headless)
+        self.viewer = None
+        self.viewer_timer = QTimer()
+        self.viewer_timer.timeout.connect(self.poll_viewer)
+        # История загружается в фоне: сначала окно шкалы по умолчанию, полностью - при отдалении;
+        # history_since - начало запрошенной загрузки (None - вся история)
+        self.history_since = None
+        self.history_loading = False
+        self.full_history_requested = False
+        
+        saved_interval = read_host_interval(self.settings)
+        
+        self.history_store = create_history_store(self.settings)
+        self.persistence = PersistenceScheduler(
+            self.save_data, self.save_settings, self.history_store,
+            self.settings.value("flush_interval_ms", 5000, type=int), parent=self)
+        
+        self.ping_manager = PingManager(
+            saved_interval, self.settings.value("timeout_ms", 1000, type=int),
+            self.settings.value("probe_threads_min", MIN_PROBE_THREADS, type=int),
+            self.settings.value("probe_threads_max", MAX_PROBE_THREADS, type=int))
         self.ping_manager.ping_result.connect(self.handle_ping_result)
+        self.ping_manager.saturation_changed.connect(self.show_saturation)
+        self.metrics = start_exporter(self.settings, self.ping_manager)
         
         self.ping_timer = QTimer()
+        self.ping_timer.setSingleShot(True)
+        self.ping_timer.setTimerType(Qt.TimerType.PreciseTimer)
         self.ping_timer.timeout.connect(self.ping_next_host)
         
+        # Перестроение строк панели графиков после изменения видимости откладывается и объединяется
+        self.reorder_timer = QTimer()
+        self.reorder_timer.setSingleShot(True)
+        self.reorder_timer.setInterval(100)
+        self.reorder_timer.timeout.connect(self.reorder_graphs)
+        
         self.setup_ui()
         self.load_data()
         self.interval_slider.setValue(saved_interval)
         self.update_interval(saved_interval)
         self.time_scale.reset_zoom()
         
-        if self.host_widgets:
+        if self.host_states:
             self.start_pinging()
 
     def create_icon(self, color):
@@ -442,6 +858,12 @@ class PingMonitor(QMainWindow):
     def quit_application(self):
         """Обработка выхода из приложения"""
         self.is_quitting = True
+        self.ping_timer.stop()
+        self.ping_manager.stop()
+        if self.metrics:
+            self.metrics.stop()
+        self.persistence.flush()
+        self.history_store.close()
         QApplication.quit()
 
     def closeEvent(self, event):
@@ -449,6 +871,7 @@ class PingMonitor(QMainWindow):
         if not self.is_quitting:
             event.ignore()
             self.hide()
+            self.persistence.flush()
         else:
             event.accept()
 
@@ -463,13 +886,13 @@ class PingMonitor(QMainWindow):
         if reason == QSystemTrayIcon.ActivationReason.DoubleClick:
             self.restore_window()
 
-    def scroll_to_host_widget(self, item, column):
+    def scroll_to_host_widget(self, index):
         """Прокрутка к виджету хоста и запуск анимации выделения"""
-        host = item.data(0, Qt.ItemDataRole.UserRole)
-        if host and host in self.host_widgets:
-            widget = self.host_widgets[host]
-            self.scroll_area.ensureWidgetVisible(widget)
-            self.start_highlight_animation(widget)
+        if index.parent().isValid():
+            host = self.host_model.host_at(index)
+            widget = self.graph_panel.scroll_to_host(host)
+            if widget:
+                self.start_highlight_animation(widget)
 
     def start_highlight_animation(self, widget):
         """Запуск анимации выделения виджета хоста"""
@@ -493,61 +916,44 @@ class PingMonitor(QMainWindow):
 
         self.highlight_animation.finished.connect(cleanup)
 
-    def handle_host_moved(self, parent, start, end, destination, row):
-        """Обработка перемещения хоста в списке"""
+    def handle_host_moved(self, hosts, category):
+        """Обработка перемещения хостов в списке"""
         self.update_host_queue()
         self.reorder_graphs()
-        self.save_data()
+        self.persistence.mark_dirty(PersistenceScheduler.INVENTORY)
+        self.apply_filter()
 
-    def add_category_separator(self, category):
-        """Добавление разделителя категории в right_panel_layout"""
-        separator = QFrame()
-        separator.setFrameShape(QFrame.Shape.HLine)
-        separator.setFrameShadow(QFrame.Shadow.Sunken)
-        
-        label = QLabel(f"[{category}]")
-        label.setFont(QFont("Arial", 10, QFont.Weight.Bold))
-        label.setStyleSheet("padding: 5px;")
-        
-        container = QWidget()
-        container_layout = QHBoxLayout()
-        container_layout.addWidget(label)
-        container_layout.addWidget(separator)
-        container.setLayout(container_layout)
-        
-        return container
+    def handle_host_rows_inserted(self, parent, first, last):
+        """Новые строки дерева видимы: раскрытие категорий и сброс скрытия хостов"""
+        if not parent.isValid():
+            for row in range(first, last + 1):
+                self.host_list.expand(self.host_model.index(row, 0))
+            return
+        for row in range(first, last + 1):
+            self.hidden_hosts.discard(self.host_model.host_at(self.host_model.index(row, 0, parent)))
+
+    def handle_host_model_reset(self):
+        """Раскрытие всех категорий после перестроения модели"""
+        self.hidden_hosts.clear()
+        self.host_list.expandAll()
 
     def reorder_graphs(self):
-        """Переупорядочивание виджетов графиков с разделением по категориям"""
-        for i in reversed(range(self.right_panel_layout.count())):
-            widget = self.right_panel_layout.itemAt(i).widget()
-            if widget:
-                self.right_panel_layout.removeWidget(widget)
-                widget.setParent(None)
-        
-        categories = sorted(set(widget.category for widget in self.host_widgets.values()))
-        for category in categories:
-            separator = self.add_category_separator(category)
-            self.right_panel_layout.addWidget(separator)
-            def traverse_items(parent_item):
-                for i in range(parent_item.childCount()):
-                    child = parent_item.child(i)
-                    host = child.data(0, Qt.ItemDataRole.UserRole)
-                    if host and host in self.host_widgets and self.host_widgets[host].category == category:
-                        self.right_panel_layout.addWidget(self.host_widgets[host])
-            
-            for i in range(self.host_list.topLevelItemCount()):
-                category_item = self.host_list.topLevelItem(i)
-                if category_item.data(0, Qt.ItemDataRole.UserRole) == category:
-                    traverse_items(category_item)
+        """Перестроение строк панели графиков по категориям с учетом фильтра"""
+        self.reorder_timer.stop()
+        rows = []
+        for category in self.host_model.categories:
+            hosts = [host for host in self.host_model.category_hosts[category] if host not in self.hidden_hosts]
+            if hosts:
+                rows.append((category, None))
+                rows.extend((category, host) for host in hosts)
+        self.graph_panel.set_rows(rows)
 
     def move_host_to_queue_start(self, host):
-        """Временное перемещение хоста в начало очереди проверки без изменения порядка списка"""
-        if host not in self.host_queue:
+        """Внеочередная проверка хоста без изменения порядка списка"""
+        if self.viewer or host not in self.scheduler:
+            # В режиме просмотра хосты проверяет фоновый монитор
             return
-        self.host_queue.remove(host)
-        self.host_queue.insert(0, host)
-        self.current_host_index = 0
+        self.scheduler.trigger(host)
         self.ping_next_host()
 
     def setup_ui(self):
@@ -558,19 +964,7 @@ class PingMonitor(QMainWindow):
         layout = QVBoxLayout()
         central_widget.setLayout(layout)
         
-        menu_bar = self.menuBar()
-        help_menu = menu_bar.addMenu(self._("Help"))
-        help_action = QAction(self._("User Guide"), self)
-        help_action.triggered.connect(self.show_help)
-        help_menu.addAction(help_action)
-        
-        language_menu = menu_bar.addMenu(self._("Language"))
-        ru_action = QAction("Русский", self)
-        en_action = QAction("English", self)
-        ru_action.triggered.connect(lambda: self.change_language("ru"))
-        en_action.triggered.connect(lambda: self.change_language("en"))
-        language_menu.addAction(ru_action)
-        language_menu.addAction(en_action)
+        self.setup_menu_bar()
         
         control_panel = QWidget()
         control_layout = QHBoxLayout()
@@ -586,8 +980,9 @@ class PingMonitor(QMainWindow):
         self.import_button.clicked.connect(self.import_hosts_from_file)
         
         self.interval_slider = QSlider(Qt.Orientation.Horizontal)
-        self.interval_slider.setRange(100, 5000)
-        self.interval_slider.setTickInterval(100)
+        self.interval_slider.setRange(MIN_HOST_INTERVAL_MS, MAX_HOST_INTERVAL_MS)
+        self.interval_slider.setSingleStep(500)
+        self.interval_slider.setPageStep(10000)
         self.interval_slider.valueChanged.connect(self.update_interval)
         
         self.interval_label = QLabel(self._("Interval: {}ms").format(self.interval_slider.value()))
@@ -625,18 +1020,50 @@ class PingMonitor(QMainWindow):
         right_panel.setLayout(right_layout)
         
         right_layout.addWidget(self.time_scale)
-        right_layout.addWidget(self.scroll_area)
-        
-        scroll_content = QWidget()
-        self.right_panel_layout = QVBoxLayout()
-        scroll_content.setLayout(self.right_panel_layout)
-        self.scroll_area.setWidget(scroll_content)
+        right_layout.addWidget(self.graph_panel)
         
         main_panel.addWidget(left_panel, 25)
         main_panel.addWidget(right_panel, 75)
         
         layout.addWidget(control_panel)
         layout.addLayout(main_panel)
+        
+        # Предупреждение о нехватке потоков проверки, показывается только при насыщении
+        self.saturation_label = QLabel(self._("Probe engine saturated: checks are delayed"))
+        self.saturation_label.setStyleSheet("color: #F44336;")
+        self.saturation_label.setVisible(False)
+        self.statusBar().addPermanentWidget(self.saturation_label)
+
+    def setup_menu_bar(self):
+        """Настройка главного меню"""
+        menu_bar = self.menuBar()
+        help_menu = menu_bar.addMenu(self._("Help"))
+        help_action = QAction(self._("User Guide"), self)
+        help_action.triggered.connect(self.show_help)
+        help_menu.addAction(help_action)
+        performance_action = QAction(self._("Performance"), self)
+        performance_action.triggered.connect(self.show_performance)
+        help_menu.addAction(performance_action)
+        
+        language_menu = menu_bar.addMenu(self._("Language"))
+        ru_action = QAction("Русский", self)
+        en_action = QAction("English", self)
+        ru_action.triggered.connect(lambda: self.change_language("ru"))
+        en_action.triggered.connect(lambda: self.change_language("en"))
+        language_menu.addAction(ru_action)
+        language_menu.addAction(en_action)
+        
+        settings_menu = menu_bar.addMenu(self._("Settings"))
+        sweep_action = QAction(self._("ICMP Sweep Mode"), self)
+        sweep_action.setCheckable(True)
+        sweep_action.setChecked(self.sweep_mode)
+        sweep_action.toggled.connect(self.toggle_sweep_mode)
+        settings_menu.addAction(sweep_action)
+
+    def toggle_sweep_mode(self, enabled):
+        """Переключение групповой ICMP-проверки всех хостов за один проход"""
+        self.sweep_mode = enabled
+        self.persistence.mark_dirty(PersistenceScheduler.SETTINGS)
 
     def toggle_notifications(self):
         """Переключение уведомлений"""
@@ -644,7 +1071,7 @@ class PingMonitor(QMainWindow):
         self.mute_button.setText(
             self._("Notifications: On" if self.notifications_enabled else "Notifications: Off")
         )
-        self.settings.setValue("notifications_enabled", self.notifications_enabled)
+        self.persistence.mark_dirty(PersistenceScheduler.SETTINGS)
 
     def toggle_filter(self):
         """Переключение режима фильтрации"""
@@ -652,29 +1079,49 @@ class PingMonitor(QMainWindow):
         self.filter_button.setText(
             self._("Show Failed Hosts" if not self.filter_failed else "Show All Hosts")
         )
-        self.settings.setValue("filter_failed", self.filter_failed)
+        self.persistence.mark_dirty(PersistenceScheduler.SETTINGS)
         self.apply_filter()
 
+    @perf.timed("apply_filter")
     def apply_filter(self):
         """Применение фильтра для отображения хостов"""
-        for i in range(self.host_list.topLevelItemCount()):
-            category_item = self.host_list.topLevelItem(i)
+        changed = False
+        for category in self.host_model.categories:
+            category_index = self.host_model.category_index(category)
             visible_hosts = 0
-            for j in range(category_item.childCount()):
-                host_item = category_item.child(j)
-                host = host_item.data(0, Qt.ItemDataRole.UserRole)
-                widget = self.host_widgets.get(host)
-                if not widget:
-                    continue
-                should_show = True
-                if self.filter_failed:
-                    should_show = (len(widget.ping_history) > 0 and not widget.ping_history[-1][1])
-                host_item.setHidden(not should_show)
-                widget.setVisible(should_show)
+            for row, host in enumerate(self.host_model.category_hosts[category]):
+                should_show = not self.filter_failed or host in self.failed_hosts
+                if (host in self.hidden_hosts) == should_show:
+                    self.host_list.setRowHidden(row, category_index, not should_show)
+                    if should_show:
+                        self.hidden_hosts.discard(host)
+                    else:
+                        self.hidden_hosts.add(host)
+                    changed = True
                 if should_show:
                     visible_hosts += 1
-            category_item.setText(0, f"[{category_item.data(0, Qt.ItemDataRole.UserRole)}] ({visible_hosts})")
-            category_item.setHidden(visible_hosts == 0)
+            self.host_model.set_visible_count(category, visible_hosts)
+            if self.host_list.isRowHidden(category_index.row(), QModelIndex()) != (visible_hosts == 0):
+                self.host_list.setRowHidden(category_index.row(), QModelIndex(), visible_hosts == 0)
+        if changed:
+            self.reorder_graphs()
+
+    def update_host_visibility(self, host):
+        """Пересчет видимости одного хоста и счетчика его категории"""
+        should_show = not self.filter_failed or host in self.failed_hosts
+        if (host in self.hidden_hosts) != should_show:
+            return
+        category = self.host_states[host].category
+        category_index = self.host_model.category_index(category)
+        self.host_list.setRowHidden(self.host_model.host_index(host).row(), category_index, not should_show)
+        if should_show:
+            self.hidden_hosts.discard(host)
+        else:
+            self.hidden_hosts.add(host)
+        visible_hosts = self.host_model.visible_counts.get(category, 0) + (1 if should_show else -1)
+        self.host_model.set_visible_count(category, visible_hosts)
+        self.host_list.setRowHidden(category_index.row(), QModelIndex(), visible_hosts == 0)
+        self.reorder_timer.start()
 
     def show_help(self):
         """Показать прокручиваемое руководство пользователя"""
@@ -740,16 +1187,29 @@ class PingMonitor(QMainWindow):
         help_dialog.setLayout(layout)
         help_dialog.exec()
 
+    def show_performance(self):
+        """Показать окно замеров производительности"""
+        if self.performance_dialog is not None:
+            self.performance_dialog.close()
+        self.performance_dialog = PerformanceDialog(self._, self)
+        self.performance_dialog.show()
+
     def change_language(self, lang):
         """Изменение языка интерфейса"""
         self.language = lang
         self._ = setup_localization(lang)
-        self.settings.setValue("language", lang)
+        self.persistence.mark_dirty(PersistenceScheduler.SETTINGS)
         self.retranslate_ui()
 
+    def window_title(self):
+        """Заголовок окна с учетом режима просмотра"""
+        if self.viewer:
+            return self._("Ping Monitor (viewer)")
+        return self._("Ping Monitor")
+
     def retranslate_ui(self):
         """Обновление текстов интерфейса при смене языка"""
-        self.setWindowTitle(self._("Ping Monitor"))
+        self.setWindowTitle(self.window_title())
         self.host_input.setPlaceholderText(self._("Enter IP/domain"))
         self.add_button.setText(self._("Add Host"))
         self.import_button.setText(self._("Import from File"))
@@ -760,19 +1220,9 @@ class PingMonitor(QMainWindow):
         self.filter_button.setText(
             self._("Show Failed Hosts" if not self.filter_failed else "Show All Hosts")
         )
-        menu_bar = self.menuBar()
-        menu_bar.clear()
-        help_menu = menu_bar.addMenu(self._("Help"))
-        help_action = QAction(self._("User Guide"), self)
-        help_action.triggered.connect(self.show_help)
-        help_menu.addAction(help_action)
-        language_menu = menu_bar.addMenu(self._("Language"))
-        ru_action = QAction("Русский", self)
-        en_action = QAction("English", self)
-        ru_action.triggered.connect(lambda: self.change_language("ru"))
-        en_action.triggered.connect(lambda: self.change_language("en"))
-        language_menu.addAction(ru_action)
-        language_menu.addAction(en_action)
+        self.saturation_label.setText(self._("Probe engine saturated: checks are delayed"))
+        self.menuBar().clear()
+        self.setup_menu_bar()
         self.tray_icon.setContextMenu(None)
         tray_menu = QMenu()
         restore_action = QAction(self._("Restore"), self)
@@ -782,15 +1232,14 @@ class PingMonitor(QMainWindow):
         tray_menu.addAction(restore_action)
         tray_menu.addAction(quit_action)
         self.tray_icon.setContextMenu(tray_menu)
-        self.update_host_list_display()
 
     def show_host_context_menu(self, position):
         """Показать контекстное меню для хоста"""
-        selected_items = self.host_list.selectedItems()
         menu = QMenu()
         
-        selected_hosts = [item.data(0, Qt.ItemDataRole.UserRole) for item in selected_items 
-                         if item.data(0, Qt.ItemDataRole.UserRole)]
+        selected_hosts = [self.host_model.host_at(index)
+                          for index in self.host_list.selectionModel().selectedIndexes()
+                          if index.parent().isValid()]
         
         if selected_hosts:
             edit_action = QAction(self._("Edit"), self)
@@ -813,15 +1262,26 @@ class PingMonitor(QMainWindow):
             set_category_action = QAction(self._("Set Category"), self)
             set_category_action.triggered.connect(lambda: self.set_host_category(selected_hosts))
             
+            set_interval_action = QAction(self._("Set Interval"), self)
+            set_interval_action.triggered.connect(lambda: self.set_hosts_interval(selected_hosts))
+            
             menu.addAction(edit_action)
             menu.addAction(delete_action)
             menu.addMenu(check_type_menu)
             menu.addAction(set_category_action)
+            menu.addAction(set_interval_action)
         else:
             import_action = QAction(self._("Import from File"), self)
             import_action.triggered.connect(self.import_hosts_from_file)
             menu.addAction(import_action)
         
+        clicked_index = self.host_list.indexAt(position)
+        if clicked_index.isValid() and not clicked_index.parent().isValid():
+            category = self.host_model.categories[clicked_index.row()]
+            category_interval_action = QAction(self._("Set Category Interval"), self)
+            category_interval_action.triggered.connect(lambda: self.set_category_interval(category))
+            menu.addAction(category_interval_action)
+        
         menu.exec(self.host_list.mapToGlobal(position))
 
     def set_check_type(self, host, check_type):
@@ -836,9 +1296,40 @@ class PingMonitor(QMainWindow):
             self.host_check_types[host] = {'type': 'tcp', 'port': port}
         else:
             self.host_check_types[host] = {'type': 'icmp', 'port': None}
-        self.save_data()
+        self.persistence.mark_dirty(PersistenceScheduler.INVENTORY)
         self.apply_filter()
 
+    def ask_interval(self, current):
+        """Запрос интервала проверки в мс; 0 - интервал по умолчанию"""
+        return QInputDialog.getInt(
+            self, self._("Check Interval"), self._("Check interval, ms (0 = default):"),
+            value=current or 0, min=0, max=3600000, step=100)
+
+    def set_hosts_interval(self, hosts):
+        """Установка собственного интервала проверки для хостов"""
+        interval, ok = self.ask_interval(self.host_intervals.get(hosts[0]))
+        if not ok:
+            return
+        for host in hosts:
+            if interval:
+                self.host_intervals[host] = interval
+            else:
+                self.host_intervals.pop(host, None)
+        self.persistence.mark_dirty(PersistenceScheduler.INVENTORY)
+        self.update_host_queue()
+
+    def set_category_interval(self, category):
+        """Установка интервала проверки для всех хостов категории"""
+        interval, ok = self.ask_interval(self.category_intervals.get(category))
+        if not ok:
+            return
+        if interval:
+            self.category_intervals[category] = interval
+        else:
+            self.category_intervals.pop(category, None)
+        self.persistence.mark_dirty(PersistenceScheduler.INVENTORY)
+        self.update_host_queue()
+
     def set_host_category(self, hosts):
         """Установка категории для одного или нескольких хостов"""
         from PyQt6.QtWidgets import QDialog, QVBoxLayout, QComboBox, QLineEdit, QDialogButtonBox
@@ -880,7 +1371,7 @@ class PingMonitor(QMainWindow):
                 return self.combo.currentText()
         
         # Получаем существующие категории, включая "Default"
-        existing_categories = sorted(set(widget.category for widget in self.host_widgets.values()))
+        existing_categories = sorted(set(state.category for state in self.host_states.values()))
         if "Default" not in existing_categories:
             existing_categories.append("Default")
         dialog = CategoryDialog(self, existing_categories)
@@ -889,12 +1380,12 @@ class PingMonitor(QMainWindow):
             category = dialog.get_category()
             if category:
                 for host in hosts:
-                    if host in self.host_widgets:
-                        self.host_widgets[host].category = category
-                self.update_host_list_display()
+                    if host in self.host_states:
+                        self.host_model.set_category(host, category)
                 self.reorder_graphs()
-                self.save_data()
+                self.persistence.mark_dirty(PersistenceScheduler.INVENTORY)
                 self.apply_filter()
+                self.update_host_queue()
 
     def delete_hosts(self, hosts):
         """Удаление нескольких хостов из мониторинга"""
@@ -904,46 +1395,22 @@ class PingMonitor(QMainWindow):
         
         if reply == QMessageBox.StandardButton.Yes:
             for host in hosts:
-                if host in self.host_widgets:
-                    self.host_widgets[host].deleteLater()
-                    del self.host_widgets[host]
-            self.update_host_list_display()
+                if host in self.host_states:
+                    self.host_model.remove_host(host)
+                    self.hidden_hosts.discard(host)
+                    self.failed_hosts.discard(host)
+                    self.health.remove(host)
+                    del self.host_states[host]
+                    self.host_intervals.pop(host, None)
+                    self.history_store.drop_host(host)
+                    self.ping_manager.forget(host)
+                    if self.metrics:
+                        self.metrics.remove(host)
             self.reorder_graphs()
-            self.save_data()
+            self.persistence.mark_dirty(PersistenceScheduler.INVENTORY)
             self.apply_filter()
+            self.update_app_icon()
             self.update_host_queue()
-            
-            if not self.host_widgets:
-                self.ping_timer.stop()
-
-    def update_host_list_display(self):
-        """Обновление отображения дерева хостов с категориями"""
-        self.host_list.clear()
-        categories = sorted(set(widget.category for widget in self.host_widgets.values()))
-        for category in categories:
-            category_item = QTreeWidgetItem(self.host_list)
-            category_item.setText(0, f"[{category}] (0)")
-            category_item.setData(0, Qt.ItemDataRole.UserRole, category)
-            category_item.setFlags(Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsDropEnabled)
-            category_item.setBackground(0, QColor("#E0E0E0"))
-            category_item.setExpanded(True)
-            self.host_list.addTopLevelItem(category_item)
-        
-        for host, widget in sorted(self.host_widgets.items()):
-            for i in range(self.host_list.topLevelItemCount()):
-                category_item = self.host_list.topLevelItem(i)
-                if category_item.data(0, Qt.ItemDataRole.UserRole) == widget.category:
-                    host_item = QTreeWidgetItem(category_item)
-                    host_item.setText(0, host)
-                    host_item.setData(0, Qt.ItemDataRole.UserRole, host)
-                    host_item.setFlags(Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | 
-                                     Qt.ItemFlag.ItemIsDragEnabled)
-                    category_item.addChild(host_item)
-        
-        for i in range(self.host_list.topLevelItemCount()):
-            category_item = self.host_list.topLevelItem(i)
-            visible_hosts = sum(1 for j in range(category_item.childCount()) if not category_item.child(j).isHidden())
-            category_item.setText(0, f"[{category_item.data(0, Qt.ItemDataRole.UserRole)}] ({visible_hosts})")
 
     def import_hosts_from_file(self):
         """Импорт списка хостов из файла"""
@@ -956,20 +1423,16 @@ class PingMonitor(QMainWindow):
                     hosts = [line.strip() for line in f if line.strip()]
                     added = 0
                     for host in hosts:
-                        if host and host not in self.host_widgets:
-                            widget = HostWidget(host, self.time_scale, self.app_start_time)
-                            self.host_widgets[host] = widget
+                        if host and host not in self.host_states:
+                            self.host_states[host] = HostState(host, self.app_start_time)
+                            self.host_model.add_host(host)
                             added += 1
                     
                     if added > 0:
-                        self.update_host_list_display()
                         self.reorder_graphs()
-                        self.save_data()
+                        self.persistence.mark_dirty(PersistenceScheduler.INVENTORY)
                         self.apply_filter()
-                        if not self.ping_timer.isActive():
-                            self.start_pinging()
-                        else:
-                            self.update_host_queue()
+                        self.start_pinging()
                         
                         QMessageBox.information(
                             self, self._("Import completed"), 
@@ -983,128 +1446,186 @@ class PingMonitor(QMainWindow):
                     self, self._("Import error"), 
                     self._("Failed to read file: {}").format(str(e)))
 
+    def show_saturation(self, saturated):
+        """Показ или скрытие предупреждения о насыщении движка проверок"""
+        stats = self.ping_manager.stats()
+        self.saturation_label.setToolTip(
+            self._("Queued ICMP checks: {}, threads: {} of {}; TCP checks in flight: {} of {}").format(
+                stats['probe_queue_depth'], stats['probe_threads_max'], stats['probe_threads_limit'],
+                stats['tcp_probes_in_flight'], stats['tcp_concurrency_max']))
+        self.saturation_label.setVisible(saturated)
+
     def update_app_icon(self):
-        """Обновление иконки приложения в зависимости от статуса хостов"""
-        has_red = any(
-            len(w.ping_history) >= 2 and 
-            not w.ping_history[-1][1] and 
-            not w.ping_history[-2][1]
-            for w in self.host_widgets.values())
-        has_yellow = any(
-            len(w.ping_history) >= 1 and 
-            not w.ping_history[-1][1] and 
-            (len(w.ping_history) == 1 or w.ping_history[-2][1])
-            for w in self.host_widgets.values())
-        
-        if has_red:
-            self.setWindowIcon(self.red_icon)
-            self.tray_icon.setIcon(self.red_icon)
-        elif has_yellow:
-            self.setWindowIcon(self.yellow_icon)
-            self.tray_icon.setIcon(self.yellow_icon)
-        else:
-            self.setWindowIcon(self.green_icon)
-            self.tray_icon.setIcon(self.green_icon)
+        """Смена иконки приложения при изменении сводного состояния хостов"""
+        state = self.health.state()
+        if state == self.health_state:
+            return
+        self.health_state = state
+        icon = {HealthAggregator.RED: self.red_icon,
+                HealthAggregator.YELLOW: self.yellow_icon,
+                HealthAggregator.GREEN: self.green_icon}[state]
+        self.setWindowIcon(icon)
+        self.tray_icon.setIcon(icon)
 
     def update_host_queue(self):
-        """Обновление очереди проверяемых хостов"""
-        self.host_queue = []
-        def traverse_items(parent_item):
-            for i in range(parent_item.childCount()):
-                child = parent_item.child(i)
-                host = child.data(0, Qt.ItemDataRole.UserRole)
-                if host:
-                    self.host_queue.append(host)
-        
-        for i in range(self.host_list.topLevelItemCount()):
-            category_item = self.host_list.topLevelItem(i)
-            traverse_items(category_item)
-        self.current_host_index = 0
+        """Обновление очереди проверяемых хостов и их расписания"""
+        self.host_queue = list(self.host_model.hosts())
+        self.scheduler.sync({host: self.host_interval(host) / 1000 for host in self.host_queue})
+        self.schedule_next_check()
+
+    def host_interval(self, host):
+        """Интервал проверки хоста в мс: собственный, категории или общий"""
+        interval = self.host_intervals.get(host)
+        if not interval and host in self.host_states:
+            interval = self.category_intervals.get(self.host_states[host].category)
+        return interval or self.interval_slider.value()
 
     def start_pinging(self):
         """Запуск периодической проверки хостов"""
-        if self.host_widgets:
+        if self.host_states:
             self.update_host_queue()
-            if not self.ping_timer.isActive():
-                self.ping_timer.start(self.interval_slider.value())
 
-    def ping_next_host(self):
-        """Проверка следующего хоста в очереди"""
-        if not self.host_queue:
+    def schedule_next_check(self):
+        """Взвод таймера на ближайший срок проверки"""
+        if self.viewer:
             return
-            
-        current_time = datetime.now()
-        
-        if self.current_pinging_host:
-            for i in range(self.host_list.topLevelItemCount()):
-                category_item = self.host_list.topLevelItem(i)
-                for j in range(category_item.childCount()):
-                    host_item = category_item.child(j)
-                    if host_item.data(0, Qt.ItemDataRole.UserRole) == self.current_pinging_host:
-                        host_item.setBackground(0, QColor("white"))
-                        break
-        
-        host = self.host_queue[self.current_host_index]
+        delay = self.scheduler.next_due()
+        if delay is None:
+            self.ping_timer.stop()
+        else:
+            self.ping_timer.start(int(delay * 1000))
+
+    def ping_next_host(self):
+        """Проверка всех хостов, срок проверки которых наступил"""
+        due_hosts = self.scheduler.pop_due()
+        if due_hosts:
+            sweep_hosts = []
+            for host in due_hosts:
+                check_info = self.host_check_types.get(host, {'type': 'icmp', 'port': None})
+                if self.sweep_mode and check_info['type'] == 'icmp':
+                    sweep_hosts.append(host)
+                else:
+                    self.ping_manager.ping_host(
+                        host,
+                        check_type=check_info['type'],
+                        port=check_info['port'])
+            if sweep_hosts:
+                self.ping_manager.sweep_hosts(sweep_hosts)
+            self.highlight_pinging_host(due_hosts[-1])
+        self.schedule_next_check()
+
+    def highlight_pinging_host(self, host):
+        """Подсветка последнего отправленного на проверку хоста в списке"""
         self.current_pinging_host = host
-        
-        for i in range(self.host_list.topLevelItemCount()):
-            category_item = self.host_list.topLevelItem(i)
-            for j in range(category_item.childCount()):
-                host_item = category_item.child(j)
-                if host_item.data(0, Qt.ItemDataRole.UserRole) == host:
-                    host_item.setBackground(0, QColor("#ADD8E6"))
-                    break
-        
-        check_info = self.host_check_types.get(host, {'type': 'icmp', 'port': None})
-        
-        self.ping_manager.ping_host(
-            host,
-            check_type=check_info['type'],
-            port=check_info['port'])
-        
-        self.current_host_index = (self.current_host_index + 1) % len(self.host_queue)
+        self.host_model.set_highlighted(host)
 
-    def handle_ping_result(self, host, success):
-        """Обработка результата ping проверки"""
-        current_time = datetime.now()
-        if host in self.host_widgets:
-            consecutive_failures = self.host_widgets[host].update_status(success, current_time)
-            if consecutive_failures == 2 and self.notifications_enabled:
-                self.tray_icon.showMessage(
-                    self._("Host unavailable"),
-                    self._("Host {} is not responding to check").format(host),
-                    QSystemTrayIcon.MessageIcon.Warning,
-                    5000)
-        
+    @perf.timed("result_handler")
+    def handle_ping_result(self, host, success, rtt_ms=NO_RTT, started=None):
+        """Обработка результата ping проверки; started - время начала проверки (epoch)"""
+        perf.delivered(host)
+        current_time = datetime.fromtimestamp(started) if started else datetime.now()
+        if host in self.host_states:
+            self.record_result(host, current_time, success, rtt_ms)
+            self.history_store.append(host, current_time, success, self.host_states[host].ping_history.latency(-1))
+        self.persistence.mark_dirty(PersistenceScheduler.HISTORY)
         self.update_app_icon()
-        self.save_data()
-        self.apply_filter()
+
+    def record_result(self, host, current_time, success, rtt_ms=NO_RTT):
+        """Учет результата проверки в состоянии хоста и интерфейсе"""
+        state = self.host_states[host]
+        started = perf.start()
+        previous_failures = state.consecutive_failures
+        consecutive_failures = state.update_status(success, current_time, rtt_ms)
+        perf.since("update_status", started)
+        self.show_result(host, success, previous_failures, consecutive_failures, rtt_ms)
+
+    def record_run(self, host, start, end, success, count):
+        """Учет серии проверок из журнала фонового монитора"""
+        state = self.host_states[host]
+        previous_failures = state.consecutive_failures
+        consecutive_failures = state.update_run(start, end, success, count)
+        self.show_result(host, success, previous_failures, consecutive_failures)
+
+    def show_result(self, host, success, previous_failures, consecutive_failures, rtt_ms=NO_RTT):
+        """Отражение результата проверки в интерфейсе, метриках и уведомлениях"""
+        state = self.host_states[host]
+        self.graph_panel.refresh_host(host)
+        if self.metrics:
+            self.metrics.record(host, state.category, success, rtt_ms)
+        if previous_failures < 2 <= consecutive_failures and self.notifications_enabled:
+            self.tray_icon.showMessage(
+                self._("Host unavailable"),
+                self._("Host {} is not responding to check").format(host),
+                QSystemTrayIcon.MessageIcon.Warning,
+                5000)
+        if success:
+            self.failed_hosts.discard(host)
+        else:
+            self.failed_hosts.add(host)
+        self.health.update(host, state.ping_history.failure_streak())
+        self.update_host_visibility(host)
+
+    def attach_viewer(self):
+        """Переход в режим просмотра: хранилище занято фоновым монитором
+
+        Приложение не проверяет хосты само, а раз в секунду дочитывает
+        результаты, которые монитор дописывает в журнал. Когда монитор
+        завершается, приложение забирает хранилище и продолжает проверки.
+        """
+        self.viewer = self.history_store.follow()
+        self.viewer_timer.start(1000)
+        self.ping_timer.stop()
+        self.setWindowTitle(self.window_title())
+
+    def poll_viewer(self):
+        """Применение результатов из журнала фонового монитора"""
+        for host, *record in self.viewer.poll():
+            state = self.host_states.get(host)
+            if state is None:
+                continue
+            history = state.ping_history
+            # Записи не новее уже загруженной из хранилища истории пропускаются
+            if len(record) == 4:
+                if history.last_timestamp() is None or record[1] > history.last_timestamp():
+                    self.record_run(host, *record)
+            elif len(record) == 2:
+                if not len(history) or record[0] > history.timestamp(-1):
+                    state.add_latency(*record)
+                    self.graph_panel.refresh_host(host)
+            elif history.last_timestamp() is None or record[0] > history.last_timestamp():
+                timestamp, success, latency = record
+                self.record_result(host, datetime.fromtimestamp(timestamp), success,
+                                   NO_RTT if latency is None else latency)
+        self.update_app_icon()
+        try:
+            self.history_store.open()
+        except BlockingIOError:
+            return
+        self.viewer_timer.stop()
+        self.viewer.close()
+        self.viewer = None
+        self.setWindowTitle(self.window_title())
+        self.start_pinging()
 
     def add_host(self):
         """Добавление нового хоста для мониторинга"""
         host = self.host_input.text().strip()
-        if host and host not in self.host_widgets:
-            widget = HostWidget(host, self.time_scale, self.app_start_time)
-            self.host_widgets[host] = widget
-            self.update_host_list_display()
+        if host and host not in self.host_states:
+            self.host_states[host] = HostState(host, self.app_start_time)
+            self.host_model.add_host(host)
             self.reorder_graphs()
             self.host_input.clear()
-            self.save_data()
+            self.persistence.mark_dirty(PersistenceScheduler.INVENTORY)
             self.apply_filter()
             
-            if not self.ping_timer.isActive():
-                self.start_pinging()
-            else:
-                self.update_host_queue()
+            self.start_pinging()
 
     def update_interval(self, interval):
         """Обновление интервала проверки"""
         self.interval_label.setText(self._("Interval: {}ms").format(interval))
         self.ping_manager.set_ping_interval(interval)
-        self.settings.setValue("interval", interval)
-        
-        if self.ping_timer.isActive():
-            self.ping_timer.start(interval)
+        self.persistence.mark_dirty(PersistenceScheduler.SETTINGS)
+        self.update_host_queue()
 
     def edit_host(self, host):
         """Редактирование имени хоста"""
@@ -1112,51 +1633,44 @@ class PingMonitor(QMainWindow):
             self, self._("Edit"), self._("New host name:"), text=host)
         
         if ok and new_host and new_host != host:
-            widget = self.host_widgets[host]
-            widget.host_label.setText(new_host)
-            widget.host = new_host
-            widget.graph_widget.host = new_host
-            self.host_widgets[new_host] = self.host_widgets.pop(host)
+            state = self.host_states.pop(host)
+            state.host = new_host
+            self.host_states[new_host] = state
+            self.host_model.rename_host(host, new_host)
+            for hosts in (self.hidden_hosts, self.failed_hosts):
+                if host in hosts:
+                    hosts.remove(host)
+                    hosts.add(new_host)
+            self.health.rename(host, new_host)
             if host in self.host_check_types:
                 self.host_check_types[new_host] = self.host_check_types.pop(host)
-            self.update_host_list_display()
+            if host in self.host_intervals:
+                self.host_intervals[new_host] = self.host_intervals.pop(host)
+            self.history_store.rename_host(host, new_host)
+            self.ping_manager.forget(host)
+            if self.metrics:
+                self.metrics.remove(host)
             self.reorder_graphs()
-            self.save_data()
+            self.persistence.mark_dirty(PersistenceScheduler.INVENTORY)
             self.apply_filter()
             self.update_host_queue()
 
     def save_data(self):
-        """Сохранение данных приложения"""
-        hosts = []
-        def traverse_items(parent_item):
-            for i in range(parent_item.childCount()):
-                child = parent_item.child(i)
-                host = child.data(0, Qt.ItemDataRole.UserRole)
-                if host and host in self.host_widgets:
-                    hosts.append([host, self.host_widgets[host].category])
-        
-        for i in range(self.host_list.topLevelItemCount()):
-            category_item = self.host_list.topLevelItem(i)
-            traverse_items(category_item)
-        
+        """Сохранение списка хостов и типов проверки"""
+        hosts = [[host, self.host_states[host].category] for host in self.host_model.hosts()]
         self.settings.setValue("hosts", hosts)
+        self.settings.setValue("check_types", json.dumps(self.host_check_types))
+        self.settings.setValue("host_intervals", json.dumps(self.host_intervals))
+        self.settings.setValue("category_intervals", json.dumps(self.category_intervals))
+
+    def save_settings(self):
+        """Сохранение пользовательских настроек"""
         self.settings.setValue("filter_failed", self.filter_failed)
-        
-        history = {}
-        for host, widget in self.host_widgets.items():
-            history[host] = {
-                'records': [(t.isoformat(), s) for t, s in widget.ping_history],
-                'check_type': self.host_check_types.get(host, {'type': 'icmp', 'port': None})}
-        
-        history_file = os.path.expanduser("~/.ping_monitor_history.json")
-        try:
-            os.makedirs(os.path.dirname(history_file), exist_ok=True)
-            with open(history_file, 'w') as f:
-                json.dump(history, f, indent=2)
-        except PermissionError as e:
-            print(f"Permission error saving history to {history_file}: {e}")
-        except Exception as e:
-            print(f"Error saving history to {history_file}: {e}")
+        self.settings.setValue("notifications_enabled", self.notifications_enabled)
+        self.settings.setValue("host_interval_ms", self.interval_slider.value())
+        self.settings.setValue("language", self.language)
+        self.settings.setValue("sweep_mode", self.sweep_mode)
+        self.settings.setValue("perf_enabled", perf.enabled)
 
     def load_data(self):
         """Загрузка сохраненных данных приложения"""
@@ -1168,42 +1682,87 @@ class PingMonitor(QMainWindow):
                 host = host_data if isinstance(host_data, str) else str(host_data)
                 category = "Default"
             if isinstance(host, str) and host:
-                widget = HostWidget(host, self.time_scale, self.app_start_time, category)
-                self.host_widgets[host] = widget
+                self.host_states[host] = HostState(host, self.app_start_time, category)
         
-        self.update_host_list_display()
+        self.host_model.reset(list(self.host_states))
         self.reorder_graphs()
         
-        history_file = os.path.expanduser("~/.ping_monitor_history.json")
+        check_types = self.settings.value("check_types", None)
+        if check_types is None:
+            legacy = read_legacy_history()
+            self.host_check_types = {
+                host: data.get('check_type', {'type': 'icmp', 'port': None})
+                for host, data in legacy.items() if isinstance(data, dict)}
+        else:
+            try:
+                self.host_check_types = json.loads(check_types)
+            except (TypeError, json.JSONDecodeError) as e:
+                print(f"Invalid check types in settings: {e}")
+        
+        for name in ("host_intervals", "category_intervals"):
+            try:
+                setattr(self, name, json.loads(self.settings.value(name, "{}")))
+            except (TypeError, json.JSONDecodeError) as e:
+                print(f"Invalid {name} in settings: {e}")
+        
         try:
-            with open(history_file, 'r') as f:
-                history = json.load(f)
-                
-                for host, data in history.items():
-                    if host in self.host_widgets:
-                        widget = self.host_widgets[host]
-                        try:
-                            widget.ping_history = [
-                                (datetime.fromisoformat(t), s) for t, s in data['records']]
-                            widget.graph_widget.update_history(
-                                widget.ping_history, widget.session_success_count,
-                                widget.session_failure_count, self.app_start_time
-                            )
-                            self.host_check_types[host] = data.get('check_type', {'type': 'icmp', 'port': None})
-                            print(f"Loaded {len(widget.ping_history)} records for {host}")
-                        except Exception as e:
-                            print(f"Error loading history for {host}: {e}")
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print(f"No history file found or invalid JSON at {history_file}: {e}")
-        except Exception as e:
-            print(f"Unexpected error loading history from {history_file}: {e}")
+            self.history_store.open()
+        except BlockingIOError as e:
+            print(f"{e}, attaching as viewer")
+            self.attach_viewer()
+        self.load_history(self.time_scale.start_time.timestamp())
         
         self.apply_filter()
+        self.update_app_icon()
 
-    def update_all_graphs(self):
-        """Обновление всех графиков"""
-        for widget in self.host_widgets.values():
-            widget.graph_widget.update()
+    def load_history(self, since=None):
+        """Фоновая загрузка истории новее since (None - всей истории)"""
+        self.history_since = since
+        if self.history_loading:
+            # Вся история будет загружена после текущей загрузки
+            self.full_history_requested = True
+            return
+        self.history_loading = True
+        loader = HistoryLoader(self.history_store, self.host_states, since)
+        loader.signals.loaded.connect(self.apply_loaded_history)
+        QThreadPool.globalInstance().start(loader)
+
+    def apply_loaded_history(self, histories, since):
+        """Подмена истории хостов загруженной в фоне
+
+        Результаты, полученные за время загрузки, дописываются к
+        загруженной истории, если они новее ее последней записи.
+        """
+        self.history_loading = False
+        for host, history in histories.items():
+            state = self.host_states.get(host)
+            if state is None:
+                continue
+            history.merge_newer(state.ping_history)
+            state.ping_history = history
+            if history.last_failed():
+                self.failed_hosts.add(host)
+            else:
+                self.failed_hosts.discard(host)
+            self.health.update(host, history.failure_streak())
+            self.update_host_visibility(host)
+            self.graph_panel.refresh_host(host)
+        print(f"Loaded history of {len(histories)} hosts")
+        self.update_app_icon()
+        if self.full_history_requested:
+            self.full_history_requested = False
+            self.load_history()
+
+    def ensure_history_loaded(self):
+        """Загрузка всей истории, когда шкала показывает время раньше загруженного окна"""
+        if self.history_since is None:
+            return
+        if self.time_scale.zoom_periods:
+            visible_start = self.time_scale.zoom_periods[-1][0]
+        else:
+            visible_start = self.time_scale.start_time
+        if visible_start.timestamp() < self.history_since:
+            self.load_history()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,179 @@
+# metrics.py
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Метрики хостов: (имя семейства, тип, описание)
+HOST_FAMILIES = (
+    ("qping_up", "gauge", "Whether the last check of the host succeeded"),
+    ("qping_rtt_seconds", "gauge", "Response time of the last check, NaN if it failed"),
+    ("qping_consecutive_failures", "gauge", "Number of failed checks in a row"),
+    ("qping_checks", "counter", "Checks completed since start by result"),
+)
+
+def escape_label(value):
+    """Экранирование значения метки"""
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def family_header(name, kind, help_text, openmetrics):
+    """Строки HELP и TYPE семейства метрик"""
+    if kind == "counter" and not openmetrics:
+        # В текстовом формате Prometheus счетчик объявляется полным именем
+        name += "_total"
+    return f"# HELP {name} {help_text}\n# TYPE {name} {kind}\n"
+
+class MetricsExporter:
+    """HTTP-эндпоинт /metrics в формате Prometheus/OpenMetrics
+
+    Строки метрик каждого хоста формируются при получении результата в
+    потоке, который его обрабатывает, и хранятся по семействам; ответ
+    собирается из них при первом запросе после изменений и отдается из
+    кэша, пока не придет новый результат. Запросы обслуживаются фоновым
+    потоком сервера и не обращаются к состоянию интерфейса.
+    """
+
+    def __init__(self, ping_manager=None):
+        """Инициализация экспортера"""
+        self.ping_manager = ping_manager
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._lines = {name: {} for name, _, _ in HOST_FAMILIES}
+        self._cache = {}
+        self._generation = 0
+        self._server = None
+        self._thread = None
+
+    def start(self, port, address="127.0.0.1"):
+        """Запуск HTTP-сервера в фоновом потоке"""
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+                body = exporter.render(openmetrics)
+                self.send_response(200)
+                self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((address, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка HTTP-сервера"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self._thread = None
+
+    def record(self, host, category, success, rtt_ms=None):
+        """Учет результата проверки хоста; rtt_ms в миллисекундах или None"""
+        with self._lock:
+            counters = self._hosts.get(host)
+            if counters is None:
+                counters = self._hosts[host] = [0, 0, 0]
+            if success:
+                counters[0] += 1
+                counters[2] = 0
+            else:
+                counters[1] += 1
+                counters[2] += 1
+            labels = f'host="{escape_label(host)}",category="{escape_label(category)}"'
+            rtt = "NaN" if not success or rtt_ms is None or not rtt_ms >= 0 else repr(rtt_ms / 1000)
+            self._lines["qping_up"][host] = f"qping_up{{{labels}}} {int(bool(success))}\n"
+            self._lines["qping_rtt_seconds"][host] = f"qping_rtt_seconds{{{labels}}} {rtt}\n"
+            self._lines["qping_consecutive_failures"][host] = f"qping_consecutive_failures{{{labels}}} {counters[2]}\n"
+            self._lines["qping_checks"][host] = (
+                f"qping_checks_total{{{labels},result=\"success\"}} {counters[0]}\n"
+                f"qping_checks_total{{{labels},result=\"failure\"}} {counters[1]}\n")
+            self._generation += 1
+            self._cache.clear()
+
+    def remove(self, host):
+        """Исключение хоста из метрик"""
+        with self._lock:
+            if self._hosts.pop(host, None) is not None:
+                for lines in self._lines.values():
+                    lines.pop(host, None)
+                self._generation += 1
+                self._cache.clear()
+
+    def sync(self, hosts):
+        """Исключение хостов, которых нет в hosts"""
+        for host in [h for h in self._hosts if h not in hosts]:
+            self.remove(host)
+
+    def render(self, openmetrics=False):
+        """Тело ответа в кодировке UTF-8"""
+        with self._lock:
+            hosts_body = self._cache.get(openmetrics)
+            if hosts_body is None:
+                # Под блокировкой только копируются строки, чтобы не задерживать record()
+                generation = self._generation
+                families = [(name, kind, help_text, list(self._lines[name].values()))
+                            for name, kind, help_text in HOST_FAMILIES]
+        if hosts_body is None:
+            parts = []
+            for name, kind, help_text, lines in families:
+                parts.append(family_header(name, kind, help_text, openmetrics))
+                parts.extend(lines)
+            hosts_body = "".join(parts).encode("utf-8")
+            with self._lock:
+                if generation == self._generation:
+                    self._cache[openmetrics] = hosts_body
+        return hosts_body + self.render_engine(openmetrics).encode("utf-8")
+
+    def render_engine(self, openmetrics):
+        """Показатели движков проверки; собираются при каждом запросе"""
+        if self.ping_manager is None:
+            return "# EOF\n" if openmetrics else ""
+        stats = self.ping_manager.stats()
+        parts = [family_header("qping_probes_submitted", "counter", "Probes sent to the check engines by type", openmetrics)]
+        for check_type, count in stats["submitted"].items():
+            parts.append(f"qping_probes_submitted_total{{type=\"{check_type}\"}} {count}\n")
+        for name, key, help_text in (
+                ("qping_probes_merged", "merged", "Check requests merged into a probe already in flight for the host"),
+                ("qping_results_stale", "stale", "Results dropped because a newer probe of the host already reported")):
+            parts.append(family_header(name, "counter", help_text, openmetrics))
+            parts.append(f"{name}_total {stats[key]}\n")
+        for name, help_text in (("probe_threads_active", "Busy ICMP worker threads"),
+                                ("probe_threads_max", "Current ICMP worker thread limit, tuned to the load"),
+                                ("probe_threads_limit", "Upper bound of the ICMP worker thread limit"),
+                                ("probe_queue_depth", "ICMP probes waiting for a worker thread"),
+                                ("probe_saturated", "Whether probes are delayed because the engines are at their limits"),
+                                ("tcp_probes_in_flight", "TCP probes waiting for a connection slot or a reply"),
+                                ("tcp_concurrency_max", "Concurrent TCP connection limit")):
+            parts.append(family_header(f"qping_{name}", "gauge", help_text, openmetrics))
+            parts.append(f"qping_{name} {stats[name]}\n")
+        if openmetrics:
+            parts.append("# EOF\n")
+        return "".join(parts)
+
+def start_exporter(settings, ping_manager):
+    """Запуск экспортера, если в настройках задан порт metrics_port
+
+    Возвращает экспортер или None, если он выключен или порт занят.
+    """
+    port = settings.value("metrics_port", 0, type=int)
+    if not port:
+        return None
+    address = settings.value("metrics_address", "127.0.0.1")
+    exporter = MetricsExporter(ping_manager)
+    try:
+        exporter.start(port, address)
+    except OSError as e:
+        print(f"Cannot start metrics exporter on {address}:{port}: {e}")
+        return None
+    return exporter
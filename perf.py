@@ -0,0 +1,120 @@
+# perf.py
+import json
+import time
+import threading
+import functools
+from history import LatencyHistogram
+
+# Этапы обработки проверки: (ключ, описание)
+STAGES = (
+    ("queue_wait", "Wait in probe thread pool queue"),
+    ("probe", "Probe run in worker thread"),
+    ("signal_delivery", "Result delivery to GUI thread"),
+    ("result_handler", "Result handler"),
+    ("update_status", "Host state update"),
+    ("apply_filter", "Host filter"),
+    ("persistence", "Saving data"),
+    ("paint", "Graph paint"),
+)
+
+# Замеры выключены по умолчанию: точки замера проверяют флаг и не вызывают часы
+enabled = False
+
+class StageStats:
+    """Число, сумма, максимум и гистограмма длительностей одного этапа в мс"""
+
+    def __init__(self):
+        """Инициализация счетчиков"""
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = LatencyHistogram(min_ms=0.001, ratio=1.1)
+
+    def add(self, elapsed_ms):
+        """Учет одного замера"""
+        self.count += 1
+        self.total += elapsed_ms
+        if elapsed_ms > self.max:
+            self.max = elapsed_ms
+        self.histogram.add(elapsed_ms)
+
+    def summary(self):
+        """Сводка: count, mean, p50, p95, p99, max (мс)"""
+        if not self.count:
+            return dict(count=0, mean=None, p50=None, p95=None, p99=None, max=None)
+        # Середина корзины гистограммы может оказаться больше максимума
+        p50, p95, p99 = (min(self.max, self.histogram.percentile(q)) for q in (50, 95, 99))
+        return dict(count=self.count, mean=self.total / self.count, p50=p50, p95=p95, p99=p99, max=self.max)
+
+_lock = threading.Lock()
+_stats = {stage: StageStats() for stage, _ in STAGES}
+# Время отправки сигнала с результатом по хосту, до его обработки в потоке интерфейса
+_marks = {}
+
+def set_enabled(value):
+    """Включение или выключение замеров"""
+    global enabled
+    enabled = bool(value)
+    if not enabled:
+        with _lock:
+            _marks.clear()
+
+def start():
+    """Начало замера: отметка времени или None, если замеры выключены"""
+    return time.perf_counter() if enabled else None
+
+def record(stage, elapsed_ms):
+    """Учет длительности этапа; можно вызывать из любого потока"""
+    with _lock:
+        _stats[stage].add(elapsed_ms)
+
+def since(stage, started):
+    """Учет времени с отметки start(); без отметки ничего не делает"""
+    if started is not None:
+        record(stage, (time.perf_counter() - started) * 1000)
+
+def timed(stage):
+    """Декоратор, замеряющий время вызова функции"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stage, (time.perf_counter() - started) * 1000)
+        return wrapper
+    return decorator
+
+def mark(host):
+    """Отметка отправки результата хоста в поток интерфейса"""
+    if enabled:
+        with _lock:
+            _marks[host] = time.perf_counter()
+
+def delivered(host):
+    """Учет задержки доставки результата хоста с момента mark()"""
+    if enabled:
+        with _lock:
+            started = _marks.pop(host, None)
+        since("signal_delivery", started)
+
+def snapshot():
+    """Сводки всех этапов {этап: summary()}"""
+    with _lock:
+        return {stage: _stats[stage].summary() for stage, _ in STAGES}
+
+def reset():
+    """Сброс накопленных замеров"""
+    with _lock:
+        for stage in _stats:
+            _stats[stage] = StageStats()
+        _marks.clear()
+
+def dump(path):
+    """Запись сводок в файл JSON"""
+    data = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "enabled": enabled, "stages": snapshot()}
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
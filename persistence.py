@@ -0,0 +1,55 @@
+# persistence.py
+from PyQt6.QtCore import QObject, QTimer
+import perf
+
+class PersistenceScheduler(QObject):
+    """Отложенное сохранение данных с отслеживанием изменений
+
+    Изменения только помечаются как грязные (инвентарь хостов, история,
+    настройки), а запись выполняется пачкой: периодически, после паузы
+    в изменениях и принудительно при выходе. Обработчики результатов
+    проверок никогда не пишут на диск сами.
+    """
+
+    INVENTORY = 1
+    HISTORY = 2
+    SETTINGS = 4
+
+    def __init__(self, save_inventory, save_settings, history_store,
+                 flush_interval_ms=5000, idle_ms=1000, parent=None):
+        """Инициализация планировщика сохранения"""
+        super().__init__(parent)
+        self.save_inventory = save_inventory
+        self.save_settings = save_settings
+        self.history_store = history_store
+        self.dirty = 0
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.timeout.connect(self.flush)
+        self.flush_timer.start(flush_interval_ms)
+
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(idle_ms)
+        self.idle_timer.timeout.connect(self.flush)
+
+    def set_flush_interval(self, flush_interval_ms):
+        """Изменение периода сохранения"""
+        self.flush_timer.start(flush_interval_ms)
+
+    def mark_dirty(self, kind):
+        """Пометка данных как измененных"""
+        self.dirty |= kind
+        self.idle_timer.start()
+
+    @perf.timed("persistence")
+    def flush(self):
+        """Сохранение всех измененных данных"""
+        dirty, self.dirty = self.dirty, 0
+        self.idle_timer.stop()
+        if dirty & self.INVENTORY:
+            self.save_inventory()
+        if dirty & self.SETTINGS:
+            self.save_settings()
+        if dirty & self.HISTORY:
+            self.history_store.flush()
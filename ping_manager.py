@@ -1,55 +1,396 @@
 # ping_manager.py
-import socket
-from PyQt6.QtCore import QObject, pyqtSignal, QRunnable, pyqtSlot, QThreadPool
+import re
+import math
+import time
+import functools
+import itertools
+from collections import deque
+from PyQt6.QtCore import QObject, pyqtSignal, QRunnable, pyqtSlot, QThreadPool, QTimer
 import subprocess
+import icmp
+import perf
+from tcp_engine import TcpProbeEngine
+
+# Время ответа в мс для неудачной проверки
+NO_RTT = -1.0
+# Время ответа успешной проверки, для которой задержка неизвестна
+NO_LATENCY = math.nan
+# Границы числа потоков ICMP-проверок по умолчанию и начальное значение
+MIN_PROBE_THREADS = 2
+MAX_PROBE_THREADS = 64
+INITIAL_PROBE_THREADS = 10
+# Через сколько секунд проверка без результата считается потерянной и хост можно проверить снова
+IN_FLIGHT_EXPIRY = 60
 
 class PingSignals(QObject):
-    ping_result = pyqtSignal(str, bool)
+    # (хост, номер проверки, успех, время ответа в мс, время начала проверки epoch)
+    ping_result = pyqtSignal(str, 'qlonglong', bool, float, float)
+    # Хосты, которые SweepWorker не смог проверить без прав на ICMP-сокеты
+    unsupported = pyqtSignal(list)
+    # Проход SweepWorker завершен
+    finished = pyqtSignal()
 
 class PingWorker(QRunnable):
-    def __init__(self, host, interval_ms, check_type='icmp', port=None):
+    def __init__(self, host, timeout_ms, check_type='icmp', port=None, ticket=0):
         super().__init__()
         self.host = host
-        self.interval_ms = interval_ms
+        self.timeout_ms = timeout_ms
         self.check_type = check_type
         self.port = port
+        # Номер проверки от PingManager.claim()
+        self.ticket = ticket
         self.signals = PingSignals()
+        # Время постановки в очередь пула для замеров perf
+        self.queued = None
+        # Очередь длительностей выполнения для настройки числа потоков
+        self.completed = None
     
     @pyqtSlot()
     def run(self):
-        success = False
+        perf.since("queue_wait", self.queued)
+        started = perf.start()
+        begin = time.perf_counter()
+        probe_started = time.time()
+        rtt_ms = NO_RTT
         try:
             if self.check_type == 'icmp':
-                result = subprocess.run(
-                    ["ping", "-c", "1", "-W", str(self.interval_ms // 1000), self.host],
-                    timeout=self.interval_ms / 1000,
-                    capture_output=True,
-                    text=True
-                )
-                success = result.returncode == 0
-            elif self.check_type == 'tcp':
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(self.interval_ms / 1000)
-                result = sock.connect_ex((self.host, self.port))
-                success = result == 0
-                sock.close()
+                rtt_ms = self.ping_icmp()
         except Exception:
-            success = False
-        self.signals.ping_result.emit(self.host, success)
+            rtt_ms = NO_RTT
+        perf.since("probe", started)
+        if self.completed is not None:
+            self.completed.append(time.perf_counter() - begin)
+        perf.mark(self.host)
+        self.signals.ping_result.emit(self.host, self.ticket, rtt_ms != NO_RTT, rtt_ms, probe_started)
+
+    def ping_icmp(self):
+        """Эхо-запрос через ICMP-сокет, а без прав на него - через утилиту ping"""
+        try:
+            rtt = icmp.echo(self.host, self.timeout_ms / 1000)
+        except PermissionError:
+            return self.ping_subprocess()
+        return NO_RTT if rtt is None else rtt * 1000
+
+    def ping_subprocess(self):
+        """Эхо-запрос внешней утилитой ping"""
+        return ping_subprocess(self.host, self.timeout_ms)
+
+class SweepWorker(QRunnable):
+    """Проверка группы хостов по ICMP одним проходом через общий сокет"""
+
+    def __init__(self, hosts, timeout_ms, tickets=None):
+        super().__init__()
+        self.hosts = hosts
+        self.timeout_ms = timeout_ms
+        # Хост -> номер проверки от PingManager.claim()
+        self.tickets = tickets or {}
+        self.signals = PingSignals()
+        self.queued = None
+        self.completed = None
+        # Запросы прохода отправляются подряд, поэтому у них общее время начала
+        self.probe_started = None
+
+    @pyqtSlot()
+    def run(self):
+        perf.since("queue_wait", self.queued)
+        started = perf.start()
+        begin = time.perf_counter()
+        self.probe_started = time.time()
+        unsupported = icmp.sweep(self.hosts, self.timeout_ms / 1000, self.emit_result)
+        if unsupported:
+            # Утилита ping для каждого хоста запускается отдельным заданием пула, а не по очереди здесь
+            self.signals.unsupported.emit(unsupported)
+        perf.since("probe", started)
+        if self.completed is not None:
+            self.completed.append(time.perf_counter() - begin)
+        self.signals.finished.emit()
+
+    def emit_result(self, host, rtt):
+        perf.mark(host)
+        self.signals.ping_result.emit(host, self.tickets.get(host, 0), rtt is not None,
+                                      NO_RTT if rtt is None else rtt * 1000, self.probe_started)
+
+RTT_PATTERN = re.compile(r"time[=<]\s*([\d.]+)\s*ms")
+
+def ping_subprocess(host, timeout_ms):
+    """Эхо-запрос внешней утилитой ping; возвращает время ответа в мс или NO_RTT
+
+    Если ответ получен, но время в выводе ping не найдено, возвращает
+    NO_LATENCY: хост доступен, задержка неизвестна.
+    """
+    timeout = timeout_ms / 1000
+    result = subprocess.run(
+        ["ping", "-c", "1", "-W", str(max(1, math.ceil(timeout))), host],
+        timeout=timeout + 1,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        return NO_RTT
+    match = RTT_PATTERN.search(result.stdout)
+    return float(match.group(1)) if match else NO_LATENCY
+
+class ConcurrencyTuner:
+    """Подбор числа потоков проверки по темпу поступления и длительности проверок
+
+    По закону Литтла для обслуживания rate заданий в секунду длительностью
+    service_time секунд нужно rate * service_time потоков; к этому числу
+    добавляется запас HEADROOM. Если задания ждут в очереди, число потоков
+    сразу увеличивается на размер очереди, а уменьшается постепенно, не
+    больше чем на четверть за шаг. Результат ограничен [minimum, maximum];
+    saturated - потоков не хватает даже на максимуме.
+    """
+
+    HEADROOM = 1.25
+    SMOOTHING = 0.3
+
+    def __init__(self, minimum, maximum, threads):
+        """Инициализация с границами и начальным числом потоков"""
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.threads = min(self.maximum, max(self.minimum, threads))
+        self.rate = 0.0
+        self.service_time = 0.0
+        self.needed = 0
+        self.saturated = False
+
+    def _smooth(self, previous, value):
+        """Экспоненциальное сглаживание"""
+        return value if not previous else previous + self.SMOOTHING * (value - previous)
+
+    def update(self, elapsed, submitted, durations, queued):
+        """Учет шага длительностью elapsed секунд; возвращает новое число потоков
+
+        submitted - число заданий, поставленных за шаг, durations -
+        длительности завершенных заданий, queued - число ждущих в очереди.
+        """
+        if elapsed > 0:
+            self.rate = self._smooth(self.rate, submitted / elapsed)
+        if durations:
+            self.service_time = self._smooth(self.service_time, sum(durations) / len(durations))
+        self.needed = math.ceil(self.rate * self.service_time * self.HEADROOM)
+        target = self.needed
+        if queued:
+            target = max(target, self.threads + queued)
+        if target < self.threads:
+            target = max(target, self.threads - max(1, self.threads // 4))
+        self.threads = min(self.maximum, max(self.minimum, target))
+        self.saturated = self.threads == self.maximum and (queued > 0 or self.needed > self.maximum)
+        return self.threads
 
 class PingManager(QObject):
-    ping_result = pyqtSignal(str, bool)
+    """Запуск проверок хостов и доставка их результатов в поток владельца
+
+    На хост одновременно выполняется не больше одной проверки: повторный
+    запрос, пока предыдущая не вернула результат, объединяется с ней.
+    Каждая проверка получает номер, возрастающий по хосту, и результат
+    проверки с номером меньше уже доставленного отбрасывается как
+    устаревший. Порядок и срок проверок считаются по номерам и monotonic,
+    поэтому перевод системных часов на них не влияет; время начала epoch
+    нужно только для записи в историю.
+    """
+
+    # (хост, успех, время ответа в мс, время начала проверки epoch)
+    ping_result = pyqtSignal(str, bool, float, float)
+    # Результаты TCP-проверок из потока цикла asyncio: (хост, номер проверки, успех, мс, начало epoch)
+    tcp_result = pyqtSignal(str, 'qlonglong', bool, float, float)
+    # Проверки не успевают выполняться: потоки или слоты соединений на пределе
+    saturation_changed = pyqtSignal(bool)
     
-    def __init__(self, interval_ms):
+    TUNE_INTERVAL_MS = 1000
+    
+    def __init__(self, interval_ms, timeout_ms=1000, min_threads=MIN_PROBE_THREADS, max_threads=MAX_PROBE_THREADS):
         super().__init__()
         self.interval_ms = interval_ms
+        self.timeout_ms = timeout_ms
+        self.tuner = ConcurrencyTuner(min_threads, max_threads, INITIAL_PROBE_THREADS)
         self.thread_pool = QThreadPool()
-        self.thread_pool.setMaxThreadCount(10)
+        self.thread_pool.setMaxThreadCount(self.tuner.threads)
+        self.tcp_engine = TcpProbeEngine()
+        self.submitted = {'icmp': 0, 'tcp': 0}
+        # Хост -> (номер, время monotonic постановки) незавершенной проверки; хост -> номер последней доставленной
+        self.in_flight = {}
+        self.last_ticket = {}
+        self._tickets = itertools.count(1)
+        # Хосты, ждущие следующего прохода, пока выполняется текущий
+        self._sweep_backlog = {}
+        self._sweep_running = False
+        self.merged = 0
+        self.stale = 0
+        self.tcp_result.connect(self.deliver_result)
+        # Задания пула, поставленные и еще не завершенные; длительности завершенных
+        self.pending_jobs = 0
+        self.queued_jobs = 0
+        self.saturated = False
+        self._jobs_since_tune = 0
+        self._completed = deque()
+        self._last_tune = time.monotonic()
+        self.tune_timer = QTimer(self)
+        self.tune_timer.timeout.connect(self.tune)
+        self.tune_timer.start(self.TUNE_INTERVAL_MS)
 
     def ping_host(self, host, check_type='icmp', port=None):
-        worker = PingWorker(host, self.interval_ms, check_type, port)
-        worker.signals.ping_result.connect(self.ping_result)
+        ticket = self.claim(host)
+        if ticket is None:
+            return
+        self.submitted[check_type] = self.submitted.get(check_type, 0) + 1
+        if check_type == 'tcp':
+            self.tcp_engine.submit(host, port, self.timeout_ms / 1000,
+                                   functools.partial(self.on_tcp_result, ticket))
+            return
+        worker = PingWorker(host, self.timeout_ms, check_type, port, ticket)
+        worker.signals.ping_result.connect(self.deliver_result)
+        self.start_job(worker)
+
+    def claim(self, host):
+        """Отметка проверки хоста; номер проверки или None, если его проверка уже выполняется"""
+        now = time.monotonic()
+        entry = self.in_flight.get(host)
+        if entry is not None and now - entry[1] < IN_FLIGHT_EXPIRY:
+            self.merged += 1
+            return None
+        ticket = next(self._tickets)
+        self.in_flight[host] = (ticket, now)
+        return ticket
+
+    @pyqtSlot(str, 'qlonglong', bool, float, float)
+    def deliver_result(self, host, ticket, success, rtt_ms, started):
+        """Снятие отметки проверки и передача результата, если он не устарел"""
+        entry = self.in_flight.get(host)
+        if entry is not None and ticket >= entry[0]:
+            del self.in_flight[host]
+        if ticket <= self.last_ticket.get(host, 0):
+            self.stale += 1
+            return
+        self.last_ticket[host] = ticket
+        self.ping_result.emit(host, success, rtt_ms, started)
+
+    def forget(self, host):
+        """Сброс учета проверок удаленного хоста"""
+        self.in_flight.pop(host, None)
+        self.last_ticket.pop(host, None)
+        self._sweep_backlog.pop(host, None)
+
+    def sync(self, hosts):
+        """Сброс учета проверок хостов, которых нет в hosts"""
+        for host in [h for h in set(self.in_flight) | set(self.last_ticket) if h not in hosts]:
+            self.forget(host)
+
+    def start_job(self, worker):
+        """Постановка задания в пул с учетом для настройки числа потоков"""
+        worker.queued = perf.start()
+        worker.completed = self._completed
+        self.pending_jobs += 1
+        self._jobs_since_tune += 1
         self.thread_pool.start(worker)
 
+    def tune(self):
+        """Подстройка числа потоков пула по нагрузке за прошедший шаг"""
+        now = time.monotonic()
+        durations = []
+        while self._completed:
+            durations.append(self._completed.popleft())
+        self.pending_jobs = max(0, self.pending_jobs - len(durations))
+        self.queued_jobs = max(0, self.pending_jobs - self.thread_pool.activeThreadCount())
+        threads = self.tuner.update(now - self._last_tune, self._jobs_since_tune, durations, self.queued_jobs)
+        self._last_tune = now
+        self._jobs_since_tune = 0
+        if threads != self.thread_pool.maxThreadCount():
+            self.thread_pool.setMaxThreadCount(threads)
+        tcp_waiting = self.tcp_engine.in_flight() > self.tcp_engine.max_concurrency
+        saturated = self.tuner.saturated or tcp_waiting
+        if saturated != self.saturated:
+            self.saturated = saturated
+            self.saturation_changed.emit(saturated)
+
+    def on_tcp_result(self, ticket, host, port, rtt, started):
+        # Вызывается в потоке цикла asyncio; сигнал доставляется в поток GUI очередью
+        perf.mark(host)
+        self.tcp_result.emit(host, ticket, rtt is not None, NO_RTT if rtt is None else rtt * 1000, started)
+
+    def stop(self):
+        """Остановка проверок перед выходом
+
+        Еще не начатые задания пула снимаются, а выполняющиеся
+        дожидаются: иначе они отправили бы результат в уже удаленный
+        объект сигналов.
+        """
+        self.tune_timer.stop()
+        self.tcp_engine.stop()
+        self._sweep_backlog = {}
+        self.thread_pool.clear()
+        self.thread_pool.waitForDone()
+
+    def sweep_hosts(self, hosts):
+        """Проверка группы хостов по ICMP одним проходом
+
+        Одновременно выполняется один проход. Хосты, запрошенные во время
+        прохода, копятся и уходят одним следующим проходом сразу после его
+        завершения, а не мелкими проходами на каждое срабатывание
+        планировщика, каждый из которых занимал бы поток до таймаута.
+        """
+        self._sweep_backlog.update(dict.fromkeys(hosts))
+        if not self._sweep_running:
+            self._start_sweep()
+
+    @pyqtSlot(list)
+    def on_sweep_unsupported(self, hosts):
+        """Проверка хостов, которые проход не смог проверить, отдельными заданиями пула
+
+        Без прав на ICMP-сокеты каждая проверка запускает утилиту ping;
+        в пуле они идут параллельно и не задерживают следующий проход.
+        """
+        for host in hosts:
+            entry = self.in_flight.get(host)
+            if entry is None:
+                continue
+            worker = PingWorker(host, self.timeout_ms, 'icmp', None, entry[0])
+            worker.signals.ping_result.connect(self.deliver_result)
+            self.start_job(worker)
+
+    @pyqtSlot()
+    def on_sweep_finished(self):
+        """Запуск прохода по накопившимся хостам после завершения текущего"""
+        self._sweep_running = False
+        if self._sweep_backlog:
+            self._start_sweep()
+
+    def _start_sweep(self):
+        """Запуск прохода по всем накопившимся хостам"""
+        hosts, self._sweep_backlog = list(self._sweep_backlog), {}
+        tickets = {}
+        for host in hosts:
+            ticket = self.claim(host)
+            if ticket is not None:
+                tickets[host] = ticket
+        if not tickets:
+            return
+        self.submitted['icmp'] += len(tickets)
+        worker = SweepWorker(list(tickets), self.timeout_ms, tickets)
+        worker.signals.ping_result.connect(self.deliver_result)
+        worker.signals.unsupported.connect(self.on_sweep_unsupported)
+        worker.signals.finished.connect(self.on_sweep_finished)
+        self._sweep_running = True
+        self.start_job(worker)
+
+    def stats(self):
+        """Показатели движков проверки; можно читать из любого потока"""
+        return {
+            'submitted': dict(self.submitted),
+            'merged': self.merged,
+            'stale': self.stale,
+            'in_flight': len(self.in_flight),
+            'probe_threads_active': self.thread_pool.activeThreadCount(),
+            'probe_threads_max': self.thread_pool.maxThreadCount(),
+            'probe_threads_limit': self.tuner.maximum,
+            'probe_queue_depth': self.queued_jobs,
+            'probe_saturated': int(self.saturated),
+            'tcp_probes_in_flight': self.tcp_engine.in_flight(),
+            'tcp_concurrency_max': self.tcp_engine.max_concurrency,
+        }
+
     def set_ping_interval(self, interval_ms):
         self.interval_ms = interval_ms
+
+    def set_timeout(self, timeout_ms):
+        self.timeout_ms = timeout_ms
@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
 # qping.py
 import sys
-import os
-from main import PingMonitor
-from PyQt6.QtWidgets import QApplication
+import argparse
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Ping Monitor")
+    parser.add_argument("--headless", action="store_true",
+                        help="monitor hosts without the window; a running window attaches as a viewer")
+    args, qt_args = parser.parse_known_args()
+    if args.headless:
+        # Без графического интерфейса: модули виджетов не загружаются
+        from daemon import run
+        sys.exit(run(sys.argv[:1] + qt_args))
+    from main import PingMonitor
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication(sys.argv[:1] + qt_args)
     window = PingMonitor()
     window.show()
     sys.exit(app.exec())
@@ -0,0 +1,121 @@
+# scheduler.py
+import time
+import heapq
+import itertools
+
+# Общий интервал проверки хоста по умолчанию и его пределы, мс
+DEFAULT_HOST_INTERVAL_MS = 10000
+MIN_HOST_INTERVAL_MS = 500
+MAX_HOST_INTERVAL_MS = 600000
+
+def read_host_interval(settings):
+    """Общий интервал проверки хоста в мс из ключа host_interval_ms
+
+    Старый ключ interval задавал шаг кругового обхода всех хостов, то есть
+    каждый хост проверялся раз в interval * число хостов. Если нового ключа
+    еще нет, интервал хоста вычисляется из старого так же, сохраняется под
+    новым ключом, а старый удаляется.
+    """
+    if not settings.contains("host_interval_ms") and settings.contains("interval"):
+        step = settings.value("interval", 500, type=int)
+        hosts = max(1, len(settings.value("hosts", [], type=list)))
+        interval = min(MAX_HOST_INTERVAL_MS, max(MIN_HOST_INTERVAL_MS, step * hosts))
+        print(f"Migrating check interval: {step} ms round-robin step for {hosts} hosts "
+              f"becomes {interval} ms per host")
+        settings.setValue("host_interval_ms", interval)
+        settings.remove("interval")
+    interval = settings.value("host_interval_ms", DEFAULT_HOST_INTERVAL_MS, type=int)
+    return min(MAX_HOST_INTERVAL_MS, max(MIN_HOST_INTERVAL_MS, interval))
+
+class ProbeScheduler:
+    """Планировщик проверок по сроку следующего запуска
+
+    Для каждого хоста хранится собственный интервал и срок следующей
+    проверки по монотонным часам; ближайшие сроки лежат в куче. Следующий
+    срок отсчитывается от предыдущего, а не от момента срабатывания
+    таймера, поэтому опоздания таймера не накапливаются. Новые хосты
+    равномерно разносятся по своему интервалу, чтобы не проверять их
+    одной пачкой.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        """Инициализация планировщика"""
+        self.clock = clock
+        self._heap = []
+        self._entries = {}
+        self._tokens = itertools.count()
+
+    def __len__(self):
+        """Количество запланированных хостов"""
+        return len(self._entries)
+
+    def __contains__(self, host):
+        return host in self._entries
+
+    def interval(self, host):
+        """Интервал проверки хоста в секундах"""
+        return self._entries[host][1]
+
+    def sync(self, intervals):
+        """Приведение расписания к словарю host -> интервал в секундах
+
+        Сроки уже известных хостов сохраняются, новые хосты разносятся
+        по интервалу, отсутствующие удаляются.
+        """
+        now = self.clock()
+        for host in [h for h in self._entries if h not in intervals]:
+            del self._entries[host]
+        new_hosts = [h for h in intervals if h not in self._entries]
+        for i, host in enumerate(new_hosts):
+            interval = intervals[host]
+            self._push(host, now + interval * i / len(new_hosts), interval)
+        for host, interval in intervals.items():
+            due, current, _ = self._entries[host]
+            if interval != current:
+                self._push(host, min(due, now + interval), interval)
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._rebuild()
+
+    def trigger(self, host):
+        """Проверка хоста при ближайшем срабатывании"""
+        if host in self._entries:
+            self._push(host, self.clock(), self._entries[host][1])
+
+    def pop_due(self):
+        """Список хостов, срок проверки которых наступил, с переносом сроков"""
+        now = self.clock()
+        due_hosts = []
+        while self._heap and self._heap[0][0] <= now:
+            due, token, host = heapq.heappop(self._heap)
+            entry = self._entries.get(host)
+            if entry is None or entry[2] != token:
+                continue
+            interval = entry[1]
+            next_due = due + interval
+            if next_due <= now:
+                # Отстали больше чем на интервал - пропускаем пропущенные сроки, сохраняя фазу
+                next_due = now + interval - (now - due) % interval
+            self._push(host, next_due, interval)
+            due_hosts.append(host)
+        return due_hosts
+
+    def next_due(self):
+        """Время до ближайшего срока в секундах или None, если расписание пусто"""
+        while self._heap:
+            due, token, host = self._heap[0]
+            entry = self._entries.get(host)
+            if entry is not None and entry[2] == token:
+                return max(0.0, due - self.clock())
+            heapq.heappop(self._heap)
+        return None
+
+    def _push(self, host, due, interval):
+        """Запись нового срока хоста; старые элементы кучи становятся недействительными"""
+        token = next(self._tokens)
+        self._entries[host] = [due, interval, token]
+        heapq.heappush(self._heap, (due, token, host))
+
+    def _rebuild(self):
+        """Очистка кучи от недействительных элементов"""
+        self._heap = [(due, token, host) for host, (due, _, token) in self._entries.items()]
+        heapq.heapify(self._heap)
@@ -0,0 +1,287 @@
+# sqlite_store.py
+import os
+import math
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from history import ROLLUP_TIERS, expand_records
+from history_store import HistoryStore
+
+NAN = float("nan")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    host TEXT NOT NULL,
+    ts REAL NOT NULL,
+    success INTEGER NOT NULL,
+    latency REAL
+);
+CREATE INDEX IF NOT EXISTS samples_host_ts ON samples (host, ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    host TEXT NOT NULL,
+    resolution INTEGER NOT NULL,
+    start REAL NOT NULL,
+    count INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    latency_count INTEGER NOT NULL,
+    latency_sum REAL NOT NULL,
+    latency_min REAL,
+    latency_max REAL,
+    PRIMARY KEY (host, resolution, start)
+) WITHOUT ROWID;
+"""
+
+# Свертка записей старше срока хранения в агрегаты одного уровня
+FOLD_SQL = """
+INSERT INTO rollups (host, resolution, start, count, failures, latency_count, latency_sum, latency_min, latency_max)
+SELECT host, :resolution, CAST(ts / :resolution AS INTEGER) * :resolution AS bucket,
+       COUNT(*), SUM(success = 0), COUNT(lat), COALESCE(SUM(lat), 0), MIN(lat), MAX(lat)
+FROM (SELECT host, ts, success, CASE WHEN success THEN latency END AS lat
+      FROM samples WHERE ts <= :cutoff)
+GROUP BY host, bucket
+ON CONFLICT (host, resolution, start) DO UPDATE SET
+    count = count + excluded.count,
+    failures = failures + excluded.failures,
+    latency_count = latency_count + excluded.latency_count,
+    latency_sum = latency_sum + excluded.latency_sum,
+    latency_min = MIN(COALESCE(latency_min, excluded.latency_min), COALESCE(excluded.latency_min, latency_min)),
+    latency_max = MAX(COALESCE(latency_max, excluded.latency_max), COALESCE(excluded.latency_max, latency_max))
+"""
+
+def connect(path, readonly=False):
+    """Соединение с базой истории в режиме WAL"""
+    if readonly:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+class SqliteHistoryStore(HistoryStore):
+    """Хранилище истории в базе SQLite в режиме WAL
+
+    Интерфейс тот же, что у журнала: append() копит результаты в памяти,
+    а фоновый поток записывает каждую пачку одной транзакцией. Индекс
+    (host, ts) позволяет выбирать историю хоста за интервал времени
+    (query()): так читается окно, загружаемое при запуске, а полная
+    загрузка берет записи за срок хранения и готовые агрегаты. Благодаря WAL базу можно читать другими
+    программами, пока QPing пишет в нее. Записи старше срока хранения
+    периодически сворачиваются в агрегаты по уровням ROLLUP_TIERS.
+
+    При первом открытии в базу переносится история из журнала.
+    """
+
+    DATABASE_FILE = "history.sqlite3"
+    COMPACT_INTERVAL = 600
+
+    def __init__(self, *args, **kwargs):
+        """Инициализация хранилища"""
+        super().__init__(*args, **kwargs)
+        self.db_path = os.path.join(self.directory, self.DATABASE_FILE)
+
+    def open(self):
+        """Захват хранилища, перенос истории журнала и запуск потока записи"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._acquire_lock()
+        migrate = not os.path.exists(self.db_path)
+        if migrate:
+            conn = connect(self.db_path)
+            try:
+                self._migrate(conn)
+            finally:
+                conn.close()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _migrate(self, conn):
+        """Перенос истории из журнала и снимка в новую базу"""
+        history, rollups = HistoryStore.load(self)
+        with conn:
+            for host, records in history.items():
+                conn.executemany("INSERT INTO samples (host, ts, success, latency) VALUES (?, ?, ?, ?)",
+                                 ((host, t, int(s), latency) for t, s, latency in expand_records(records)))
+            for host, tiers in rollups.items():
+                for resolution, buckets in tiers.items():
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        ((host, resolution, *self._nullable(bucket)) for bucket in buckets))
+        if history or rollups:
+            print(f"Migrated history of {len(history)} hosts to {self.db_path}")
+
+    @staticmethod
+    def _nullable(bucket):
+        """Агрегат с NaN, замененными на NULL"""
+        return tuple(None if value != value else value for value in bucket)
+
+    def append(self, host, timestamp, success, latency=None):
+        """Добавление результата проверки в буфер"""
+        if latency is not None and latency != latency:
+            latency = None
+        self._buffer(("record", host, timestamp.timestamp(), int(bool(success)), latency))
+
+    def drop_host(self, host):
+        """Удаление истории хоста"""
+        self._buffer(("drop", host))
+
+    def rename_host(self, old_host, new_host):
+        """Перенос истории хоста под новое имя"""
+        self._buffer(("rename", old_host, new_host))
+
+    def _write_loop(self):
+        """Фоновая запись пачек результатов, по транзакции на пачку"""
+        conn = connect(self.db_path)
+        self._compact(conn)
+        last_compact = time.monotonic()
+        try:
+            while True:
+                batch = self._queue.get()
+                if batch is None:
+                    return
+                try:
+                    with conn:
+                        self._write_batch(conn, batch)
+                except sqlite3.Error as e:
+                    print(f"Error writing history to {self.db_path}: {e}")
+                    continue
+                if time.monotonic() - last_compact > self.COMPACT_INTERVAL:
+                    self._compact(conn)
+                    last_compact = time.monotonic()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _write_batch(conn, batch):
+        """Запись пачки; подряд идущие результаты вставляются одним executemany"""
+        records = []
+        for item in batch:
+            if item[0] == "record":
+                records.append(item[1:])
+                continue
+            if records:
+                conn.executemany("INSERT INTO samples (host, ts, success, latency) VALUES (?, ?, ?, ?)", records)
+                records = []
+            for table in ("samples", "rollups"):
+                if item[0] == "drop":
+                    conn.execute(f"DELETE FROM {table} WHERE host = ?", (item[1],))
+                else:
+                    conn.execute(f"DELETE FROM {table} WHERE host = ?", (item[2],))
+                    conn.execute(f"UPDATE {table} SET host = ? WHERE host = ?", (item[2], item[1]))
+        if records:
+            conn.executemany("INSERT INTO samples (host, ts, success, latency) VALUES (?, ?, ?, ?)", records)
+
+    def _compact(self, conn):
+        """Свертка записей старше срока хранения в агрегаты и удаление устаревших агрегатов"""
+        now = time.time()
+        cutoff = (datetime.now() - self.retention).timestamp()
+        try:
+            with conn:
+                for resolution, retention in ROLLUP_TIERS:
+                    conn.execute(FOLD_SQL, {"resolution": resolution, "cutoff": cutoff})
+                    conn.execute("DELETE FROM rollups WHERE resolution = ? AND start < ?",
+                                 (resolution, now - retention))
+                conn.execute("DELETE FROM samples WHERE ts <= ?", (cutoff,))
+        except sqlite3.Error as e:
+            print(f"Error compacting history in {self.db_path}: {e}")
+
+    def load(self, since=None):
+        """Загрузка истории за срок хранения и агрегатов (как HistoryStore.load)"""
+        if not os.path.exists(self.db_path):
+            # База еще не создана - история будет перенесена из журнала в open()
+            return HistoryStore.load(self, since)
+        cutoff = (datetime.now() - self.retention).timestamp()
+        history = {}
+        rollups = {}
+        conn = connect(self.db_path, readonly=True)
+        try:
+            if since is not None:
+                # Окно читается по индексу (host, ts) отдельно для каждого хоста, а не проходом по таблице
+                for host in self._hosts(conn):
+                    records = self.query(host, max(cutoff, since), math.inf, conn)
+                    if records:
+                        history[host] = records
+                return history, {}
+            for host, resolution, *bucket in conn.execute(
+                    "SELECT host, resolution, start, count, failures, latency_count, latency_sum, "
+                    "latency_min, latency_max FROM rollups ORDER BY host, resolution, start"):
+                for rollup in self._rollups(rollups, host):
+                    if rollup.resolution == resolution:
+                        rollup.add_bucket(*(NAN if value is None else value for value in bucket))
+            # Записи, которые еще не свернуты в агрегаты
+            for host, t, success, latency in conn.execute(
+                    "SELECT host, ts, success, latency FROM samples WHERE ts <= ?", (cutoff,)):
+                for rollup in self._rollups(rollups, host):
+                    rollup.add(t, bool(success), latency)
+            # В порядке записи, как и журнал: последовательный проход по таблице быстрее обхода индекса
+            for host, t, success, latency in conn.execute(
+                    "SELECT host, ts, success, latency FROM samples WHERE ts > ? ORDER BY id", (cutoff,)):
+                history.setdefault(host, []).append((t, bool(success), latency))
+        finally:
+            conn.close()
+        return history, {host: {rollup.resolution: list(rollup) for rollup in series}
+                         for host, series in rollups.items()}
+
+    @staticmethod
+    def _hosts(conn):
+        """Хосты, у которых есть записи; каждый следующий находится поиском по индексу"""
+        host = conn.execute("SELECT MIN(host) FROM samples").fetchone()[0]
+        while host is not None:
+            yield host
+            host = conn.execute("SELECT MIN(host) FROM samples WHERE host > ?", (host,)).fetchone()[0]
+
+    def query(self, host, start_ts, end_ts, conn=None):
+        """Результаты хоста за (start_ts, end_ts]: [(epoch, success, latency)] по времени
+
+        Читаются по индексу (host, ts). conn - уже открытое соединение,
+        без него открывается свое.
+        """
+        own = conn is None
+        if own:
+            conn = connect(self.db_path, readonly=True)
+        try:
+            return [(t, bool(success), latency) for t, success, latency in conn.execute(
+                "SELECT ts, success, latency FROM samples WHERE host = ? AND ts > ? AND ts <= ? ORDER BY ts",
+                (host, start_ts, end_ts))]
+        finally:
+            if own:
+                conn.close()
+
+    def follow(self):
+        """Чтение результатов, которые записывает в базу другой процесс"""
+        return SqliteFollower(self.db_path)
+
+class SqliteFollower:
+    """Слежение за базой истории, в которую пишет другой процесс"""
+
+    def __init__(self, path):
+        """Открытие базы с последней записанной строки"""
+        self.path = path
+        self._conn = None
+        self._last_id = 0
+        if self._connect():
+            self._last_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM samples").fetchone()[0]
+
+    def _connect(self):
+        """Открытие базы, если она уже создана"""
+        if self._conn is None and os.path.exists(self.path):
+            self._conn = connect(self.path, readonly=True)
+        return self._conn is not None
+
+    def poll(self):
+        """Новые результаты [(host, epoch, success, latency)] с прошлого вызова"""
+        if not self._connect():
+            return []
+        rows = self._conn.execute(
+            "SELECT id, host, ts, success, latency FROM samples WHERE id > ? ORDER BY id",
+            (self._last_id,)).fetchall()
+        if rows:
+            self._last_id = rows[-1][0]
+        return [(host, t, bool(success), latency) for _, host, t, success, latency in rows]
+
+    def close(self):
+        """Закрытие соединения"""
+        if self._conn:
+            self._conn.close()
+            self._conn = None
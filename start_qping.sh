@@ -1,3 +1,4 @@
 #!/bin/bash
 # run background without terminal output
+# (use "python3 qping.py --headless" to monitor without the window)
 nohup python3 qping.py >/dev/null 2>&1 &
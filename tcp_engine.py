@@ -0,0 +1,118 @@
+# tcp_engine.py
+import time
+import socket
+import asyncio
+import ipaddress
+import threading
+
+def default_concurrency(limit=4096):
+    """Допустимое число одновременных соединений с учетом лимита дескрипторов"""
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ImportError, ValueError, OSError):
+        return 512
+    if soft == resource.RLIM_INFINITY:
+        return limit
+    return max(16, min(limit, soft // 2))
+
+class TcpProbeEngine:
+    """Неблокирующие TCP-проверки на цикле asyncio в фоновом потоке
+
+    Все соединения устанавливаются одним циклом событий, поэтому
+    недоступный порт не занимает поток на все время таймаута. Дедлайн
+    отсчитывается с момента постановки проверки и включает ожидание
+    свободного слота, разрешение имени и само соединение.
+    callback(host, port, rtt, started) вызывается в потоке цикла; rtt в
+    секундах или None при неудаче, started - время начала соединения
+    (epoch), а если до него не дошло - время постановки проверки.
+    """
+
+    def __init__(self, max_concurrency=None):
+        """Инициализация движка"""
+        self.max_concurrency = max_concurrency or default_concurrency()
+        self.loop = None
+        self.thread = None
+        self._semaphore = None
+        self._tasks = set()
+        self._ready = threading.Event()
+
+    def start(self):
+        """Запуск цикла событий в фоновом потоке"""
+        if self.thread and self.thread.is_alive():
+            return
+        self._ready.clear()
+        self.thread = threading.Thread(target=self._run, name="tcp-probe-engine", daemon=True)
+        self.thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        """Тело фонового потока"""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+            if self._tasks:
+                self.loop.run_until_complete(asyncio.gather(*self._tasks, return_exceptions=True))
+        finally:
+            self.loop.close()
+
+    def stop(self):
+        """Отмена незавершенных проверок и остановка цикла"""
+        if not self.thread:
+            return
+        def shutdown():
+            for task in self._tasks:
+                task.cancel()
+            self.loop.stop()
+        self.loop.call_soon_threadsafe(shutdown)
+        self.thread.join()
+        self.thread = None
+
+    def in_flight(self):
+        """Число незавершенных проверок"""
+        return len(self._tasks)
+
+    def submit(self, host, port, timeout, callback):
+        """Постановка проверки из любого потока"""
+        if not self.thread:
+            self.start()
+        deadline = time.monotonic() + timeout
+        self.loop.call_soon_threadsafe(self._spawn, host, port, deadline, callback, time.time())
+
+    def _spawn(self, host, port, deadline, callback, submitted):
+        """Создание задачи проверки в потоке цикла"""
+        task = self.loop.create_task(self._probe(host, port, deadline, callback, submitted))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _probe(self, host, port, deadline, callback, submitted):
+        """Одна TCP-проверка с общим дедлайном"""
+        rtt = None
+        started = [submitted]
+        try:
+            rtt = await asyncio.wait_for(self._connect(host, port, started), deadline - time.monotonic())
+        except (OSError, asyncio.TimeoutError, ValueError):
+            pass
+        callback(host, port, rtt, started[0])
+
+    async def _connect(self, host, port, started):
+        """Установка соединения; возвращает время соединения в секундах, начало - в started[0]"""
+        async with self._semaphore:
+            try:
+                family = socket.AF_INET6 if ipaddress.ip_address(host).version == 6 else socket.AF_INET
+                address = (host, port)
+            except ValueError:
+                infos = await self.loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+                family, _, _, _, address = infos[0]
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            try:
+                started[0] = time.time()
+                start = time.perf_counter()
+                await self.loop.sock_connect(sock, address)
+                return time.perf_counter() - start
+            finally:
+                sock.close()
@@ -0,0 +1,62 @@
+# test_graph_cache.py
+import os
+import sys
+import time
+import unittest
+from datetime import datetime, timedelta
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt6.QtWidgets import QApplication
+from main import TimeScaleWidget, GraphPanel
+from host_state import HostState
+
+app = QApplication.instance() or QApplication(sys.argv)
+
+def process_events(seconds=0.2):
+    """Обработка событий Qt, в том числе отложенных перерисовок"""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+
+class GraphCacheTest(unittest.TestCase):
+    """Перестроение кеша графиков при изменении масштаба шкалы"""
+
+    def setUp(self):
+        """Панель с одним хостом и историей за последние полчаса"""
+        self.time_scale = TimeScaleWidget()
+        now = datetime.now()
+        state = HostState("127.0.0.1", now - timedelta(minutes=30))
+        for i in range(600):
+            state.update_status(i % 10 != 0, now - timedelta(seconds=3 * (600 - i)), 1.0)
+        self.panel = GraphPanel(self.time_scale, {"127.0.0.1": state})
+        self.panel.resize(600, 300)
+        self.panel.set_rows([("Default", None), ("Default", "127.0.0.1")])
+        self.panel.show()
+        process_events()
+        self.graph = self.panel._bound["127.0.0.1"].graph_widget
+
+    def tearDown(self):
+        """Закрытие виджетов"""
+        self.panel.close()
+        self.time_scale.close()
+
+    def test_zoom_rebuilds_cache(self):
+        """Изменение масштаба сразу перерисовывает видимые графики с новым ключом кеша"""
+        key, cache = self.graph._cache_key, self.graph._cache
+        self.assertIsNotNone(key)
+        now = datetime.now()
+        self.time_scale.add_zoom_period(now - timedelta(minutes=10), now)
+        process_events()
+        self.assertNotEqual(self.graph._cache_key, key)
+        self.assertIsNot(self.graph._cache, cache)
+
+        key = self.graph._cache_key
+        self.time_scale.reset_zoom()
+        process_events()
+        self.assertNotEqual(self.graph._cache_key, key)
+
+if __name__ == "__main__":
+    unittest.main()